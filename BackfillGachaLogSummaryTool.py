@@ -0,0 +1,24 @@
+from app.config import Config
+from app.extensions import init_mongo, logger
+
+"""
+为汇总功能上线前已有的祈愿记录重建 GachaLogSummary 汇总文档，部署汇总功能后运行一次。
+
+用法：
+python BackfillGachaLogSummaryTool.py
+
+已有汇总文档的 UID 会被跳过，中断后可以重新运行。全服统计分布只统计有汇总文档的 UID，
+缺少汇总文档的 UID 在下次上传、检索 EndIds 或查询 Entries 时也会按需重建。
+补建后以当前时间作为所有 UID 的最后访问时间（未启用冷归档时不记录访问时间），每次启用冷归档（GACHA_LOG.ARCHIVE_ENABLED）前必须运行。
+"""
+
+
+if __name__ == "__main__":
+    init_mongo(Config.MONGO_URI)
+    from services.gacha_log_service import ensure_gacha_log_summaries
+    from services.gacha_log_retention_service import start_inactivity_clock
+
+    rebuilt = ensure_gacha_log_summaries()
+    stamped = start_inactivity_clock()
+    logger.info(f"Gacha log summary backfill finished, {rebuilt} uid(s) rebuilt, "
+                f"{stamped} uid(s) access time stamped")
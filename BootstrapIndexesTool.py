@@ -0,0 +1,54 @@
+import argparse
+from app.config import Config
+from app.extensions import init_mongo, logger
+
+"""
+检查并创建 app/schema.py 中声明的所有索引，适合在部署新版本前运行一次。
+
+用法：
+1. python BootstrapIndexesTool.py --check
+   只列出缺失或选项不一致的索引，不做修改
+2. python BootstrapIndexesTool.py
+   创建缺失的索引，并记录索引定义的摘要，服务启动时不再重复检查
+3. python BootstrapIndexesTool.py --merge-gacha-log-duplicates
+   先合并同一 UID 的重复 GachaLog 文档并删除旧的非唯一 user_uid 索引，再创建缺失的索引（包括 GachaLog 的唯一索引），
+   需要在停止上传时运行
+"""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="检查并创建所有集合的索引")
+    parser.add_argument("--check", action="store_true", help="只检查，不创建缺失的索引")
+    parser.add_argument("--merge-gacha-log-duplicates", action="store_true",
+                        help="合并重复的 GachaLog 文档，并把 user_uid 索引重建为唯一索引")
+    args = parser.parse_args()
+
+    init_mongo(Config.MONGO_URI)
+    from app.extensions import client
+    from app.schema import INDEXES, check_collection, apply_indexes
+
+    if args.merge_gacha_log_duplicates and not args.check:
+        from services.gacha_log_service import merge_duplicate_gacha_logs
+        merged = merge_duplicate_gacha_logs()
+        logger.info(f"Merged duplicate GachaLog documents of {merged} uid(s)")
+        for name, info in client.ht_server.GachaLog.index_information().items():
+            if [tuple(key) for key in info['key']] == [("user_id", 1), ("Uid", 1)] and not info.get('unique'):
+                client.ht_server.GachaLog.drop_index(name)
+                logger.info(f"Dropped non-unique GachaLog index {name}")
+
+    if args.check:
+        problems = 0
+        for name in INDEXES:
+            missing, conflicts = check_collection(name)
+            for spec in missing:
+                logger.warning(f"Missing index {name}.{spec['name']}: {spec['keys']}")
+            for conflict in conflicts:
+                logger.warning(f"Index option mismatch on {conflict}")
+            problems += len(missing) + len(conflicts)
+        logger.info(f"Index check finished, {problems} problem(s) found")
+    else:
+        try:
+            apply_indexes()
+            logger.info("All indexes are in place")
+        except RuntimeError as e:
+            logger.error(f"Index bootstrap incomplete: {e}")
@@ -0,0 +1,213 @@
+import argparse
+import datetime
+import functools
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from app.config import Config
+from app.config_loader import config_loader
+from app.extensions import init_mongo, logger
+
+"""
+把 document 模式的 GachaLog 集合迁移到 item 或 columnar 存储模式，迁移期间服务可以正常运行。
+
+用法：
+1. python MigrateGachaLogTool.py --to columnar
+   按 _id 顺序全量迁移，进度保存在 migrations 集合中，中断后重新运行会从上次的位置继续（--reset 从头开始）
+2. python MigrateGachaLogTool.py --to columnar --catch-up
+   把全量迁移开始后（或上次补迁移后）有新上传的 UID 以源数据整体重写一次，可以多次运行
+3. 把配置项 GACHA_LOG.STORAGE_MODE 改为目标模式并重启服务，然后再运行一次 --catch-up，
+   补上最后一次补迁移到切换之间上传的记录（只写入目标集合中没有的记录，不会覆盖切换后新上传的记录）
+每次补迁移都会删除目标集合中源数据已被删除的 UID（没有源文档、汇总文档和同步状态）。
+
+转换和压缩编码在 --workers 个子进程中并行完成，写入在主进程中批量执行。
+--max-items-per-second 限制写入速度，适合在业务低峰期对生产库运行。
+"""
+
+# 迁移进度的 ID 前缀
+CHECKPOINT_PREFIX = "GachaLog->"
+
+
+def create_pool(workers: int) -> ProcessPoolExecutor:
+    """转换文档的进程池，子进程不继承主进程的 MongoDB 连接"""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+
+
+def migrate_documents(db, target, documents, pool) -> int:
+    """在进程池中转换一批文档并批量写入目标集合，返回迁移的记录条数"""
+    from services.gacha_log_service import migration_operations, STORAGE_COLLECTIONS
+
+    results = list(pool.map(functools.partial(migration_operations, mode=target), documents))
+    operations = [operation for document_operations, _ in results for operation in document_operations]
+    if operations:
+        db[STORAGE_COLLECTIONS[target]].bulk_write(operations, ordered=False)
+    return sum(count for _, count in results)
+
+
+class Throughput:
+    """统计迁移速度，并按 max_items_per_second 限速"""
+
+    def __init__(self, max_items_per_second: float = 0):
+        self.max_items_per_second = max_items_per_second
+        self.started = time.monotonic()
+        self.documents = 0
+        self.items = 0
+
+    def add(self, documents: int, items: int):
+        self.documents += documents
+        self.items += items
+        if self.max_items_per_second:
+            # 按目标速度计算应花费的时间，写得太快时等待
+            delay = self.items / self.max_items_per_second - (time.monotonic() - self.started)
+            if delay > 0:
+                time.sleep(delay)
+
+    def report(self, prefix: str):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        logger.info(f"{prefix}: {self.documents} documents, {self.items} items, "
+                    f"{self.items / elapsed:.0f} items/s")
+
+
+def run_full(db, target, batch_size, workers, max_items_per_second, reset=False):
+    """按 _id 顺序全量迁移，每批写入后保存进度"""
+    checkpoint_id = CHECKPOINT_PREFIX + target
+    if reset:
+        db.migrations.delete_one({"_id": checkpoint_id})
+    checkpoint = db.migrations.find_one({"_id": checkpoint_id})
+    if checkpoint is None:
+        checkpoint = {"_id": checkpoint_id, "started_at": datetime.datetime.utcnow(), "last_id": None,
+                      "documents": 0, "items": 0, "finished_at": None}
+        db.migrations.insert_one(checkpoint)
+    elif checkpoint.get('finished_at'):
+        logger.info(f"Migration to {target} already finished at {checkpoint['finished_at']}, use --catch-up")
+        return
+
+    query = {"_id": {"$gt": checkpoint['last_id']}} if checkpoint['last_id'] is not None else {}
+    if checkpoint['last_id'] is not None:
+        logger.info(f"Resuming migration to {target} after _id {checkpoint['last_id']}")
+
+    throughput = Throughput(max_items_per_second)
+    cursor = db.GachaLog.find(query).sort("_id", 1).batch_size(batch_size)
+    with create_pool(workers) as pool:
+        batch = []
+        for document in cursor:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                _migrate_batch(db, target, batch, pool, checkpoint_id, throughput)
+                batch = []
+        if batch:
+            _migrate_batch(db, target, batch, pool, checkpoint_id, throughput)
+
+    db.migrations.update_one({"_id": checkpoint_id}, {"$set": {"finished_at": datetime.datetime.utcnow()}})
+    throughput.report(f"Migration to {target} finished")
+
+
+def _migrate_batch(db, target, batch, pool, checkpoint_id, throughput):
+    items = migrate_documents(db, target, batch, pool)
+    # 写入完成后才推进进度，中断后重新迁移这一批结果相同
+    db.migrations.update_one(
+        {"_id": checkpoint_id},
+        {"$set": {"last_id": batch[-1]['_id']}, "$inc": {"documents": len(batch), "items": items}}
+    )
+    throughput.add(len(batch), items)
+    throughput.report(f"Migrating to {target}")
+
+
+def run_catch_up(db, target, batch_size, workers, max_items_per_second):
+    """
+    补迁移上次迁移开始之后有新上传的 UID，并删除源数据已被删除的 UID。
+    服务仍使用 document 模式时源数据为准，整体重写这些 UID；已切换到目标模式后只合并目标集合中没有的记录。
+    """
+    checkpoint_id = CHECKPOINT_PREFIX + target
+    checkpoint = db.migrations.find_one({"_id": checkpoint_id})
+    if not checkpoint or not checkpoint.get('finished_at'):
+        logger.error(f"Full migration to {target} has not finished yet")
+        return
+
+    since = checkpoint.get('caught_up_at') or checkpoint['started_at']
+    started_at = datetime.datetime.utcnow()
+    switched = config_loader.GACHA_LOG_STORAGE_MODE == target
+    throughput = Throughput(max_items_per_second)
+    summaries = db.GachaLogSummary.find({"LastUploadAt": {"$gte": since}}, {"_id": 0, "user_id": 1, "Uid": 1})
+    with create_pool(workers) as pool:
+        batch = []
+        for summary in summaries:
+            batch.append(summary)
+            if len(batch) >= batch_size:
+                _catch_up_batch(db, target, batch, pool, throughput, switched)
+                batch = []
+        if batch:
+            _catch_up_batch(db, target, batch, pool, throughput, switched)
+
+    deleted = delete_removed_uids(db, target)
+    db.migrations.update_one({"_id": checkpoint_id}, {"$set": {"caught_up_at": started_at}})
+    throughput.report(f"Catch-up migration to {target} finished, changes since {since}, {deleted} deleted uid(s)")
+
+
+def _catch_up_batch(db, target, summaries, pool, throughput, switched):
+    from services.gacha_log_service import merge_migrated_gacha_log
+
+    documents = list(db.GachaLog.find({"$or": [{"user_id": s['user_id'], "Uid": s['Uid']} for s in summaries]}))
+    if switched:
+        items = sum(merge_migrated_gacha_log(document, target) for document in documents)
+    else:
+        items = migrate_documents(db, target, documents, pool)
+    throughput.add(len(documents), items)
+    throughput.report(f"Catching up migration to {target}")
+
+
+def delete_removed_uids(db, target) -> int:
+    """
+    删除目标集合中源数据已被删除的 UID：删除祈愿记录时会同时删除源文档、汇总文档和同步状态，
+    而新上传在写入记录前就会创建同步状态，三者都不存在的 UID 只能是迁移之后被删除的。
+    """
+    from services.gacha_log_service import STORAGE_COLLECTIONS
+
+    def lookup(collection, alias):
+        return {"$lookup": {
+            "from": collection,
+            "let": {"user_id": "$_id.user_id", "uid": "$_id.Uid"},
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [{"$eq": ["$user_id", "$$user_id"]}, {"$eq": ["$Uid", "$$uid"]}]}}},
+                {"$project": {"_id": 1}},
+                {"$limit": 1}
+            ],
+            "as": alias
+        }}
+
+    pipeline = [
+        {"$group": {"_id": {"user_id": "$user_id", "Uid": "$Uid"}}},
+        lookup("GachaLog", "source"),
+        lookup("GachaLogSummary", "summary"),
+        lookup("GachaLogSyncState", "state"),
+        {"$match": {"source": {"$size": 0}, "summary": {"$size": 0}, "state": {"$size": 0}}}
+    ]
+    collection = db[STORAGE_COLLECTIONS[target]]
+    deleted = 0
+    for group in collection.aggregate(pipeline, allowDiskUse=True):
+        collection.delete_many({"user_id": group['_id']['user_id'], "Uid": group['_id']['Uid']})
+        deleted += 1
+    return deleted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="迁移 GachaLog 集合到 item 或 columnar 存储模式")
+    parser.add_argument("--to", required=True, choices=["item", "columnar"], help="目标存储模式")
+    parser.add_argument("--catch-up", action="store_true", help="只迁移上次迁移之后有新上传的 UID")
+    parser.add_argument("--reset", action="store_true", help="丢弃已保存的进度，从头开始全量迁移")
+    parser.add_argument("--batch-size", type=int, default=50, help="每批处理的文档数")
+    parser.add_argument("--workers", type=int, default=4, help="转换和压缩编码文档的子进程数")
+    parser.add_argument("--max-items-per-second", type=float, default=0, help="写入速度上限，0 表示不限速")
+    args = parser.parse_args()
+
+    init_mongo(Config.MONGO_URI)
+    from app.extensions import client
+    from services.gacha_log_service import ensure_gacha_log_summaries
+
+    # 汇总文档用于补迁移，迁移前确保所有 UID 都有汇总文档（同时创建目标集合的索引）
+    ensure_gacha_log_summaries()
+
+    if args.catch_up:
+        run_catch_up(client.ht_server, args.to, args.batch_size, args.workers, args.max_items_per_second)
+    else:
+        run_full(client.ht_server, args.to, args.batch_size, args.workers, args.max_items_per_second, args.reset)
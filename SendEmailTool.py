@@ -20,9 +20,10 @@ def send_email(gmail_user, app_password, to_email, subject, body="这是一封
     msg["Subject"] = subject
     msg.attach(MIMEText(body, body_type))
 
-    # Gmail SMTP 服务器
-    server = smtplib.SMTP("smtp.gmail.com", 587)
-    server.starttls()
+    # SMTP 服务器，默认为 Gmail
+    server = smtplib.SMTP(config_loader.EMAIL_SMTP_HOST, config_loader.EMAIL_SMTP_PORT)
+    if config_loader.EMAIL_SMTP_STARTTLS:
+        server.starttls()
     server.login(gmail_user, app_password)
     server.sendmail(gmail_user, to_email, msg.as_string())
     server.quit()
@@ -72,6 +72,14 @@ class ConfigLoader:
     def JWT_EXPIRATION_HOURS(self) -> int:
         return self.get('JWT.EXPIRATION_HOURS', 24)
     
+    @property
+    def JWT_CACHE_SIZE(self) -> int:
+        return self.get('JWT.CACHE_SIZE', 10000)
+    
+    @property
+    def JWT_CACHE_TTL_SECONDS(self) -> int:
+        return self.get('JWT.CACHE_TTL_SECONDS', 60)
+    
     @property
     def EMAIL_GMAIL_USER(self) -> str:
         return self.get('EMAIL.GMAIL_USER')
@@ -80,10 +88,32 @@ class ConfigLoader:
     def EMAIL_APP_PASSWORD(self) -> str:
         return self.get('EMAIL.APP_PASSWORD')
     
+    @property
+    def EMAIL_SMTP_HOST(self) -> str:
+        return self.get('EMAIL.SMTP_HOST', 'smtp.gmail.com')
+    
+    @property
+    def EMAIL_SMTP_PORT(self) -> int:
+        return self.get('EMAIL.SMTP_PORT', 587)
+    
+    @property
+    def EMAIL_SMTP_STARTTLS(self) -> bool:
+        return self.get('EMAIL.SMTP_STARTTLS', True)
+    
+    @property
+    def EMAIL_SENDER_THREADS(self) -> int:
+        return self.get('EMAIL.SENDER_THREADS', 1)
+    
     @property
     def RSA_PRIVATE_KEY_FILE(self) -> str:
         return self.get('RSA.PRIVATE_KEY_FILE', 'private.pem')
     
+    @property
+    def RSA_PRIVATE_KEY_FILES(self) -> list:
+        """用于解密的全部私钥文件，主私钥在前，轮换期间的旧私钥在后"""
+        files = [self.RSA_PRIVATE_KEY_FILE] + list(self.get('RSA.ADDITIONAL_PRIVATE_KEY_FILES', []))
+        return list(dict.fromkeys(files))
+    
     @property
     def RSA_PUBLIC_KEY_FILE(self) -> str:
         return self.get('RSA.PUBLIC_KEY_FILE', 'public.pem')
@@ -111,6 +141,78 @@ class ConfigLoader:
     @property
     def VERIFICATION_CODE_EXPIRE_MINUTES(self) -> int:
         return self.get('VERIFICATION_CODE.EXPIRE_MINUTES', 10)
+    
+    @property
+    def VERIFICATION_CODE_MAX_ATTEMPTS(self) -> int:
+        return self.get('VERIFICATION_CODE.MAX_ATTEMPTS', 5)
+    
+    @property
+    def VERIFICATION_CODE_BACKEND(self) -> str:
+        return self.get('VERIFICATION_CODE.BACKEND', 'mongo')
+    
+    @property
+    def GACHA_LOG_STORAGE_MODE(self) -> str:
+        return self.get('GACHA_LOG.STORAGE_MODE', 'document')
+    
+    @property
+    def GACHA_LOG_STREAM_RETRIEVE(self) -> bool:
+        return self.get('GACHA_LOG.STREAM_RETRIEVE', True)
+    
+    @property
+    def GACHA_LOG_STATISTICS_INTERVAL_MINUTES(self) -> int:
+        return self.get('GACHA_LOG.STATISTICS_INTERVAL_MINUTES', 60)
+    
+    @property
+    def GACHA_LOG_FIVE_STAR_AVATAR_IDS(self) -> list | None:
+        return self.get('GACHA_LOG.FIVE_STAR_AVATAR_IDS')
+    
+    @property
+    def GACHA_LOG_IDEMPOTENCY_WINDOW_MINUTES(self) -> int:
+        return self.get('GACHA_LOG.IDEMPOTENCY_WINDOW_MINUTES', 10)
+    
+    @property
+    def GACHA_LOG_ARCHIVE_ENABLED(self) -> bool:
+        return self.get('GACHA_LOG.ARCHIVE_ENABLED', False)
+    
+    @property
+    def GACHA_LOG_ARCHIVE_INACTIVE_DAYS(self) -> int:
+        return self.get('GACHA_LOG.ARCHIVE_INACTIVE_DAYS', 180)
+    
+    @property
+    def PASSWORD_HASH_POOL_WORKERS(self) -> int:
+        return self.get('PASSWORD_HASH.POOL_WORKERS', 2)
+    
+    @property
+    def PASSWORD_HASH_MAX_PENDING(self) -> int:
+        return self.get('PASSWORD_HASH.MAX_PENDING', 32)
+    
+    @property
+    def PASSWORD_HASH_METHOD(self) -> str:
+        return self.get('PASSWORD_HASH.METHOD', 'scrypt')
+    
+    @property
+    def USER_CACHE_SIZE(self) -> int:
+        return self.get('USER_CACHE.SIZE', 10000)
+    
+    @property
+    def USER_CACHE_TTL_SECONDS(self) -> int:
+        return self.get('USER_CACHE.TTL_SECONDS', 60)
+    
+    @property
+    def RATE_LIMIT_ENABLED(self) -> bool:
+        return self.get('RATE_LIMIT.ENABLED', True)
+    
+    @property
+    def RATE_LIMIT_SHARED(self) -> bool:
+        return self.get('RATE_LIMIT.SHARED', False)
+    
+    @property
+    def RATE_LIMIT_TRUSTED_PROXY_COUNT(self) -> int:
+        return self.get('RATE_LIMIT.TRUSTED_PROXY_COUNT', 0)
+    
+    @property
+    def RATE_LIMIT_RULES(self) -> dict:
+        return self.get('RATE_LIMIT.RULES', {})
 
 # 创建全局配置实例
 config_loader = ConfigLoader()
\ No newline at end of file
@@ -1,7 +1,16 @@
 from flask import request, jsonify
-from bson import ObjectId
 from app.extensions import client, logger
+from app.config_loader import config_loader
 from app.utils.jwt_utils import verify_token
+from app.utils.rate_limit import RateLimiter, merge_rules
+from services.auth_service import get_user_by_id
+
+# 开启共享计数时，限额在所有进程和服务器节点之间共同生效
+_rate_limiter = RateLimiter(
+    merge_rules(config_loader.RATE_LIMIT_RULES),
+    client.ht_server.rate_limits if config_loader.RATE_LIMIT_SHARED and client is not None else None
+)
+
 
 def require_maintainer_permission(f):
     def wrapper(*args, **kwargs):
@@ -11,7 +20,7 @@ def require_maintainer_permission(f):
         if not user_id:
             return jsonify({"code": 1, "message": "Invalid token"}), 401
 
-        user = client.ht_server.users.find_one({"_id": ObjectId(user_id)})
+        user = get_user_by_id(user_id)
         if not user or not user.get("IsMaintainer", False):
             return jsonify({"code": 2, "message": "Permission denied"}), 403
 
@@ -20,3 +29,50 @@ def require_maintainer_permission(f):
 
     wrapper.__name__ = f.__name__
     return wrapper
+
+
+
+def client_ip() -> str:
+    """客户端 IP，经过反向代理时从 X-Forwarded-For 中取可信代理添加的地址"""
+    proxy_count = config_loader.RATE_LIMIT_TRUSTED_PROXY_COUNT
+    if proxy_count:
+        forwarded = [ip.strip() for ip in request.headers.get('X-Forwarded-For', '').split(',') if ip.strip()]
+        if len(forwarded) >= proxy_count:
+            return forwarded[-proxy_count]
+    return request.remote_addr or ""
+
+
+def check_rate_limit(route: str, dimension: str, value: str = "", response_key: str = "retcode"):
+    """
+    检查限流，超过限额时返回 429 响应，否则返回 None
+
+    :param route: 规则中的路由名称
+    :param dimension: IP、EMAIL 或 ROUTE
+    :param response_key: 响应中状态码字段的名称，Passport 接口为 retcode，web-api 为 code
+    """
+    if not config_loader.RATE_LIMIT_ENABLED:
+        return None
+    if dimension == "EMAIL":
+        value = value.strip().lower()
+    wait = _rate_limiter.check(route, dimension, value)
+    if not wait:
+        return None
+    logger.warning(f"Rate limited {route} by {dimension}: {value}")
+    response = jsonify({response_key: 1, "message": "Too many requests, please try again later", "data": None})
+    response.headers['Retry-After'] = str(max(1, int(wait + 0.999)))
+    return response, 429
+
+
+def rate_limit(route: str, response_key: str = "retcode"):
+    """按客户端 IP 和接口总量限流，在解析请求体之前执行"""
+    def decorator(f):
+        def wrapper(*args, **kwargs):
+            limited = (check_rate_limit(route, "IP", client_ip(), response_key)
+                       or check_rate_limit(route, "ROUTE", "", response_key))
+            if limited:
+                return limited
+            return f(*args, **kwargs)
+
+        wrapper.__name__ = f.__name__
+        return wrapper
+    return decorator
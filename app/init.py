@@ -1,6 +1,7 @@
 from flask import Flask
 from app.config import Config
 from app.extensions import init_mongo
+from app.config_loader import config_loader
 
 def create_app():
     app = Flask(__name__)
@@ -9,6 +10,11 @@ def create_app():
 
     init_mongo(Config.MONGO_URI, Config.ISTEST_MODE)
 
+    # 在后台检查并创建所有集合的索引，索引定义没有变化时只需要一次查询
+    if not Config.ISTEST_MODE:
+        from app.schema import start_index_bootstrap
+        start_index_bootstrap()
+
     # 注册蓝图
     from routes.announcement import announcement_bp
     from routes.auth import auth_bp
@@ -24,6 +30,18 @@ def create_app():
     app.register_blueprint(misc_bp)
     app.register_blueprint(download_resource_bp)
 
+    # 后台周期任务
+    if not Config.ISTEST_MODE:
+        from services.gacha_statistics_service import start_statistics_job
+        from services.mail_outbox_service import start_mail_senders
+        from services.auth_service import start_user_cache_invalidation
+        start_statistics_job()
+        start_mail_senders()
+        start_user_cache_invalidation()
+        if config_loader.GACHA_LOG_ARCHIVE_ENABLED:
+            from services.gacha_log_retention_service import start_retention_job
+            start_retention_job()
+
     # CORS
     @app.after_request
     def after_request(response):
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import threading
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from app.extensions import client, logger
+from app.utils.periodic_job import run_job_once
+
+"""
+MongoDB 集合的索引定义。
+所有集合需要的索引都在 INDEXES 中声明，服务启动时由 bootstrap_indexes 检查并创建缺失的索引：
+索引定义的摘要保存在 schema_versions 集合中，摘要不变时（同一次部署的其他进程、重启）只需要一次查询；
+定义变化后由第一个获得租约的进程检查所有集合，其他进程跳过。
+各服务在第一次访问集合前调用 ensure_indexes，保证单独运行的工具脚本也能使用所需的索引。
+检查和创建索引时只持有该集合的锁，创建较慢的索引只会让访问同一集合的请求等待；
+服务启动时的检查在后台线程中进行（start_index_bootstrap），不阻塞进程启动。
+"""
+
+INDEXES = {
+    "users": [
+        {"keys": [("email", ASCENDING)], "name": "email_unique", "unique": True},
+    ],
+    "announcement": [
+        {"keys": [("Id", ASCENDING)], "name": "id"},
+    ],
+    "download_resources": [
+        {"keys": [("is_active", ASCENDING), ("is_test", ASCENDING), ("package_type", ASCENDING),
+                  ("created_at", DESCENDING)],
+         "name": "active_test_type_created_at"},
+    ],
+    "verification_codes": [
+        {"keys": [("expire_at", ASCENDING)], "name": "expire_at_ttl", "expireAfterSeconds": 0},
+    ],
+    "idempotency_keys": [
+        {"keys": [("user_id", ASCENDING), ("scope", ASCENDING), ("key", ASCENDING)], "name": "user_scope_key",
+         "unique": True},
+        {"keys": [("expire_at", ASCENDING)], "name": "expire_at_ttl", "expireAfterSeconds": 0},
+    ],
+    "mail_outbox": [
+        {"keys": [("state", ASCENDING), ("next_attempt_at", ASCENDING)], "name": "state_next_attempt_at"},
+        {"keys": [("expire_at", ASCENDING)], "name": "expire_at_ttl", "expireAfterSeconds": 0},
+    ],
+    "revoked_tokens": [
+        {"keys": [("expire_at", ASCENDING)], "name": "expire_at_ttl", "expireAfterSeconds": 0},
+    ],
+    "rate_limits": [
+        {"keys": [("expire_at", ASCENDING)], "name": "expire_at_ttl", "expireAfterSeconds": 0},
+    ],
+    "GachaLog": [
+        {"keys": [("user_id", ASCENDING), ("Uid", ASCENDING)], "name": "user_uid", "unique": True},
+    ],
+    "GachaLogItem": [
+        {"keys": [("user_id", ASCENDING), ("Uid", ASCENDING), ("GachaType", ASCENDING), ("Id", ASCENDING)],
+         "name": "user_uid_type_id", "unique": True},
+        {"keys": [("user_id", ASCENDING), ("Uid", ASCENDING), ("_Seq", ASCENDING)], "name": "user_uid_seq"},
+    ],
+    "GachaLogColumnar": [
+        {"keys": [("user_id", ASCENDING), ("Uid", ASCENDING)], "name": "user_uid", "unique": True},
+    ],
+    "GachaLogSummary": [
+        {"keys": [("user_id", ASCENDING), ("Uid", ASCENDING)], "name": "user_uid", "unique": True},
+    ],
+    "GachaLogSyncState": [
+        {"keys": [("user_id", ASCENDING), ("Uid", ASCENDING)], "name": "user_uid", "unique": True},
+    ],
+    "GachaLogArchive": [
+        {"keys": [("user_id", ASCENDING), ("Uid", ASCENDING)], "name": "user_uid", "unique": True},
+    ],
+    "GachaDistributionContribution": [
+        {"keys": [("user_id", ASCENDING), ("Uid", ASCENDING)], "name": "user_uid", "unique": True},
+    ],
+}
+
+# 比较已有索引时检查的选项及其默认值
+_COMPARED_OPTIONS = {"unique": False, "expireAfterSeconds": None}
+
+# 索引创建的最长时间（秒），作为启动时检查索引的租约时长
+BOOTSTRAP_LEASE_SECONDS = 1800
+
+_ensured = set()
+# 保护 _collection_locks 的创建，不在持有期间访问数据库
+_ensured_lock = threading.Lock()
+_collection_locks = {}
+
+
+def indexes_digest() -> str:
+    """索引定义的摘要，定义变化时摘要随之变化"""
+    return hashlib.sha256(json.dumps(INDEXES, sort_keys=True).encode()).hexdigest()
+
+
+def _find_existing(existing: dict, spec: dict) -> dict | None:
+    """按字段查找已有索引，名称不同但字段相同的索引也视为存在"""
+    keys = [tuple(key) for key in spec['keys']]
+    for info in existing.values():
+        if [tuple(key) for key in info['key']] == keys:
+            return info
+    return None
+
+
+def check_collection(name: str) -> tuple[list, list]:
+    """
+    对比集合已有的索引和定义，返回 (缺失的索引定义, 选项不一致的索引说明)
+    """
+    existing = client.ht_server[name].index_information()
+    missing = []
+    conflicts = []
+    for spec in INDEXES[name]:
+        info = _find_existing(existing, spec)
+        if info is None:
+            missing.append(spec)
+            continue
+        for option, default in _COMPARED_OPTIONS.items():
+            actual = info.get(option, default)
+            expected = spec.get(option, default)
+            if actual != expected:
+                conflicts.append(f"{name}.{spec['name']}: {option} is {actual}, expected {expected}")
+    return missing, conflicts
+
+
+def _collection_lock(name: str) -> threading.Lock:
+    with _ensured_lock:
+        lock = _collection_locks.get(name)
+        if lock is None:
+            lock = _collection_locks[name] = threading.Lock()
+        return lock
+
+
+def ensure_indexes(names: list | None = None) -> bool:
+    """
+    创建缺失的索引，每个进程对同一集合只检查一次，返回是否全部成功
+
+    :param names: 集合名称，None 表示所有集合
+    """
+    names = list(INDEXES) if names is None else names
+    succeeded = True
+    for name in names:
+        if name in _ensured:
+            continue
+        with _collection_lock(name):
+            if name in _ensured:
+                continue
+            missing, conflicts = check_collection(name)
+            for conflict in conflicts:
+                logger.warning(f"Index option mismatch on {conflict}")
+            if missing:
+                logger.warning(f"Missing indexes on {name}: {', '.join(spec['name'] for spec in missing)}, creating")
+                models = [
+                    IndexModel(spec['keys'], **{k: v for k, v in spec.items() if k != 'keys'})
+                    for spec in missing
+                ]
+                try:
+                    client.ht_server[name].create_indexes(models)
+                except OperationFailure as e:
+                    # 例如已有重复数据时无法创建唯一索引，需要人工处理，不影响服务启动
+                    logger.error(f"Failed to create indexes on {name}: {e}")
+                    succeeded = False
+                    continue
+            _ensured.add(name)
+    return succeeded
+
+
+def apply_indexes():
+    """
+    创建所有集合缺失的索引，全部成功后记录索引定义的摘要
+
+    :raises RuntimeError: 部分索引创建失败
+    """
+    if not ensure_indexes():
+        raise RuntimeError("some indexes could not be created")
+    client.ht_server.schema_versions.update_one({"_id": "indexes"}, {"$set": {"digest": indexes_digest()}},
+                                                upsert=True)
+
+
+def bootstrap_indexes():
+    """服务启动时检查索引，索引定义没有变化时跳过"""
+    digest = indexes_digest()
+    state = client.ht_server.schema_versions.find_one({"_id": "indexes"})
+    if state and state.get('digest') == digest:
+        _ensured.update(INDEXES)
+        return
+    # 租约名称带上摘要，新的索引定义部署后所有进程中只有一个执行检查
+    if not run_job_once(f"schema_indexes_{digest[:16]}", apply_indexes, BOOTSTRAP_LEASE_SECONDS,
+                        BOOTSTRAP_LEASE_SECONDS):
+        logger.info("Index bootstrap is handled by another process")
+
+
+def start_index_bootstrap():
+    """在后台线程中运行 bootstrap_indexes，失败只记录日志，各服务访问集合前仍会检查自己需要的索引"""
+    def bootstrap():
+        try:
+            bootstrap_indexes()
+        except Exception as e:
+            logger.error(f"Index bootstrap failed: {e}")
+
+    threading.Thread(target=bootstrap, name="schema-bootstrap", daemon=True).start()
@@ -0,0 +1,60 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    线程安全的进程内 LRU 缓存，超过容量时淘汰最久未使用的条目。
+    条目可以设置过期时间，过期条目在读取时视为未命中并被删除。
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float | None = None):
+        """
+        :param max_size: 最大条目数
+        :param ttl_seconds: 默认有效期（秒），None 表示不过期
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expire_at = entry
+                if expire_at is None or expire_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl_seconds: float | None = None):
+        """写入条目，ttl_seconds 为 None 时使用默认有效期"""
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expire_at = None if ttl_seconds is None else time.monotonic() + ttl_seconds
+        with self._lock:
+            self._data[key] = (value, expire_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,234 @@
+import codecs
+import json
+import zlib
+from typing import Any, Iterable, Iterator
+
+"""
+增量 JSON 解析。
+请求体按块读取、解压和解码，顶层对象的字段逐个解析；指定的数组字段逐个元素产出，
+内存中只保留当前未解析完的一段文本，与请求体总大小无关。
+单个未解析完的值超过 max_value_size 个字符时（格式错误的请求体或不在流式字段中的超大值）直接报错，不继续读取。
+"""
+
+# 每次从请求体读取的字节数
+READ_CHUNK_SIZE = 64 * 1024
+
+# 单个 JSON 值（不含逐个产出的数组字段）最多缓冲的字符数
+MAX_VALUE_SIZE = 1024 * 1024
+
+_WHITESPACE = " \t\r\n"
+
+
+def iter_request_chunks(stream, content_encoding: str | None = None,
+                        chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    按块读取请求体，Content-Encoding 为 gzip 时边读边解压。
+
+    :raises ValueError: 不支持的 Content-Encoding 或 gzip 数据损坏
+    """
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding not in ("identity", "gzip", "x-gzip"):
+        raise ValueError(f"unsupported content encoding: {content_encoding}")
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding != "identity" else None
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if decompressor is None:
+            yield chunk
+            continue
+        try:
+            # 限制单次解压输出，避免高压缩比的数据一次解压出大量内容
+            data = decompressor.decompress(chunk, chunk_size)
+            while data:
+                yield data
+                data = decompressor.decompress(decompressor.unconsumed_tail, chunk_size)
+        except zlib.error as e:
+            raise ValueError(f"invalid gzip body: {e}") from e
+    if decompressor is not None:
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+        if not decompressor.eof:
+            raise ValueError("truncated gzip body")
+
+
+class _Reader:
+    """在分块到达的文本上按位置读取 JSON 值，已解析的部分会被丢弃"""
+
+    def __init__(self, chunks: Iterable[bytes], max_value_size: int = MAX_VALUE_SIZE):
+        self._chunks = iter(chunks)
+        self._max_value_size = max_value_size
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """读取下一块，没有更多数据时返回 False"""
+        if self._eof:
+            return False
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk)
+            if text:
+                self._buffer += text
+                return True
+        self._buffer += self._decoder.decode(b"", final=True)
+        self._eof = True
+        return True
+
+    def peek(self) -> str:
+        """跳过空白并返回下一个字符，数据结束时返回空字符串"""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"expected {char!r} but found {found or 'end of data'!r}")
+        self._pos += 1
+
+    def _fill_value(self) -> bool:
+        """为未解析完的值读取下一块，缓冲的文本超过上限时报错"""
+        if len(self._buffer) - self._pos > self._max_value_size:
+            raise ValueError(f"JSON value exceeds {self._max_value_size} characters")
+        return self._fill()
+
+    def value(self) -> Any:
+        """
+        解析一个完整的 JSON 值
+
+        :raises ValueError: 数据不是合法的 JSON，或值的长度超过 max_value_size
+        """
+        self.peek()
+        while True:
+            try:
+                result, end = self._json.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as e:
+                if not self._fill_value():
+                    raise ValueError(f"invalid JSON: {e}") from e
+                continue
+            # 数字可能在块边界被截断，值恰好到达缓冲区末尾时需要确认后面没有更多数据
+            if end == len(self._buffer) and not self._eof:
+                self._fill_value()
+                continue
+            self._pos = end
+            return result
+
+    def at_end(self) -> bool:
+        return self.peek() == ""
+
+
+def _stream_spec(stream_keys) -> dict:
+    """把 stream_keys 统一为 {字段名: 数组元素的 stream_keys 或 None}"""
+    if isinstance(stream_keys, dict):
+        return {key: None if spec is None else _stream_spec(spec) for key, spec in stream_keys.items()}
+    return dict.fromkeys(stream_keys)
+
+
+def _iter_array(reader: _Reader, element_keys: dict | None) -> Iterator[Any]:
+    reader.expect("[")
+    if reader.peek() == "]":
+        reader.expect("]")
+        return
+    while True:
+        if element_keys is not None and reader.peek() == "{":
+            fields = _iter_object(reader, element_keys)
+            yield fields
+            for _ in fields:
+                pass
+        else:
+            yield reader.value()
+        if reader.peek() == ",":
+            reader.expect(",")
+            continue
+        reader.expect("]")
+        return
+
+
+def _iter_object(reader: _Reader, stream_keys: dict) -> Iterator[tuple[str, Any]]:
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.expect("}")
+        return
+    while True:
+        key = reader.value()
+        if not isinstance(key, str):
+            raise ValueError("object keys must be strings")
+        reader.expect(":")
+        if key in stream_keys and reader.peek() == "[":
+            elements = _iter_array(reader, stream_keys[key])
+            yield key, elements
+            for _ in elements:
+                pass
+        else:
+            yield key, reader.value()
+        if reader.peek() == ",":
+            reader.expect(",")
+            continue
+        reader.expect("}")
+        return
+
+
+def iter_json_object(chunks: Iterable[bytes], stream_keys: Iterable[str] | dict = (),
+                     max_value_size: int = MAX_VALUE_SIZE) -> Iterator[tuple[str, Any]]:
+    """
+    逐个产出顶层 JSON 对象的 (字段名, 值)。
+    stream_keys 中的字段值为数组时，产出的值是逐个元素的迭代器，必须在读取下一个字段前使用完毕
+    （未使用完的部分会被跳过）；其他字段的值完整解析后产出。
+    stream_keys 也可以是 {字段名: 元素的 stream_keys} 形式的 dict，此时数组中的对象元素同样以
+    (字段名, 值) 迭代器的形式产出，例如 {"hk4e": {"list": None}} 会逐条产出 hk4e[].list 中的元素。
+
+    :param max_value_size: 单个完整解析的值最多缓冲的字符数
+    :raises ValueError: 数据不是合法的 JSON 对象，或单个值超过 max_value_size
+    """
+    reader = _Reader(chunks, max_value_size)
+    yield from _iter_object(reader, _stream_spec(stream_keys))
+    if not reader.at_end():
+        raise ValueError("unexpected data after JSON object")
+
+
+if __name__ == "__main__":
+    import gzip
+    import io
+    import time
+    import tracemalloc
+
+    items = [
+        {"Uid": "100000001", "GachaType": 301, "ItemId": 10000002 + i % 7, "Time": "2024-01-01T12:00:00+08:00",
+         "Id": 1700000000000000000 + i, "Name": "测试中文"}
+        for i in range(200_000)
+    ]
+    body = json.dumps({"Uid": "100000001", "Items": items, "Tail": [1, 2.5e3, None]}).encode()
+    compressed = gzip.compress(body)
+
+    def consume():
+        count = 0
+        for key, value in iter_json_object(iter_request_chunks(io.BytesIO(compressed), "gzip"), stream_keys=("Items",)):
+            if key == "Items":
+                for _ in value:
+                    count += 1
+        return count
+
+    def load_all():
+        return len(json.loads(gzip.decompress(compressed))["Items"])
+
+    for name, func in (("json.loads", load_all), ("iter_json_object", consume)):
+        start = time.perf_counter()
+        count = func()
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{name}: {count} items, {len(body) / 1e6:.1f} MB JSON ({len(compressed) / 1e6:.1f} MB gzip), "
+              f"{elapsed * 1000:.0f} ms, peak memory {peak / 1e6:.1f} MB")
@@ -1,7 +1,23 @@
 import jwt
 import datetime
+import hashlib
+import time
 from flask import current_app
+from pymongo.errors import PyMongoError
 from app.config_loader import config_loader
+from app.extensions import client, logger
+from app.utils.cache import LRUCache
+
+"""
+已验证令牌的进程内缓存：令牌 -> user_id，条目在令牌过期或缓存有效期（JWT.CACHE_TTL_SECONDS）到达时失效，
+同一令牌的连续请求不再重复解码和校验签名。
+注销的令牌记录在 revoked_tokens 集合中（按令牌过期时间由 TTL 索引清理），本进程立即生效，
+其他进程在缓存条目失效后重新验证时生效，因此缓存有效期决定了注销在所有进程生效的最长延迟。
+"""
+
+_token_cache = LRUCache(max_size=config_loader.JWT_CACHE_SIZE)
+# 本进程注销的令牌，避免在 revoked_tokens 写入前后仍命中缓存
+_revoked = LRUCache(max_size=config_loader.JWT_CACHE_SIZE)
 
 def create_token(user_id: str) -> str:
     """
@@ -30,6 +46,22 @@ def create_refresh_token(user_id: str) -> str:
     }
     return jwt.encode(payload, current_app.config["SECRET_KEY"], algorithm=config_loader.JWT_ALGORITHM)
 
+def _token_id(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _is_revoked(token_id: str) -> bool:
+    if _revoked.get(token_id):
+        return True
+    if client is None:
+        return False
+    try:
+        return client.ht_server.revoked_tokens.find_one({"_id": token_id}, {"_id": 1}) is not None
+    except PyMongoError as e:
+        logger.error(f"Failed to check token revocation: {e}")
+        return False
+
+
 def verify_token(token: str)-> str | None:
     """
     验证JWT令牌并返回用户ID，如果无效则返回None。
@@ -39,8 +71,71 @@ def verify_token(token: str)-> str | None:
     :return: 用户ID或None
     :rtype: str | None
     """
+    if not token:
+        return None
+    user_id = _token_cache.get(token)
+    if user_id is not None:
+        return user_id
+
     try:
         data = jwt.decode(token, current_app.config["SECRET_KEY"], algorithms=[config_loader.JWT_ALGORITHM])
-        return data["user_id"]
-    except:
+    except jwt.InvalidTokenError:
+        return None
+    user_id = data.get("user_id")
+    if not user_id or _is_revoked(_token_id(token)):
         return None
+
+    ttl_seconds = min(data.get("exp", 0) - time.time(), config_loader.JWT_CACHE_TTL_SECONDS)
+    if ttl_seconds > 0:
+        _token_cache.set(token, user_id, ttl_seconds)
+    return user_id
+
+
+def revoke_token(token: str) -> bool:
+    """
+    注销令牌，返回令牌是否有效
+
+    :param token: JWT令牌字符串
+    """
+    try:
+        data = jwt.decode(token, current_app.config["SECRET_KEY"], algorithms=[config_loader.JWT_ALGORITHM])
+    except jwt.InvalidTokenError:
+        return False
+    token_id = _token_id(token)
+    exp = data.get("exp") or time.time() + config_loader.JWT_EXPIRATION_HOURS * 2 * 3600
+    if client is not None:
+        client.ht_server.revoked_tokens.update_one(
+            {"_id": token_id},
+            {"$set": {"user_id": data.get("user_id"), "expire_at": datetime.datetime.utcfromtimestamp(exp)}},
+            upsert=True
+        )
+    _revoked.set(token_id, True, max(exp - time.time(), 1))
+    _token_cache.pop(token)
+    return True
+
+
+def token_cache_stats() -> dict:
+    """令牌缓存的条目数和命中次数"""
+    return _token_cache.stats()
+
+
+if __name__ == "__main__":
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "benchmark-secret"
+    with app.app_context():
+        token = create_token("user-1")
+
+        def decode_per_call(token):
+            """原有方式：每次请求都解码并校验签名"""
+            return jwt.decode(token, app.config["SECRET_KEY"], algorithms=[config_loader.JWT_ALGORITHM])["user_id"]
+
+        count = 100_000
+        for name, func in (("decode per call", decode_per_call), ("cached", verify_token)):
+            start = time.perf_counter()
+            for _ in range(count):
+                func(token)
+            elapsed = time.perf_counter() - start
+            print(f"{name}: {count / elapsed:.0f} verifies/s")
+        print(token_cache_stats())
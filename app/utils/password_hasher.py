@@ -0,0 +1,267 @@
+import contextlib
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+from app.extensions import logger
+
+"""
+密码哈希。
+generate_password_hash / check_password_hash 是刻意设计的 CPU 密集运算，在请求线程中执行时会长时间占用 GIL，
+登录高峰期同一 gunicorn 进程中的其他请求（包括公告等轻量接口）都会被拖慢。
+这里把哈希运算放到有界的进程池中执行：执行中和排队中的任务总数达到 max_pending 时直接抛出 PasswordHasherBusy，
+由接口返回 503，而不是继续排队占用请求线程。
+哈希之前需要先执行不可撤销的操作（例如消耗验证码）时，用 reserve() 预先占用名额，进程池已满时在操作之前失败。
+
+哈希参数由 method 决定（werkzeug 的格式，例如 "scrypt:32768:8:1"、"pbkdf2:sha256:1000000"），
+可以用 python -m app.utils.password_hasher --target-ms 250 在部署的机器上校准。
+已保存的哈希参数与 method 不同时 needs_rehash 返回 True，登录成功后用新参数重新计算并保存。
+"""
+
+# 默认进程数
+DEFAULT_WORKERS = 2
+
+# 默认的任务数上限（执行中 + 排队中）
+DEFAULT_MAX_PENDING = 32
+
+# 默认的哈希参数，与 werkzeug 的默认值相同
+DEFAULT_METHOD = "scrypt"
+
+
+class PasswordHasherBusy(Exception):
+    """进程池已满，请求需要稍后重试"""
+
+
+def _generate(password: str, method: str) -> str:
+    return generate_password_hash(password, method)
+
+
+def _check(pwhash: str, password: str) -> bool:
+    return check_password_hash(pwhash, password)
+
+
+def normalize_method(method: str) -> str:
+    """
+    补全哈希参数的默认值，与 werkzeug 保存在哈希中的格式一致，例如 "scrypt" -> "scrypt:32768:8:1"
+
+    :raises ValueError: 不支持的哈希方法或参数格式错误
+    """
+    name, *args = method.split(":")
+    if name == "scrypt":
+        if not args:
+            return "scrypt:32768:8:1"
+        if len(args) != 3:
+            raise ValueError("'scrypt' takes 3 arguments.")
+        n, r, p = map(int, args)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == "pbkdf2":
+        if len(args) > 2:
+            raise ValueError("'pbkdf2' takes 2 arguments.")
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"Invalid hash method '{method}'.")
+
+
+class PasswordHasher:
+    """在进程池中执行密码哈希，workers 为 0 时在当前线程执行"""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_pending: int = DEFAULT_MAX_PENDING,
+                 method: str = DEFAULT_METHOD):
+        """
+        :param workers: 进程数
+        :param max_pending: 执行中和排队中的任务总数上限
+        :param method: 计算新哈希使用的参数
+        """
+        self.method = normalize_method(method)
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        # 当前线程通过 reserve() 占用的名额数
+        self._reserved = threading.local()
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        executor = self._executor
+        # gunicorn 以 --preload 方式 fork 进程时，父进程的进程池在子进程中不可用
+        if executor is not None and self._pid == os.getpid():
+            return executor
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # 请求线程可能持有锁，fork 出的子进程会继承这些锁，使用 forkserver 启动工作进程
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("forkserver")
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _acquire_slot(self):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy(f"password hasher is busy ({self.max_pending} pending)")
+
+    @contextlib.contextmanager
+    def reserve(self):
+        """
+        预先占用一个名额，期间当前线程的 hash/verify 使用该名额，不会因为进程池已满而失败
+
+        :raises PasswordHasherBusy: 进程池已满
+        """
+        self._acquire_slot()
+        self._reserved.count = getattr(self._reserved, 'count', 0) + 1
+        try:
+            yield
+        finally:
+            self._reserved.count -= 1
+            self._slots.release()
+
+    def _run(self, func, *args):
+        if getattr(self._reserved, 'count', 0):
+            return self._execute(func, *args)
+        self._acquire_slot()
+        try:
+            return self._execute(func, *args)
+        finally:
+            self._slots.release()
+
+    def _execute(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        executor = self._get_executor()
+        try:
+            return executor.submit(func, *args).result()
+        except BrokenProcessPool:
+            # 工作进程异常退出（例如被 OOM killer 杀死），重建进程池后重试一次
+            logger.warning("Password hasher process pool is broken, recreating")
+            self._discard_executor(executor)
+            return self._get_executor().submit(func, *args).result()
+
+    def hash(self, password: str) -> str:
+        """
+        计算密码哈希
+
+        :raises PasswordHasherBusy: 进程池已满
+        """
+        return self._run(_generate, password, self.method)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        """
+        校验密码
+
+        :raises PasswordHasherBusy: 进程池已满
+        """
+        return self._run(_check, pwhash, password)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """已保存的哈希参数是否与当前的 method 不同"""
+        stored_method = pwhash.split("$", 1)[0]
+        try:
+            return normalize_method(stored_method) != self.method
+        except ValueError:
+            return True
+
+
+def _measure_ms(method: str, rounds: int) -> float:
+    """计算 rounds 次哈希，返回耗时的中位数（毫秒）"""
+    durations = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        generate_password_hash("calibration-password", method)
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+
+def calibrate(target_ms: float, rounds: int = 3) -> list[tuple[str, float]]:
+    """
+    在当前机器上测量哈希耗时，返回不超过 target_ms 的最强参数 [(method, 耗时毫秒)]，scrypt 在前。
+    scrypt 的 N 按 2 的幂次增加（内存占用为 128 * N * r 字节），pbkdf2 按实测速度换算迭代次数。
+    """
+    results = []
+
+    n = 2 ** 14
+    best = None
+    while n <= 2 ** 20:
+        method = f"scrypt:{n}:8:1"
+        elapsed = _measure_ms(method, rounds)
+        if elapsed > target_ms:
+            break
+        best = (method, elapsed)
+        n *= 2
+    if best:
+        results.append(best)
+
+    sample_iterations = 100_000
+    per_iteration = _measure_ms(f"pbkdf2:sha256:{sample_iterations}", rounds) / sample_iterations
+    iterations = int(target_ms / per_iteration) // 10_000 * 10_000
+    if iterations:
+        method = f"pbkdf2:sha256:{iterations}"
+        elapsed = _measure_ms(method, rounds)
+        if elapsed > target_ms:
+            # 小样本换算有误差，按实测耗时再缩放一次
+            iterations = int(iterations * target_ms / elapsed) // 10_000 * 10_000
+            method = f"pbkdf2:sha256:{iterations}"
+            elapsed = _measure_ms(method, rounds)
+        results.append((method, elapsed))
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="校准密码哈希参数，或测试登录高峰期轻量请求的延迟")
+    parser.add_argument("--target-ms", type=float, default=250, help="单次哈希的目标耗时（毫秒）")
+    parser.add_argument("--benchmark", action="store_true", help="测试进程池对轻量请求延迟的影响")
+    args = parser.parse_args()
+
+    pwhash = generate_password_hash("password")
+
+    def cheap_request_latency(hasher: PasswordHasher, logins: int = 8) -> list:
+        """登录请求并发执行期间，测量轻量请求（一次小的 Python 运算）的延迟"""
+        stop = threading.Event()
+
+        def login_storm():
+            while not stop.is_set():
+                try:
+                    hasher.verify(pwhash, "password")
+                except PasswordHasherBusy:
+                    time.sleep(0.001)
+
+        threads = [threading.Thread(target=login_storm) for _ in range(logins)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.5)
+        latencies = []
+        for _ in range(200):
+            start = time.perf_counter()
+            sum(range(200000))
+            latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.005)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return sorted(latencies)
+
+    if not args.benchmark:
+        for method, elapsed in calibrate(args.target_ms):
+            print(f"{method}: {elapsed:.0f} ms")
+        print("Set PASSWORD_HASH.METHOD to one of the methods above (scrypt is memory-hard and preferred)")
+        raise SystemExit
+
+    for name, hasher, logins in (("idle", PasswordHasher(workers=0), 0),
+                                 ("inline", PasswordHasher(workers=0, max_pending=64), 8),
+                                 ("process pool", PasswordHasher(workers=2, max_pending=4), 8)):
+        latencies = cheap_request_latency(hasher, logins)
+        print(f"{name}: cheap request p50 {statistics.median(latencies):.2f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)]:.2f} ms")
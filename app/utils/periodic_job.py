@@ -0,0 +1,97 @@
+import datetime
+import os
+import random
+import socket
+import threading
+import time
+from pymongo.errors import DuplicateKeyError
+from app.extensions import client, logger
+
+"""
+多进程、多服务器共用的周期任务。
+每个 gunicorn 进程都会启动一个轮询线程，通过 job_leases 集合中的租约保证同一时间只有一个进程执行任务，
+任务完成后记录下次执行时间，持有租约的进程崩溃时租约到期后由其他进程接管。
+"""
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+_started = set()
+_started_lock = threading.Lock()
+
+
+def _try_acquire(name: str, lease_seconds: int) -> bool:
+    """尝试获取任务租约，只有租约已过期且到达下次执行时间时才能获取成功"""
+    now = datetime.datetime.utcnow()
+    try:
+        client.ht_server.job_leases.find_one_and_update(
+            {
+                "_id": name,
+                "$and": [
+                    {"$or": [{"lease_until": {"$lt": now}}, {"lease_until": {"$exists": False}}]},
+                    {"$or": [{"next_run_at": {"$lte": now}}, {"next_run_at": {"$exists": False}}]}
+                ]
+            },
+            {"$set": {"owner": _OWNER, "lease_until": now + datetime.timedelta(seconds=lease_seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # 文档存在但条件不满足，说明其他进程持有租约或还没到执行时间
+        return False
+
+
+def _release(name: str, interval_seconds: int, succeeded: bool):
+    now = datetime.datetime.utcnow()
+    update = {"lease_until": now}
+    if succeeded:
+        update["next_run_at"] = now + datetime.timedelta(seconds=interval_seconds)
+        update["last_finished_at"] = now
+    client.ht_server.job_leases.update_one({"_id": name, "owner": _OWNER}, {"$set": update})
+
+
+def run_job_once(name: str, func, interval_seconds: int, lease_seconds: int) -> bool:
+    """获取租约后执行一次任务，返回是否执行"""
+    if not _try_acquire(name, lease_seconds):
+        return False
+    started = time.monotonic()
+    succeeded = False
+    try:
+        func()
+        succeeded = True
+        logger.info(f"Job {name} finished in {time.monotonic() - started:.1f}s")
+    except Exception as e:
+        logger.error(f"Job {name} failed: {e}")
+    finally:
+        _release(name, interval_seconds, succeeded)
+    return True
+
+
+def start_periodic_job(name: str, func, interval_seconds: int, lease_seconds: int | None = None,
+                       poll_seconds: int = 60):
+    """
+    在后台线程中周期执行任务，每个进程对同一任务只启动一次。
+
+    :param name: 任务名称，同时作为租约文档的 _id
+    :param func: 任务函数
+    :param interval_seconds: 两次执行之间的间隔
+    :param lease_seconds: 租约时长，应大于任务的最长执行时间，默认为执行间隔
+    :param poll_seconds: 轮询租约的间隔
+    """
+    with _started_lock:
+        if name in _started:
+            return
+        _started.add(name)
+
+    lease_seconds = lease_seconds or interval_seconds
+
+    def loop():
+        # 错开各进程的轮询时间
+        time.sleep(random.uniform(0, poll_seconds))
+        while True:
+            try:
+                run_job_once(name, func, interval_seconds, lease_seconds)
+            except Exception as e:
+                logger.error(f"Job {name} lease check failed: {e}")
+            time.sleep(poll_seconds + random.uniform(0, poll_seconds / 10))
+
+    threading.Thread(target=loop, name=f"job-{name}", daemon=True).start()
+    logger.info(f"Periodic job {name} scheduled every {interval_seconds}s")
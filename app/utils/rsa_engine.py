@@ -0,0 +1,127 @@
+import base64
+import os
+import threading
+import time
+from Crypto.Cipher import PKCS1_OAEP
+from Crypto.PublicKey import RSA
+from app.extensions import logger
+
+"""
+RSA 解密引擎。
+私钥只在文件变化时解析一次，OAEP cipher 对象在请求之间复用；每隔 RELOAD_CHECK_SECONDS 检查一次私钥文件的修改时间，
+文件变化后自动重新加载，无需重启。
+可以同时配置多个私钥：轮换客户端公钥期间新旧私钥同时有效，解密时依次尝试，优先使用上一次成功的私钥。
+"""
+
+# 检查私钥文件是否变化的间隔（秒）
+RELOAD_CHECK_SECONDS = 5
+
+
+class RSADecryptor:
+    """线程安全的 RSA-OAEP 解密器"""
+
+    def __init__(self, key_files: list[str], reload_check_seconds: float = RELOAD_CHECK_SECONDS):
+        """
+        :param key_files: 私钥文件路径，按优先级排列
+        :param reload_check_seconds: 检查私钥文件是否变化的间隔（秒）
+        """
+        self.key_files = list(key_files)
+        self.reload_check_seconds = reload_check_seconds
+        self._ciphers = ()
+        self._mtimes = None
+        self._checked_at = None
+        self._preferred = 0
+        self._lock = threading.Lock()
+
+    def _file_mtimes(self) -> tuple:
+        mtimes = []
+        for key_file in self.key_files:
+            try:
+                mtimes.append(os.stat(key_file).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def _load(self, mtimes: tuple):
+        ciphers = []
+        for key_file, mtime in zip(self.key_files, mtimes):
+            if mtime is None:
+                logger.error(f"RSA private key file not found: {key_file}")
+                continue
+            try:
+                with open(key_file, 'r') as f:
+                    ciphers.append(PKCS1_OAEP.new(RSA.import_key(f.read())))
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to load RSA private key {key_file}: {e}")
+        self._ciphers = tuple(ciphers)
+        self._preferred = 0
+        logger.info(f"Loaded {len(ciphers)} RSA private key(s)")
+
+    def _refresh(self):
+        """到了检查间隔时检查私钥文件，有变化时重新加载"""
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.reload_check_seconds:
+            return
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.reload_check_seconds:
+                return
+            mtimes = self._file_mtimes()
+            if mtimes != self._mtimes:
+                self._load(mtimes)
+                self._mtimes = mtimes
+            self._checked_at = now
+
+    def decrypt(self, encrypted_data: str) -> str:
+        """
+        解密 Base64 编码的密文
+
+        :raises ValueError: 密文无效或没有可以解密的私钥
+        """
+        self._refresh()
+        ciphers = self._ciphers
+        if not ciphers:
+            raise ValueError("No RSA private key available")
+
+        data = base64.b64decode(encrypted_data)
+        preferred = self._preferred if self._preferred < len(ciphers) else 0
+        order = [preferred] + [index for index in range(len(ciphers)) if index != preferred]
+        for index in order:
+            try:
+                decrypted_data = ciphers[index].decrypt(data)
+            except ValueError:
+                continue
+            self._preferred = index
+            return decrypted_data.decode()
+        raise ValueError("Incorrect decryption")
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    def write_key(path, key):
+        with open(path, 'wb') as f:
+            f.write(key.export_key())
+
+    def encrypt(key, text):
+        return base64.b64encode(PKCS1_OAEP.new(key.publickey()).encrypt(text.encode())).decode()
+
+    with tempfile.TemporaryDirectory() as directory:
+        old_key = RSA.generate(2048)
+        old_file = os.path.join(directory, "private.pem")
+        write_key(old_file, old_key)
+        ciphertext = encrypt(old_key, "user@example.com")
+
+        def decrypt_per_call(encrypted_data):
+            """原有方式：每次调用都读取并解析私钥文件"""
+            with open(old_file, 'r') as f:
+                private_key = RSA.import_key(f.read())
+            return PKCS1_OAEP.new(private_key).decrypt(base64.b64decode(encrypted_data)).decode()
+
+        single = RSADecryptor([old_file])
+        for name, func in (("per call", decrypt_per_call), ("cached", single.decrypt)):
+            count = 300
+            start = time.perf_counter()
+            for _ in range(count):
+                func(ciphertext)
+            elapsed = time.perf_counter() - start
+            print(f"{name}: {count / elapsed:.0f} decrypts/s")
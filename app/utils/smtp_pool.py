@@ -0,0 +1,237 @@
+import smtplib
+import ssl
+import threading
+import time
+from app.extensions import logger
+
+"""
+SMTP 连接池与熔断器。
+建立 SMTP 连接需要 TCP 握手、STARTTLS 和登录，耗时远大于发送一封邮件；连接池复用已登录的连接，
+空闲超过 idle_seconds 的连接会被服务器断开，不再复用。
+熔断器在连续失败达到阈值后暂停发送，等待 reset_seconds 后只放行一次试探，成功后恢复。
+"""
+
+# 空闲连接的最长复用时间（秒）
+IDLE_SECONDS = 60
+
+# 连接和读写超时（秒）
+TIMEOUT_SECONDS = 30
+
+
+class SMTPConnectionPool:
+    """线程安全的 SMTP 连接池，每个连接同一时间只被一个线程使用"""
+
+    def __init__(self, host: str, port: int, user: str | None = None, password: str | None = None,
+                 starttls: bool = True, max_idle: int = 2, idle_seconds: float = IDLE_SECONDS,
+                 timeout: float = TIMEOUT_SECONDS):
+        """
+        :param host: SMTP 服务器地址
+        :param port: SMTP 服务器端口
+        :param user: 登录用户名，为空时不登录
+        :param password: 登录密码
+        :param starttls: 是否使用 STARTTLS
+        :param max_idle: 最多保留的空闲连接数
+        :param idle_seconds: 空闲连接的最长复用时间
+        :param timeout: 连接和读写超时
+        """
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.max_idle = max_idle
+        self.idle_seconds = idle_seconds
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                connection.starttls(context=ssl.create_default_context())
+            if self.user:
+                connection.login(self.user, self.password)
+        except BaseException:
+            self._close(connection)
+            raise
+        with self._lock:
+            self.connections_opened += 1
+        return connection
+
+    @staticmethod
+    def _close(connection: smtplib.SMTP):
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+    def _acquire(self) -> tuple[smtplib.SMTP, bool]:
+        """取出一个空闲连接，没有可用的空闲连接时新建，返回 (连接, 是否复用)"""
+        now = time.monotonic()
+        expired = []
+        connection = None
+        with self._lock:
+            while self._idle:
+                candidate, released_at = self._idle.pop()
+                if now - released_at < self.idle_seconds:
+                    connection = candidate
+                    break
+                expired.append(candidate)
+        for candidate in expired:
+            self._close(candidate)
+        if connection is not None:
+            return connection, True
+        return self._connect(), False
+
+    def _release(self, connection: smtplib.SMTP):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append((connection, time.monotonic()))
+                return
+        self._close(connection)
+
+    def send(self, from_addr: str, to_addrs: list[str], message: str):
+        """
+        发送邮件，复用的连接已被服务器断开时使用新连接重试一次
+
+        :raises smtplib.SMTPException: 服务器拒绝
+        :raises OSError: 网络错误
+        """
+        connection, reused = self._acquire()
+        try:
+            self._sendmail(connection, from_addr, to_addrs, message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # 复用的空闲连接可能已被服务器断开或重置，使用新连接重发一次；新建的连接断开时直接抛出
+            if not reused:
+                raise
+            self._sendmail(self._connect(), from_addr, to_addrs, message)
+
+    def _sendmail(self, connection: smtplib.SMTP, from_addr: str, to_addrs: list[str], message: str):
+        """用指定连接发送，成功或被服务器拒绝时把连接放回连接池，连接断开或其他错误时关闭连接"""
+        try:
+            connection.sendmail(from_addr, to_addrs, message)
+        except smtplib.SMTPServerDisconnected:
+            connection.close()
+            raise
+        except smtplib.SMTPException:
+            # 服务器拒绝了这封邮件（4xx/5xx），连接仍然可用，重置会话后放回连接池；抛出的仍是拒绝的异常，调用方不会重发
+            try:
+                connection.rset()
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+            else:
+                self._release(connection)
+            raise
+        except BaseException:
+            connection.close()
+            raise
+        self._release(connection)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
+
+
+class CircuitBreaker:
+    """连续失败 failure_threshold 次后熔断 reset_seconds 秒，之后放行一次试探"""
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 60):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._open_until = None
+        self._lock = threading.Lock()
+
+    def wait_seconds(self) -> float:
+        """返回需要等待的秒数，0 表示可以发送"""
+        with self._lock:
+            if self._open_until is None:
+                return 0
+            remaining = self._open_until - time.monotonic()
+            if remaining > 0:
+                return remaining
+            # 半开状态：只放行当前调用者，其他线程继续等待试探结果
+            self._open_until = time.monotonic() + self.reset_seconds
+            return 0
+
+    def record_success(self):
+        with self._lock:
+            if self._open_until is not None:
+                logger.info("SMTP circuit closed")
+            self._failures = 0
+            self._open_until = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                if self._open_until is None:
+                    logger.warning(f"SMTP circuit opened after {self._failures} consecutive failures")
+                self._open_until = time.monotonic() + self.reset_seconds
+
+
+if __name__ == "__main__":
+    import socketserver
+    from email.mime.text import MIMEText
+
+    # 本地 SMTP 替身：每个连接的问候语延迟 GREETING_DELAY 秒，模拟到邮件服务商的握手耗时
+    GREETING_DELAY = 0.05
+
+    class StandInSMTPHandler(socketserver.StreamRequestHandler):
+        def reply(self, line: str):
+            self.wfile.write((line + "\r\n").encode())
+
+        def handle(self):
+            time.sleep(GREETING_DELAY)
+            self.reply("220 localhost stand-in ESMTP")
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                command = line.decode().strip().upper()
+                if command.startswith(("EHLO", "HELO")):
+                    self.reply("250 localhost")
+                elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                    self.reply("250 OK")
+                elif command == "DATA":
+                    self.reply("354 End data with <CR><LF>.<CR><LF>")
+                    while self.rfile.readline() not in (b".\r\n", b""):
+                        pass
+                    self.reply("250 OK")
+                elif command == "QUIT":
+                    self.reply("221 Bye")
+                    return
+                else:
+                    self.reply("502 Command not implemented")
+
+    class StandInSMTPServer(socketserver.ThreadingTCPServer):
+        daemon_threads = True
+        allow_reuse_address = True
+
+    server = StandInSMTPServer(("127.0.0.1", 0), StandInSMTPHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    message = MIMEText("您的验证码是: 123456").as_string()
+
+    def send_per_message():
+        """原有方式：每封邮件新建连接"""
+        connection = smtplib.SMTP(host, port, timeout=TIMEOUT_SECONDS)
+        connection.sendmail("noreply@example.com", ["user@example.com"], message)
+        connection.quit()
+
+    pool = SMTPConnectionPool(host, port, starttls=False)
+    count = 40
+    for name, func in (("per message", send_per_message),
+                       ("pooled", lambda: pool.send("noreply@example.com", ["user@example.com"], message))):
+        start = time.perf_counter()
+        for _ in range(count):
+            func()
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {count / elapsed:.0f} mails/s")
+    pool.close()
+    server.shutdown()
+    server.server_close()
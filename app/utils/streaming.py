@@ -0,0 +1,65 @@
+import zlib
+from typing import Callable, Iterable, Iterator
+import msgspec
+from bson.int64 import Int64
+from flask import Response, stream_with_context
+from app.extensions import logger
+
+# 每次向客户端写出的记录条数，避免逐条 yield 产生大量小块
+STREAM_CHUNK_ITEMS = 200
+
+
+def _enc_hook(obj):
+    # MongoDB 中的 64 位整数解码为 Int64（int 的子类），msgspec 不会自动处理
+    if isinstance(obj, Int64):
+        return int(obj)
+    raise NotImplementedError(f"Objects of type {type(obj)} are not supported")
+
+
+_encoder = msgspec.json.Encoder(enc_hook=_enc_hook)
+
+
+def stream_json_response(items: Iterable, message: Callable[[int], str], retcode: int = 0,
+                         extra: dict | None = None) -> Response:
+    """
+    以流式方式输出 {"retcode": ..., "data": [...], "message": ...} 格式的响应。
+    data 中的记录边序列化边发送，内存中最多只保留一个分块；
+    message 放在最后，由回调根据实际输出的条数生成。
+
+    :param items: 记录迭代器，通常直接来自 MongoDB 游标
+    :param message: 接收记录条数、返回 message 字段的回调
+    :param retcode: 响应的 retcode
+    :param extra: 附加的顶层字段，放在 data 之前输出
+    """
+    def generate():
+        count = 0
+        chunk = []
+        # 去掉结尾的 "}"，在其后接着输出 data
+        yield _encoder.encode({"retcode": retcode, **(extra or {})})[:-1] + b',"data":['
+        try:
+            for item in items:
+                chunk.append(item)
+                count += 1
+                if len(chunk) >= STREAM_CHUNK_ITEMS:
+                    # 整块编码为数组后去掉首尾的方括号
+                    yield (b"," if count > len(chunk) else b"") + _encoder.encode(chunk)[1:-1]
+                    chunk = []
+            if chunk:
+                yield (b"," if count > len(chunk) else b"") + _encoder.encode(chunk)[1:-1]
+        except Exception as e:
+            # 响应头已经发出，只能记录错误并中断输出
+            logger.error(f"Streaming response aborted after {count} items: {e}")
+            raise
+        yield b'],"message":' + _encoder.encode(message(count)) + b'}'
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
+def gzip_stream(chunks: Iterable[str | bytes], level: int = 6) -> Iterator[bytes]:
+    """把逐块产出的文本边压缩边输出为 gzip 数据，内存中只保留压缩器的窗口"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,17 +1,20 @@
 from flask import Blueprint, request, jsonify
-from app.utils.jwt_utils import create_token, verify_token, create_refresh_token
+from app.utils.jwt_utils import create_token, verify_token, create_refresh_token, revoke_token
+from app.utils.password_hasher import PasswordHasherBusy
 from services.auth_service import (
     decrypt_data, send_verification_email, verify_user_credentials,
-    create_user_account, get_user_by_id
+    create_user_account, reserve_password_hash, get_user_by_id
 )
 from services.verification_code_service import save_verification_code, verify_code
 from app.extensions import generate_code, logger , config_loader
+from app.decorators import rate_limit, check_rate_limit
 from app.config import Config
 
 auth_bp = Blueprint("auth", __name__)
 
 
 @auth_bp.route('/Passport/v2/Verify', methods=['POST'])
+@rate_limit("verify")
 def passport_verify():
     """获取验证码"""
     data = request.get_json()
@@ -28,6 +31,11 @@ def passport_verify():
             "data": None
         })
 
+    # 同一邮箱的验证码请求限流，在写入验证码和发送邮件之前
+    limited = check_rate_limit("verify", "EMAIL", decrypted_email)
+    if limited:
+        return limited
+
     # 生成验证码
     code = generate_code(6)
     # 使用 MongoDB TTL 存储验证码
@@ -49,6 +57,7 @@ def passport_verify():
 
 
 @auth_bp.route('/Passport/v2/Register', methods=['POST'])
+@rate_limit("register")
 def passport_register():
     """用户注册"""
     data = request.get_json()
@@ -70,17 +79,26 @@ def passport_register():
             "data": None
         }), 400
 
-    # 使用 MongoDB 验证验证码
-    if not verify_code(decrypted_email, decrypted_code):
-        logger.warning("Invalid verification code")
+    # 验证码在验证成功后失效，先占用密码哈希的名额，进程池已满时返回 503 而不消耗验证码
+    try:
+        with reserve_password_hash():
+            if not verify_code(decrypted_email, decrypted_code):
+                logger.warning("Invalid verification code")
+                return jsonify({
+                    "retcode": 2,
+                    "message": "Invalid verification code",
+                    "data": None
+                })
+
+            # 创建新用户
+            new_user = create_user_account(decrypted_email, decrypted_password)
+    except PasswordHasherBusy as e:
+        logger.warning(f"Registration rejected: {e}")
         return jsonify({
-            "retcode": 2,
-            "message": "Invalid verification code",
+            "retcode": 1,
+            "message": "Server is busy, please try again later",
             "data": None
-        })
-
-    # 创建新用户
-    new_user = create_user_account(decrypted_email, decrypted_password)
+        }), 503
     if not new_user:
         logger.warning(f"User already exists: {decrypted_email}")
         return jsonify({
@@ -107,6 +125,7 @@ def passport_register():
 
 
 @auth_bp.route('/Passport/v2/Login', methods=['POST'])
+@rate_limit("login")
 def passport_login():
     """用户登录"""
     data = request.get_json()
@@ -126,8 +145,21 @@ def passport_login():
             "data": None
         }), 400
     
+    # 同一邮箱的登录请求限流，在计算密码哈希之前
+    limited = check_rate_limit("login", "EMAIL", decrypted_email)
+    if limited:
+        return limited
+
     # 验证用户凭据
-    user = verify_user_credentials(decrypted_email, decrypted_password)
+    try:
+        user = verify_user_credentials(decrypted_email, decrypted_password)
+    except PasswordHasherBusy as e:
+        logger.warning(f"Login rejected: {e}")
+        return jsonify({
+            "retcode": 1,
+            "message": "Server is busy, please try again later",
+            "data": None
+        }), 503
     if not user:
         logger.warning(f"Invalid login attempt for email: {decrypted_email}")
         return jsonify({
@@ -234,7 +266,9 @@ def passport_refresh_token():
 @auth_bp.route('/Passport/v2/RevokeToken', methods=['POST'])
 def passport_revoke_token():
     """注销Token"""
-    logger.info("Token revoked")
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    if token and revoke_token(token):
+        logger.info("Token revoked")
     return jsonify({
         "retcode": 0,
         "message": "Token revoked successfully",
@@ -1,22 +1,67 @@
-from flask import Blueprint, request, jsonify
+import hashlib
+from collections.abc import Iterator
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from app.utils.jwt_utils import verify_token
 from services.gacha_log_service import (
-    get_gacha_log_entries, get_gacha_log_end_ids, upload_gacha_log, 
-    retrieve_gacha_log, delete_gacha_log
+    get_gacha_log_entries, get_gacha_log_end_ids, get_gacha_log_end_ids_batch, upload_gacha_log,
+    upload_gacha_log_stream, retrieve_gacha_log, iter_gacha_log, iter_gacha_log_batch, sync_gacha_log,
+    delete_gacha_log
 )
-from app.extensions import logger
+from services.gacha_log_schema import (
+    decode_item, decode_request, RetrieveRequest, SyncRequest, EndIdsBatchRequest, RetrieveBatchRequest,
+    MAX_BATCH_UIDS
+)
+from services.gacha_analytics_service import get_gacha_log_analytics
+from services.gacha_statistics_service import normalize_distribution_type, get_distribution_snapshot
+from services.idempotency_service import (
+    begin_request, complete_request, abandon_request, hash_chunks, request_hash, matches_request, MAX_KEY_LENGTH
+)
+from services.uigf_service import iter_uigf_export, import_uigf
+from app.utils.streaming import stream_json_response, gzip_stream
+from app.utils.json_stream import iter_request_chunks, iter_json_object
+from app.extensions import logger, config_loader
 
 gacha_log_bp = Blueprint("gacha_log", __name__)
 
+# Idempotency-Key 的作用范围
+UPLOAD_SCOPE = "GachaLog/Upload"
+
 
 @gacha_log_bp.route('/GachaLog/Statistics/Distribution/<distributionType>', methods=['GET'])
 def gacha_log_statistics_distribution(distributionType):
-    """获取祈愿记录统计分布"""
-    return jsonify({
+    """获取祈愿记录统计分布，数据来自后台任务生成的全服快照"""
+    distribution_type = normalize_distribution_type(distributionType)
+    if not distribution_type:
+        logger.warning(f"Unknown distribution type: {distributionType}")
+        return jsonify({
+            "retcode": 1,
+            "message": "Unknown distribution type",
+            "data": None
+        }), 400
+
+    snapshot = get_distribution_snapshot(distribution_type)
+    if not snapshot:
+        # 快照尚未生成
+        return jsonify({
+            "retcode": 0,
+            "message": "success",
+            "data": {}
+        })
+
+    etag = f'"{snapshot["Version"]}"'
+    if request.headers.get('If-None-Match') == etag:
+        return "", 304, {"ETag": etag}
+
+    response = jsonify({
         "retcode": 0,
         "message": "success",
-        "data": {}
+        "data": {
+            "TotalValidPulls": snapshot['TotalValidPulls'],
+            "Distribution": snapshot['Distribution']
+        }
     })
+    response.headers['ETag'] = etag
+    return response
 
 
 @gacha_log_bp.route('/GachaLog/Entries', methods=['GET'])
@@ -71,6 +116,40 @@ def gacha_log_end_ids():
     })
 
 
+@gacha_log_bp.route('/GachaLog/EndIds/Batch', methods=['POST'])
+def gacha_log_end_ids_batch():
+    """一次获取多个 UID 的祈愿记录最新 ID"""
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    user_id = verify_token(token)
+    
+    if not user_id:
+        logger.warning("Invalid or expired token")
+        return jsonify({
+            "retcode": 1,
+            "message": "Invalid or expired token",
+            "data": None
+        }), 401
+    
+    try:
+        data = decode_request(request.get_data(), EndIdsBatchRequest)
+    except ValueError as e:
+        logger.warning(f"Invalid gacha log end IDs batch body for user_id: {user_id}: {e}")
+        return jsonify({
+            "retcode": 1,
+            "message": "Invalid request body",
+            "data": None
+        }), 400
+
+    end_ids = get_gacha_log_end_ids_batch(user_id, data.Uids)
+    logger.info(f"Gacha log end IDs retrieved for user_id: {user_id}, uids: {data.Uids}")
+    
+    return jsonify({
+        "retcode": 0,
+        "message": "success",
+        "data": end_ids
+    })
+
+
 @gacha_log_bp.route('/GachaLog/Upload', methods=['POST'])
 def gacha_log_upload():
     """上传祈愿记录"""
@@ -85,17 +164,143 @@ def gacha_log_upload():
             "data": None
         }), 401
     
-    data = request.get_json()
-    uid = data.get('Uid', '')
-    items = data.get('Items', [])
-    
-    message = upload_gacha_log(user_id, uid, items)
+    # 带 Idempotency-Key 的重试只计算请求体摘要，与第一次相同时直接返回第一次的结果，不再处理请求体
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key:
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            return jsonify({
+                "retcode": 1,
+                "message": "Idempotency-Key is too long",
+                "data": None
+            }), 400
+        existing = begin_request(user_id, UPLOAD_SCOPE, idempotency_key)
+        if existing and existing['state'] == 'done':
+            try:
+                body_hash = request_hash(iter_request_chunks(request.stream, request.headers.get('Content-Encoding')))
+            except ValueError as e:
+                logger.warning(f"Invalid gacha log upload body for user_id: {user_id}: {e}")
+                return jsonify({
+                    "retcode": 1,
+                    "message": "Invalid request body",
+                    "data": None
+                }), 400
+            if not matches_request(existing, body_hash):
+                logger.warning(f"Idempotency key reused with a different body for user_id: {user_id}")
+                return jsonify({
+                    "retcode": 3,
+                    "message": "Idempotency-Key was already used with a different request body",
+                    "data": None
+                }), 422
+            return jsonify(existing['response'])
+        if existing:
+            return jsonify({
+                "retcode": 3,
+                "message": "An upload with the same Idempotency-Key is in progress",
+                "data": None
+            }), 409
+
+    # 边读取（必要时边解压）边解析请求体，Items 逐条交给上传逻辑分批写入
+    uid = ''
+    pending_items = None
+    message = None
+    # 解析时读取整个请求体（包括对象之后的空白），读取的同时计算摘要
+    body_digest = hashlib.sha256()
+    try:
+        chunks = hash_chunks(iter_request_chunks(request.stream, request.headers.get('Content-Encoding')), body_digest)
+        for key, value in iter_json_object(chunks, stream_keys=("Items",)):
+            if key == 'Uid':
+                uid = value
+            elif key == 'Items' and uid:
+                message = upload_gacha_log_stream(user_id, uid, value)
+            elif key == 'Items':
+                # Uid 在 Items 之后时只能先缓存记录
+                pending_items = [decode_item(item) for item in value]
+        if message is None:
+            message = upload_gacha_log(user_id, uid, pending_items or [])
+    except ValueError as e:
+        if idempotency_key:
+            abandon_request(user_id, UPLOAD_SCOPE, idempotency_key)
+        logger.warning(f"Invalid gacha log upload body for user_id: {user_id}: {e}")
+        return jsonify({
+            "retcode": 1,
+            "message": "Invalid request body",
+            "data": None
+        }), 400
+    except Exception:
+        if idempotency_key:
+            abandon_request(user_id, UPLOAD_SCOPE, idempotency_key)
+        raise
+
     logger.info(f"Gacha log upload for user_id: {user_id}, uid: {uid}")
     
-    return jsonify({
+    response = {
         "retcode": 0,
         "message": message,
         "data": None
+    }
+    if idempotency_key:
+        complete_request(user_id, UPLOAD_SCOPE, idempotency_key, response,
+                         config_loader.GACHA_LOG_IDEMPOTENCY_WINDOW_MINUTES, body_digest.hexdigest())
+    return jsonify(response)
+
+
+@gacha_log_bp.route('/GachaLog/Upload/Batch', methods=['POST'])
+def gacha_log_upload_batch():
+    """一次上传多个 UID 的祈愿记录，请求体为 {"Logs": [{"Uid": ..., "Items": [...]}]}，可以使用 gzip 压缩"""
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    user_id = verify_token(token)
+    
+    if not user_id:
+        logger.warning("Invalid or expired token")
+        return jsonify({
+            "retcode": 1,
+            "message": "Invalid or expired token",
+            "data": None
+        }), 401
+    
+    results = []
+    try:
+        chunks = iter_request_chunks(request.stream, request.headers.get('Content-Encoding'))
+        for key, value in iter_json_object(chunks, {"Logs": {"Items": None}}):
+            if key != 'Logs':
+                continue
+            # 流式解析的数组和对象以迭代器产出，其他类型的值直接产出
+            if not isinstance(value, Iterator):
+                raise ValueError("Logs must be an array")
+            for log in value:
+                if not isinstance(log, Iterator):
+                    raise ValueError("each log must be an object")
+                if len(results) >= MAX_BATCH_UIDS:
+                    raise ValueError(f"too many uids, at most {MAX_BATCH_UIDS}")
+                uid = ''
+                pending_items = None
+                message = None
+                for field, field_value in log:
+                    if field == 'Items' and not isinstance(field_value, Iterator):
+                        raise ValueError("Items must be an array")
+                    if field == 'Uid':
+                        uid = field_value
+                    elif field == 'Items' and uid:
+                        message = upload_gacha_log_stream(user_id, uid, field_value)
+                    elif field == 'Items':
+                        pending_items = [decode_item(item) for item in field_value]
+                if message is None:
+                    message = upload_gacha_log(user_id, uid, pending_items or [])
+                results.append({"Uid": uid, "Message": message})
+    except ValueError as e:
+        logger.warning(f"Invalid gacha log upload batch body for user_id: {user_id}: {e}")
+        return jsonify({
+            "retcode": 1,
+            "message": "Invalid request body",
+            "data": results or None
+        }), 400
+
+    logger.info(f"Gacha log batch upload for user_id: {user_id}, uids: {[result['Uid'] for result in results]}")
+    
+    return jsonify({
+        "retcode": 0,
+        "message": f"success, uploaded {len(results)} uid(s)",
+        "data": results
     })
 
 
@@ -113,13 +318,30 @@ def gacha_log_retrieve():
             "data": None
         }), 401
     
-    data = request.get_json()
-    uid = data.get('Uid', '')
-    end_ids = data.get('EndIds', {})
+    try:
+        data = decode_request(request.get_data(), RetrieveRequest)
+    except ValueError as e:
+        logger.warning(f"Invalid gacha log retrieve body for user_id: {user_id}: {e}")
+        return jsonify({
+            "retcode": 1,
+            "message": "Invalid request body",
+            "data": None
+        }), 400
+    uid = data.Uid
+    end_ids = data.EndIds
     
+    logger.debug(f"end_ids: {end_ids}")
+
+    if config_loader.GACHA_LOG_STREAM_RETRIEVE:
+        # 流式输出，记录直接从游标序列化发送，内存占用与账号记录总量无关
+        def message(count):
+            logger.info(f"Gacha log retrieved for user_id: {user_id}, uid: {uid}, items count: {count}")
+            return f"success, retrieved {count} items"
+
+        return stream_json_response(iter_gacha_log(user_id, uid, end_ids), message)
+
     filtered_items = retrieve_gacha_log(user_id, uid, end_ids)
     logger.info(f"Gacha log retrieved for user_id: {user_id}, uid: {uid}, items count: {len(filtered_items)}")
-    logger.debug(f"end_ids: {end_ids}")
     
     return jsonify({
         "retcode": 0,
@@ -128,6 +350,168 @@ def gacha_log_retrieve():
     })
 
 
+@gacha_log_bp.route('/GachaLog/Retrieve/Batch', methods=['POST'])
+def gacha_log_retrieve_batch():
+    """一次检索多个 UID 的祈愿记录，返回的每条记录带有 Uid 字段"""
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    user_id = verify_token(token)
+    
+    if not user_id:
+        logger.warning("Invalid or expired token")
+        return jsonify({
+            "retcode": 1,
+            "message": "Invalid or expired token",
+            "data": None
+        }), 401
+    
+    try:
+        data = decode_request(request.get_data(), RetrieveBatchRequest)
+    except ValueError as e:
+        logger.warning(f"Invalid gacha log retrieve batch body for user_id: {user_id}: {e}")
+        return jsonify({
+            "retcode": 1,
+            "message": "Invalid request body",
+            "data": None
+        }), 400
+
+    end_ids_by_uid = {retrieve.Uid: retrieve.EndIds for retrieve in data.Requests}
+
+    def message(count):
+        logger.info(f"Gacha log batch retrieved for user_id: {user_id}, uids: {list(end_ids_by_uid)}, "
+                    f"items count: {count}")
+        return f"success, retrieved {count} items"
+
+    return stream_json_response(iter_gacha_log_batch(user_id, end_ids_by_uid), message)
+
+
+@gacha_log_bp.route('/GachaLog/Sync', methods=['POST'])
+def gacha_log_sync():
+    """按同步令牌增量同步祈愿记录，只返回令牌之后上传的记录"""
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    user_id = verify_token(token)
+    
+    if not user_id:
+        logger.warning("Invalid or expired token")
+        return jsonify({
+            "retcode": 1,
+            "message": "Invalid or expired token",
+            "data": None
+        }), 401
+    
+    try:
+        data = decode_request(request.get_data(), SyncRequest)
+    except ValueError as e:
+        logger.warning(f"Invalid gacha log sync body for user_id: {user_id}: {e}")
+        return jsonify({
+            "retcode": 1,
+            "message": "Invalid request body",
+            "data": None
+        }), 400
+    uid = data.Uid
+    sync_token = data.SyncToken
+
+    new_token, full, items = sync_gacha_log(user_id, uid, sync_token)
+
+    def message(count):
+        logger.info(f"Gacha log synced for user_id: {user_id}, uid: {uid}, full: {full}, items count: {count}")
+        return f"success, synced {count} items"
+
+    return stream_json_response(items, message, extra={"SyncToken": new_token, "Full": full})
+
+
+@gacha_log_bp.route('/GachaLog/Analytics', methods=['GET'])
+def gacha_log_analytics():
+    """获取指定 UID 的保底、出金间隔和平均出金抽数"""
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    user_id = verify_token(token)
+    
+    if not user_id:
+        logger.warning("Invalid or expired token")
+        return jsonify({
+            "retcode": 1,
+            "message": "Invalid or expired token",
+            "data": None
+        }), 401
+    
+    uid = request.args.get('Uid', '')
+    analytics = get_gacha_log_analytics(user_id, uid)
+    
+    if analytics is None:
+        logger.info(f"No gacha log found for analytics, user_id: {user_id}, uid: {uid}")
+        return jsonify({
+            "retcode": 2,
+            "message": "no gacha log found",
+            "data": None
+        })
+    
+    logger.info(f"Gacha log analytics retrieved for user_id: {user_id}, uid: {uid}")
+    return jsonify({
+        "retcode": 0,
+        "message": "success",
+        "data": analytics
+    })
+
+
+@gacha_log_bp.route('/GachaLog/UIGF/Export', methods=['GET'])
+def gacha_log_uigf_export():
+    """以 UIGF v4.0 格式导出祈愿记录，不指定 Uid 时导出全部 UID"""
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    user_id = verify_token(token)
+    
+    if not user_id:
+        logger.warning("Invalid or expired token")
+        return jsonify({
+            "retcode": 1,
+            "message": "Invalid or expired token",
+            "data": None
+        }), 401
+    
+    uid = request.args.get('Uid', '')
+    uids = [uid] if uid else [entry['Uid'] for entry in get_gacha_log_entries(user_id)]
+    logger.info(f"Gacha log UIGF export for user_id: {user_id}, uids: {uids}")
+
+    chunks = iter_uigf_export(user_id, uids)
+    headers = {"Content-Disposition": f'attachment; filename="uigf_{uid or "all"}.json"'}
+    # 客户端支持时边压缩边输出
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        chunks = gzip_stream(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return Response(stream_with_context(chunks), mimetype="application/json", headers=headers)
+
+
+@gacha_log_bp.route('/GachaLog/UIGF/Import', methods=['POST'])
+def gacha_log_uigf_import():
+    """导入 UIGF 格式（v3/v4）的祈愿记录，请求体可以使用 gzip 压缩"""
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    user_id = verify_token(token)
+    
+    if not user_id:
+        logger.warning("Invalid or expired token")
+        return jsonify({
+            "retcode": 1,
+            "message": "Invalid or expired token",
+            "data": None
+        }), 401
+    
+    try:
+        chunks = iter_request_chunks(request.stream, request.headers.get('Content-Encoding'))
+        results = import_uigf(user_id, chunks)
+    except ValueError as e:
+        logger.warning(f"Invalid UIGF import body for user_id: {user_id}: {e}")
+        return jsonify({
+            "retcode": 1,
+            "message": f"Invalid UIGF data: {e}",
+            "data": None
+        }), 400
+
+    logger.info(f"Gacha log UIGF import for user_id: {user_id}, uids: {[result['Uid'] for result in results]}")
+    return jsonify({
+        "retcode": 0,
+        "message": f"success, imported {len(results)} uid(s)",
+        "data": results
+    })
+
+
 @gacha_log_bp.route('/GachaLog/Delete', methods=['GET'])
 def gacha_log_delete():
     """删除用户的祈愿记录"""
@@ -1,23 +1,38 @@
 import datetime
-from bson import ObjectId
 from flask import Blueprint, request, jsonify
-from app.utils.jwt_utils import verify_token, create_token
-from services.auth_service import verify_user_credentials, get_users_with_search
-from app.decorators import require_maintainer_permission
+from app.utils.jwt_utils import verify_token, create_token, token_cache_stats
+from app.utils.password_hasher import PasswordHasherBusy
+from services.auth_service import (
+    verify_user_credentials, get_users_with_search, get_user_by_id, user_cache_stats
+)
+from app.decorators import require_maintainer_permission, rate_limit, check_rate_limit
 from app.extensions import generate_numeric_id, client, logger, config_loader
 
 web_api_bp = Blueprint("web_api", __name__)
 
 
 @web_api_bp.route('/web-api/login', methods=['POST'])
+@rate_limit("web_login", response_key="code")
 def web_api_login():
     """Web管理端登录"""
     data = request.get_json()
     email = data.get('email', '')
     password = data.get('password', '')
     
+    limited = check_rate_limit("web_login", "EMAIL", email, response_key="code")
+    if limited:
+        return limited
+
     # 验证用户凭据
-    user = verify_user_credentials(email, password)
+    try:
+        user = verify_user_credentials(email, password)
+    except PasswordHasherBusy as e:
+        logger.warning(f"Web login rejected: {e}")
+        return jsonify({
+            "code": 1,
+            "message": "Server is busy, please try again later",
+            "data": None
+        }), 503
     
     if not user:
         logger.warning(f"Invalid web login attempt for email: {email}")
@@ -229,7 +244,7 @@ def web_api_get_users():
         }), 401
 
     # 检查用户是否具有高权限
-    user = client.ht_server.users.find_one({"_id": ObjectId(user_id)})
+    user = get_user_by_id(user_id)
     if not user or not (user.get("IsMaintainer", False) and user.get("IsLicensedDeveloper", False)):
         logger.warning(f"User {user_id} does not have required permissions")
         logger.debug(f"User details: {user}")
@@ -253,4 +268,18 @@ def web_api_get_users():
         "code": 0,
         "message": "success",
         "data": users
-    })
\ No newline at end of file
+    })
+
+
+@web_api_bp.route('/web-api/cache-stats', methods=['GET'])
+@require_maintainer_permission
+def web_api_cache_stats():
+    """当前服务进程的缓存命中统计"""
+    return jsonify({
+        "code": 0,
+        "message": "success",
+        "data": {
+            "token": token_cache_stats(),
+            "user": user_cache_stats()
+        }
+    })
@@ -1,21 +1,13 @@
-from app.init import create_app
 from app.config_loader import config_loader
-import sentry_sdk
 
-sentry_sdk.init(
-    dsn="https://d1cad1d2b442cf8431df3ee4bab925e0@o4507525750521856.ingest.us.sentry.io/4510623668830208",
-    # Add data like request headers and IP for users,
-    # see https://docs.sentry.io/platforms/python/data-management/data-collected/ for more info
-    send_default_pii=True,
-    traces_sample_rate=1.0,
-)
-
-# 创建应用实例
-app = create_app()
+# 密码哈希进程池的子进程会以 __mp_main__ 的名称重新导入入口脚本，子进程中不能创建应用，
+# 否则每个子进程都会连接数据库并启动后台任务；Gunicorn 以 run:app 加载和直接运行时照常创建应用
+if __name__ != '__mp_main__':
+    from wsgi import app
 
 if __name__ == '__main__':
     app.run(
         host=config_loader.SERVER_HOST,
         port=config_loader.SERVER_PORT,
         debug=config_loader.SERVER_DEBUG
-    )
\ No newline at end of file
+    )
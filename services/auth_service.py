@@ -1,33 +1,44 @@
 from bson import ObjectId
-from werkzeug.security import generate_password_hash, check_password_hash
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
 from app.extensions import client, logger
 from app.config import Config
 from app.config_loader import config_loader
-from Crypto.Cipher import PKCS1_OAEP
-from Crypto.PublicKey import RSA
+from app.utils.rsa_engine import RSADecryptor
+from app.utils.password_hasher import PasswordHasher, PasswordHasherBusy
+from app.utils.cache import LRUCache
+from services.mail_outbox_service import enqueue_mail
 from datetime import timezone
 from zoneinfo import ZoneInfo
 import datetime
-import SendEmailTool
 import re
-import base64
+import threading
+import time
+
+# 私钥在进程内缓存，文件变化时自动重新加载
+_decryptor = RSADecryptor(config_loader.RSA_PRIVATE_KEY_FILES)
+
+# 密码哈希在进程池中执行，进程池已满时抛出 PasswordHasherBusy
+_hasher = PasswordHasher(config_loader.PASSWORD_HASH_POOL_WORKERS, config_loader.PASSWORD_HASH_MAX_PENDING,
+                         config_loader.PASSWORD_HASH_METHOD)
+
+# 按 _id 缓存的用户文档（不含密码哈希），用于权限检查和 UserInfo。
+# 用户文档被修改或删除时通过 change stream 失效；MongoDB 不支持 change stream 时只依靠缓存有效期
+_user_cache = LRUCache(max_size=config_loader.USER_CACHE_SIZE, ttl_seconds=config_loader.USER_CACHE_TTL_SECONDS)
+_user_watch_started = False
+_user_watch_lock = threading.Lock()
+
 
 def decrypt_data(encrypted_data: str) -> str:
     """使用RSA私钥解密数据"""
     try:
-        private_key_file = config_loader.RSA_PRIVATE_KEY_FILE
-        with open(private_key_file, 'r') as f:
-            private_key = RSA.import_key(f.read())
-        cipher = PKCS1_OAEP.new(private_key)
-        decrypted_data = cipher.decrypt(base64.b64decode(encrypted_data))
-        return decrypted_data.decode()
+        return _decryptor.decrypt(encrypted_data)
     except Exception as e:
         logger.error(f"Decryption error: {e}")
         raise
 
 
 def send_verification_email(email: str, code: str, ACTION_NAME="注册", EXPIRE_MINUTES=None) -> bool:
-    """发送验证码邮件，目前只有注册场景，后续再扩展其他场景"""
+    """发送验证码邮件（写入发件箱），目前只有注册场景，后续再扩展其他场景"""
     try:
         subject = Config.EMAIL_SUBJECT
         textbody = f"您的验证码是: {code}"
@@ -121,55 +132,70 @@ def send_verification_email(email: str, code: str, ACTION_NAME="注册", EXPIRE_
 </html>
 
         """
-        try:
-            SendEmailTool.send_email(
-                config_loader.EMAIL_GMAIL_USER,
-                config_loader.EMAIL_APP_PASSWORD,
-                email,
-                subject,
-                htmlbody,
-                app_name=APP_NAME,
-                body_type="html"
-            )
-            logger.info(f"HTML Verification email sent to {email}")
-        except Exception as e:
-            logger.error(f"Failed to send HTML verification email to {email}: {e}")
-            # 如果 HTML 邮件发送失败，尝试发送纯文本邮件
-            SendEmailTool.send_email(
-                config_loader.EMAIL_GMAIL_USER,
-                config_loader.EMAIL_APP_PASSWORD,
-                email,
-                subject,
-                textbody,
-                app_name=APP_NAME,
-                body_type="plain"
-            )
-            logger.info(f"Verification email sent to {email}")
+        # 写入发件箱后立即返回，由后台线程发送，验证码过期后不再发送
+        enqueue_mail(email, subject, htmlbody, textbody, app_name=APP_NAME, expire_minutes=EXPIRE_MINUTES)
+        logger.info(f"Verification email queued for {email}")
         return True
     except Exception as e:
-        logger.error(f"Failed to send email: {e}")
+        logger.error(f"Failed to queue email: {e}")
         return False
 
 
 def verify_user_credentials(email: str, password: str) -> dict | None:
-    """验证用户凭据"""
+    """
+    验证用户凭据
+
+    :raises PasswordHasherBusy: 密码哈希进程池已满
+    """
     user = client.ht_server.users.find_one({"email": email})
     
-    if not user or not check_password_hash(user['password'], password):
+    if not user or not _hasher.verify(user['password'], password):
         return None
+
+    if _hasher.needs_rehash(user['password']):
+        _rehash_password(user, password)
     
     return user
 
 
+def _rehash_password(user: dict, password: str):
+    """登录成功后用当前的哈希参数重新计算密码哈希，只在密码未被修改时保存"""
+    try:
+        hashed_password = _hasher.hash(password)
+    except PasswordHasherBusy:
+        # 不影响本次登录，下次登录时再更新
+        return
+    result = client.ht_server.users.update_one(
+        {"_id": user['_id'], "password": user['password']},
+        {"$set": {"password": hashed_password}}
+    )
+    if result.modified_count:
+        user['password'] = hashed_password
+        logger.info(f"Password rehashed with {_hasher.method} for user_id: {user['_id']}")
+
+
+def reserve_password_hash():
+    """
+    预先占用密码哈希进程池的一个名额，在消耗验证码等不可撤销的操作之前确认可以计算哈希
+
+    :raises PasswordHasherBusy: 密码哈希进程池已满
+    """
+    return _hasher.reserve()
+
+
 def create_user_account(email: str, password: str) -> dict | None:
-    """创建新用户账户"""
-    # 检查用户是否已存在
-    existing_user = client.ht_server.users.find_one({"email": email})
-    if existing_user:
+    """
+    创建新用户账户
+
+    :raises PasswordHasherBusy: 密码哈希进程池已满
+    """
+    # 已有重复邮箱时 users.email 的唯一索引无法建立（见 app.schema），不能只依赖索引判断用户是否存在；
+    # 先检查也避免为已注册的邮箱计算哈希
+    if client.ht_server.users.find_one({"email": email}, {"_id": 1}):
         return None
-    
+
     # 对密码进行哈希处理
-    hashed_password = generate_password_hash(password)
+    hashed_password = _hasher.hash(password)
         
     # 创建新用户
     new_user = {
@@ -185,16 +211,76 @@ def create_user_account(email: str, password: str) -> dict | None:
         "CdnExpireAt": "2099-01-01T00:00:00Z"
     }
     
-    result = client.ht_server.users.insert_one(new_user)
+    # email 有唯一索引时，并发注册同一邮箱的请求只有一个能插入成功
+    try:
+        result = client.ht_server.users.insert_one(new_user)
+    except DuplicateKeyError:
+        return None
     new_user['_id'] = result.inserted_id
     
     return new_user
 
 
+def get_cached_user(user_id: str) -> dict | None:
+    """
+    根据ID获取用户文档（不含密码哈希），优先使用进程内缓存，返回的字典可以修改
+
+    :raises bson.errors.InvalidId: user_id 不是有效的 ObjectId
+    """
+    user = _user_cache.get(user_id)
+    if user is None:
+        user = client.ht_server.users.find_one({"_id": ObjectId(user_id)}, {"password": 0})
+        if user is None:
+            return None
+        _user_cache.set(user_id, user)
+    return dict(user)
+
+
+def invalidate_user_cache(user_id: str | None = None):
+    """使用户缓存失效，user_id 为 None 时清空所有缓存"""
+    if user_id is None:
+        _user_cache.clear()
+    else:
+        _user_cache.pop(str(user_id))
+
+
+def user_cache_stats() -> dict:
+    """用户缓存的条目数和命中次数"""
+    return _user_cache.stats()
+
+
+def _watch_user_changes():
+    pipeline = [{"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}}]
+    while True:
+        try:
+            with client.ht_server.users.watch(pipeline) as stream:
+                # 重新开始监听前的变更可能已经错过
+                invalidate_user_cache()
+                for change in stream:
+                    invalidate_user_cache(change['documentKey']['_id'])
+        except OperationFailure as e:
+            # 单节点 MongoDB 不支持 change stream
+            logger.warning(f"User change stream unavailable, user cache relies on TTL only: {e}")
+            return
+        except PyMongoError as e:
+            logger.error(f"User change stream failed: {e}")
+            time.sleep(5)
+
+
+def start_user_cache_invalidation():
+    """启动监听用户文档变更的后台线程，每个进程只启动一次"""
+    global _user_watch_started
+    with _user_watch_lock:
+        if _user_watch_started:
+            return
+        _user_watch_started = True
+    threading.Thread(target=_watch_user_changes, name="user-cache-invalidation", daemon=True).start()
+
+
 def get_user_by_id(user_id: str) -> dict | None:
-    """根据ID获取用户信息"""
+    """根据ID获取用户信息（不含密码哈希）"""
     try:
-        user = client.ht_server.users.find_one({"_id": ObjectId(user_id)})
+        user = get_cached_user(user_id)
         if user:
             user['_id'] = str(user['_id'])
         return user
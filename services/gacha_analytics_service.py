@@ -0,0 +1,96 @@
+import numpy as np
+from app.utils.cache import LRUCache
+from services.gacha_log_service import iter_gacha_log, get_gacha_log_summary
+from services.gacha_statistics_service import five_star_avatar_ids, warn_unknown_avatar_id
+
+"""
+单个 UID 的保底与出金分析，客户端无需下载完整记录即可获得。
+按祈愿类型（QueryType，400 归入 301）把记录转换为 NumPy 数组后整体计算，不逐条循环。
+结果按 (user_id, Uid) 缓存在进程内，汇总文档的最后上传时间和总条数变化后失效。
+"""
+
+# 按 QueryType 统计的祈愿类型
+BANNER_TYPES = (100, 200, 301, 302, 500)
+
+_cache = LRUCache(max_size=1024)
+
+
+def _to_arrays(items) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """把记录转换为 (QueryType, Id, ItemId) 三个 int64 数组，无法转换为整数的记录跳过"""
+    query_types = []
+    ids = []
+    item_ids = []
+    for item in items:
+        try:
+            gacha_type = int(item.get('GachaType'))
+            item_id = int(item.get('Id'))
+            item_item_id = int(item.get('ItemId'))
+        except (TypeError, ValueError):
+            continue
+        query_types.append(301 if gacha_type == 400 else gacha_type)
+        ids.append(item_id)
+        item_ids.append(item_item_id)
+    return (
+        np.asarray(query_types, dtype=np.int64),
+        np.asarray(ids, dtype=np.int64),
+        np.asarray(item_ids, dtype=np.int64)
+    )
+
+
+def _five_star_mask(item_ids: np.ndarray, avatar_ids: np.ndarray) -> np.ndarray:
+    """武器ID为5位数，百位是星级；角色按五星角色表判断"""
+    is_weapon = (item_ids >= 10000) & (item_ids < 100000)
+    return np.where(is_weapon, (item_ids // 100) % 10 == 5, np.isin(item_ids, avatar_ids))
+
+
+def compute_gacha_analytics(items, avatar_ids) -> dict:
+    """
+    计算各祈愿类型的保底与出金数据。
+
+    :param items: 记录迭代器
+    :param avatar_ids: 五星角色ID集合（frozenset）
+    :return: {QueryType: {TotalPulls, FiveStarCount, CurrentPity, FiveStarIntervals, AveragePullsPerFiveStar,
+             MinPullsPerFiveStar, MaxPullsPerFiveStar}}
+    """
+    query_types, ids, item_ids = _to_arrays(items)
+    avatar_array = np.fromiter(avatar_ids, dtype=np.int64, count=len(avatar_ids))
+    five_star = _five_star_mask(item_ids, avatar_array)
+    for item_id in np.unique(item_ids[~five_star]).tolist():
+        warn_unknown_avatar_id(item_id, avatar_ids)
+
+    result = {}
+    for banner in BANNER_TYPES:
+        mask = query_types == banner
+        total = int(np.count_nonzero(mask))
+        # 按 Id 排序即为抽取顺序
+        order = np.argsort(ids[mask], kind="stable")
+        positions = np.flatnonzero(five_star[mask][order])
+        # 每次出金距上一次出金（或第一抽之前）的抽数
+        intervals = np.diff(positions, prepend=-1)
+        result[str(banner)] = {
+            "TotalPulls": total,
+            "FiveStarCount": int(positions.size),
+            "CurrentPity": int(total - 1 - positions[-1]) if positions.size else total,
+            "FiveStarIntervals": intervals.tolist(),
+            "AveragePullsPerFiveStar": round(float(intervals.mean()), 2) if intervals.size else None,
+            "MinPullsPerFiveStar": int(intervals.min()) if intervals.size else None,
+            "MaxPullsPerFiveStar": int(intervals.max()) if intervals.size else None
+        }
+    return result
+
+
+def get_gacha_log_analytics(user_id, uid) -> dict | None:
+    """获取指定 UID 的分析结果，没有记录时返回 None"""
+    summary = get_gacha_log_summary(user_id, uid)
+    if not summary:
+        return None
+
+    key = (user_id, uid)
+    stamp = (summary.get('LastUploadAt'), summary.get('ItemCount'))
+    cached = _cache.get(key)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    result = compute_gacha_analytics(iter_gacha_log(user_id, uid, {}), five_star_avatar_ids())
+    _cache.set(key, (stamp, result))
+    return result
@@ -0,0 +1,324 @@
+import datetime
+import json
+import sys
+import zlib
+from array import array
+
+"""
+祈愿记录的列式压缩编码，用于 GACHA_LOG.STORAGE_MODE = columnar 存储模式。
+
+每个块保存若干条记录，按字段拆分为列后分别编码，再整体 zlib 压缩：
+- 整数列（如 Id）：取值分散时使用差分编码的 int64 数组
+- 取值重复较多的列（如 GachaType、QueryType、ItemId）：字典编码，只保存一份取值和下标数组
+- 时间列（如 Time）：解析为秒级时间戳，保存相对块内最小值的整数偏移，时区和输出格式字典编码
+- 其他无法识别的列退化为字典编码，保证任意 JSON 记录都能原样还原
+
+解码结果与编码前的记录完全一致（字段顺序、类型、时间字符串格式），不依赖应用上下文，可直接运行本模块做基准测试：
+python -m services.gacha_log_codec
+"""
+
+MAGIC = b"GLC1"
+COMPRESS_LEVEL = 6
+
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _index_typecode(size: int) -> str:
+    if size <= 0xFF:
+        return "B"
+    if size <= 0xFFFF:
+        return "H"
+    return "I"
+
+
+def _dictionary(values) -> tuple[list, list]:
+    """字典编码：返回 (去重后的取值列表, 每行对应的下标列表)"""
+    values = list(values)
+    # 键中带上类型，区分 1、1.0 和 True 这类相等但类型不同的取值；列表和字典不可哈希，使用其 JSON 文本
+    if any(isinstance(v, (list, dict)) for v in values):
+        keys = [
+            (dict, json.dumps(v, ensure_ascii=False)) if isinstance(v, (list, dict)) else (_value_class(v), v)
+            for v in values
+        ]
+    else:
+        keys = [(_value_class(v), v) for v in values]
+
+    lookup = {}
+    indexes = [lookup.setdefault(key, len(lookup)) for key in keys]
+    if len(lookup) == len(values):
+        return values, indexes
+    dictionary = [None] * len(lookup)
+    for value, index in zip(values, indexes):
+        dictionary[index] = value
+    return dictionary, indexes
+
+
+def _is_int(value) -> bool:
+    # pymongo 把 int64 字段读取为 int 的子类 bson.int64.Int64，同样按整数编码；bool 也是 int 的子类，需要排除
+    return isinstance(value, int) and not isinstance(value, bool) and _INT64_MIN <= value <= _INT64_MAX
+
+
+def _value_class(value) -> type:
+    """字典编码区分取值时使用的类型，Int64 与 int 视为同一类型"""
+    return int if _is_int(value) else value.__class__
+
+
+_TIME_SEPARATORS = ("T", " ")
+
+
+def _parse_time(value):
+    """把时间字符串解析为 (时间戳, 时区偏移秒数或 None, 输出格式下标)，无法原样还原时返回 None"""
+    if type(value) is not str:
+        return None
+    try:
+        dt = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if dt.microsecond or len(value) < 19 or value[10] not in _TIME_SEPARATORS:
+        return None
+    separator = _TIME_SEPARATORS.index(value[10])
+    # 客户端的 "yyyy-MM-ddTHH:mm:ss+08:00" 格式必然能原样还原，其余格式需要逐条校验
+    client_format = len(value) == 25 and value[19] in "+-" and value[16] == ":" and value[22] == ":"
+    if not client_format and dt.isoformat(_TIME_SEPARATORS[separator]) != value:
+        return None
+    offset = dt.utcoffset()
+    if offset is None:
+        return int((dt - _EPOCH).total_seconds()), None, separator
+    if offset.microseconds:
+        return None
+    return int(dt.timestamp()), int(offset.total_seconds()), separator
+
+
+def _time_suffix(offset) -> str:
+    if offset is None:
+        return ""
+    sign = "-" if offset < 0 else "+"
+    hours, rest = divmod(abs(offset), 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{sign}{hours:02d}:{minutes:02d}" + (f":{seconds:02d}" if seconds else "")
+
+
+class _Writer:
+    """收集各列的数组，最终拼接为连续的二进制数据"""
+
+    def __init__(self):
+        self.arrays = []
+
+    def put(self, typecode: str, values) -> int:
+        data = array(typecode, values)
+        if sys.byteorder == "big":
+            data.byteswap()
+        self.arrays.append(data)
+        return len(self.arrays) - 1
+
+    def put_dictionary(self, values) -> dict:
+        dictionary, indexes = _dictionary(values)
+        spec = {"kind": "dict", "values": dictionary}
+        # 只有一种取值时不需要下标数组
+        if len(dictionary) > 1:
+            spec["index"] = self.put(_index_typecode(len(dictionary)), indexes)
+        return spec
+
+
+class _Reader:
+    def __init__(self, layout: list, body: memoryview):
+        self.arrays = []
+        position = 0
+        for typecode, length in layout:
+            data = array(typecode)
+            size = data.itemsize * length
+            data.frombytes(body[position:position + size])
+            if sys.byteorder == "big":
+                data.byteswap()
+            self.arrays.append(data)
+            position += size
+
+    def get_dictionary(self, spec: dict, count: int) -> list:
+        values = spec["values"]
+        if "index" not in spec:
+            return values * count
+        return [values[i] for i in self.arrays[spec["index"]]]
+
+
+def _encode_column(writer: _Writer, values: list) -> dict:
+    count = len(values)
+    if all(_is_int(v) for v in values):
+        distinct = len(set(values))
+        # 取值重复较多（GachaType、ItemId 等）时字典编码，否则（Id 等）差分编码
+        if distinct > 256 and distinct * 4 > count:
+            deltas = [values[0]]
+            deltas.extend(values[i] - values[i - 1] for i in range(1, count))
+            if all(_INT64_MIN <= d <= _INT64_MAX for d in deltas):
+                return {"kind": "delta", "data": writer.put("q", deltas)}
+
+    parsed = [_parse_time(v) for v in values] if type(values[0]) is str else None
+    if parsed and all(p is not None for p in parsed):
+        base = min(p[0] for p in parsed)
+        return {
+            "kind": "time",
+            "base": base,
+            "data": writer.put("q", [p[0] - base for p in parsed]),
+            "offset": writer.put_dictionary([p[1] for p in parsed]),
+            "format": writer.put_dictionary([p[2] for p in parsed])
+        }
+
+    return writer.put_dictionary(values)
+
+
+def _decode_column(reader: _Reader, spec: dict, count: int) -> list:
+    kind = spec["kind"]
+    if kind == "delta":
+        values = []
+        current = 0
+        for delta in reader.arrays[spec["data"]]:
+            current += delta
+            values.append(current)
+        return values
+    if kind == "time":
+        base = spec["base"]
+        offsets = reader.get_dictionary(spec["offset"], count)
+        formats = reader.get_dictionary(spec["format"], count)
+        suffixes = {offset: _time_suffix(offset) for offset in set(offsets)}
+        timedelta = datetime.timedelta
+        return [
+            (_EPOCH + timedelta(seconds=base + seconds + (offset or 0))).isoformat(_TIME_SEPARATORS[separator])
+            + suffixes[offset]
+            for seconds, offset, separator in zip(reader.arrays[spec["data"]], offsets, formats)
+        ]
+    return reader.get_dictionary(spec, count)
+
+
+def encode_block(items: list) -> bytes:
+    """把一组记录编码为一个压缩列式块"""
+    writer = _Writer()
+    shapes, shape_indexes = _dictionary(tuple(item) for item in items)
+    header = {
+        "count": len(items),
+        "shapes": [list(shape) for shape in shapes],
+        "columns": {}
+    }
+    if len(shapes) > 1:
+        header["shape_index"] = writer.put(_index_typecode(len(shapes)), shape_indexes)
+
+    keys = list(dict.fromkeys(key for shape in shapes for key in shape))
+    for key in keys:
+        # 缺少该字段的行填 None，解码时按 shape 跳过
+        values = [item.get(key) for item in items]
+        header["columns"][key] = _encode_column(writer, values)
+
+    header["layout"] = [(data.typecode, len(data)) for data in writer.arrays]
+    header_bytes = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode()
+    body = b"".join(data.tobytes() for data in writer.arrays)
+    raw = len(header_bytes).to_bytes(4, "little") + header_bytes + body
+    return MAGIC + zlib.compress(raw, COMPRESS_LEVEL)
+
+
+def _open_block(blob: bytes) -> tuple[dict, _Reader]:
+    if blob[:4] != MAGIC:
+        raise ValueError("Not a gacha log columnar block")
+    raw = memoryview(zlib.decompress(blob[4:]))
+    header_size = int.from_bytes(raw[:4], "little")
+    header = json.loads(bytes(raw[4:4 + header_size]))
+    return header, _Reader(header["layout"], raw[4 + header_size:])
+
+
+def decode_block(blob: bytes) -> list:
+    """把压缩列式块解码为与编码前完全一致的记录列表"""
+    header, reader = _open_block(blob)
+    count = header["count"]
+    columns = {
+        key: _decode_column(reader, spec, count)
+        for key, spec in header["columns"].items()
+    }
+    shapes = header["shapes"]
+    if "shape_index" not in header:
+        keys = shapes[0] if shapes else []
+        column_values = [columns[key] for key in keys]
+        return [dict(zip(keys, row)) for row in zip(*column_values)] if keys else [{} for _ in range(count)]
+
+    shape_indexes = reader.arrays[header["shape_index"]]
+    return [
+        {key: columns[key][row] for key in shapes[shape_indexes[row]]}
+        for row in range(count)
+    ]
+
+
+def decode_block_ids(blob: bytes) -> list:
+    """只解码块中的 Id 列，用于去重判断，缺少 Id 的记录返回 None"""
+    header, reader = _open_block(blob)
+    spec = header["columns"].get("Id")
+    if spec is None:
+        return [None] * header["count"]
+    return _decode_column(reader, spec, header["count"])
+
+
+def encode_blocks(items: list, block_size: int) -> list:
+    """按 block_size 分块编码"""
+    return [encode_block(items[i:i + block_size]) for i in range(0, len(items), block_size)]
+
+
+def _sample_items(count: int) -> list:
+    """生成与客户端上传格式一致的模拟记录"""
+    import random
+    rng = random.Random(20240101)
+    tz = datetime.timezone(datetime.timedelta(hours=8))
+    moment = datetime.datetime(2021, 9, 28, 12, 0, 0, tzinfo=tz)
+    item_pool = [10000000 + i for i in range(2, 100)] + [11000 + i * 100 + j for i in range(1, 6) for j in range(1, 30)]
+    next_id = 1632812400000000000
+    items = []
+    for _ in range(count):
+        gacha_type = rng.choice((100, 200, 301, 400, 302, 500))
+        next_id += rng.randint(1, 5000)
+        moment += datetime.timedelta(seconds=rng.choice((0, 0, 0, 1, 60, 3600)))
+        items.append({
+            "GachaType": gacha_type,
+            "QueryType": 301 if gacha_type == 400 else gacha_type,
+            "ItemId": rng.choice(item_pool),
+            "Time": moment.isoformat(),
+            "Id": next_id
+        })
+    return items
+
+
+def _benchmark(count: int = 50000, block_size: int = 4096, rounds: int = 5):
+    """与当前的 JSON 字典表示比较体积和编解码耗时"""
+    import time
+
+    items = _sample_items(count)
+    json_bytes = json.dumps(items, separators=(",", ":")).encode()
+    bson_size = None
+    try:
+        import bson
+        bson_size = len(bson.encode({"data": items}))
+    except Exception:
+        pass
+
+    def timed(func):
+        best = None
+        result = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return result, best
+
+    blocks, encode_time = timed(lambda: encode_blocks(items, block_size))
+    _, decode_time = timed(lambda: [item for blob in blocks for item in decode_block(blob)])
+    _, json_dump_time = timed(lambda: json.dumps(items, separators=(",", ":")))
+    _, json_load_time = timed(lambda: json.loads(json_bytes))
+
+    columnar_size = sum(len(blob) for blob in blocks)
+    print(f"items: {count}, block size: {block_size}, blocks: {len(blocks)}")
+    print(f"json:     {len(json_bytes):>10} bytes")
+    if bson_size is not None:
+        print(f"bson:     {bson_size:>10} bytes")
+    print(f"columnar: {columnar_size:>10} bytes ({len(json_bytes) / columnar_size:.1f}x smaller than json)")
+    print(f"encode: columnar {encode_time * 1000:.1f} ms, json.dumps {json_dump_time * 1000:.1f} ms")
+    print(f"decode: columnar {decode_time * 1000:.1f} ms, json.loads {json_load_time * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,84 @@
+import datetime
+from app.extensions import client, logger
+from app.config_loader import config_loader
+from app.utils.periodic_job import start_periodic_job
+from services.gacha_log_service import archive_gacha_log
+
+"""
+祈愿记录的保留策略。
+后台任务每天运行一次，把以下 UID 的记录移到冷归档（见 gacha_log_service.archive_gacha_log）：
+1. 用户的 GachaLogExpireAt 已过期
+2. 最后一次上传（LastUploadAt）和最后一次访问（LastAccessAt）都早于 GACHA_LOG.ARCHIVE_INACTIVE_DAYS 天前，
+   没有记录的时间视为不活跃（为 0 时不按不活跃时间归档）
+归档的记录在下次访问时自动恢复，恢复时更新 LastAccessAt。
+未启用归档时不记录访问时间，汇总文档重建的旧数据两个时间都没有记录，启用归档前需要先运行 BackfillGachaLogSummaryTool，
+由 start_inactivity_clock 从运行时开始计算所有 UID 的不活跃时间。
+"""
+
+RETENTION_INTERVAL_SECONDS = 24 * 3600
+
+
+def _expired_user_ids(now: datetime.datetime) -> list:
+    """GachaLogExpireAt 已过期的用户，该字段可能以 ISO 字符串或日期保存"""
+    cursor = client.ht_server.users.find(
+        {"$or": [
+            {"GachaLogExpireAt": {"$lt": now.strftime("%Y-%m-%dT%H:%M:%SZ")}},
+            {"GachaLogExpireAt": {"$lt": now}}
+        ]},
+        {"_id": 1}
+    )
+    return [str(user['_id']) for user in cursor]
+
+
+def _inactive_condition(cutoff: datetime.datetime) -> dict:
+    """上传和访问时间都早于 cutoff；值为 null 或字段不存在时同样满足"""
+    return {"$and": [
+        {"$or": [{"LastUploadAt": {"$lt": cutoff}}, {"LastUploadAt": None}]},
+        {"$or": [{"LastAccessAt": {"$lt": cutoff}}, {"LastAccessAt": None}]}
+    ]}
+
+
+def start_inactivity_clock() -> int:
+    """
+    以当前时间作为所有 UID 的最后访问时间（已有更晚的时间时保留），返回更新的数量。
+    未启用归档期间的访问没有记录，不能按之前的访问时间判断是否长期不活跃
+    """
+    result = client.ht_server.GachaLogSummary.update_many(
+        {},
+        {"$max": {"LastAccessAt": datetime.datetime.utcnow()}}
+    )
+    return result.modified_count
+
+
+def archive_inactive_gacha_logs():
+    """归档过期用户和长期不活跃 UID 的记录"""
+    now = datetime.datetime.utcnow()
+    conditions = []
+    expired_user_ids = _expired_user_ids(now)
+    if expired_user_ids:
+        conditions.append({"user_id": {"$in": expired_user_ids}})
+    inactive_days = config_loader.GACHA_LOG_ARCHIVE_INACTIVE_DAYS
+    if inactive_days:
+        conditions.append(_inactive_condition(now - datetime.timedelta(days=inactive_days)))
+    if not conditions:
+        return
+
+    archived = 0
+    items = 0
+    summaries = client.ht_server.GachaLogSummary.find(
+        {"Archived": {"$ne": True}, "$or": conditions},
+        {"_id": 0, "user_id": 1, "Uid": 1}
+    )
+    for summary in summaries:
+        count = archive_gacha_log(summary['user_id'], summary['Uid'])
+        if count:
+            archived += 1
+            items += count
+
+    logger.info(f"Gacha log retention finished, {archived} uid(s) archived, {items} items")
+
+
+def start_retention_job():
+    """启动冷归档的后台任务"""
+    start_periodic_job("gacha_log_retention", archive_inactive_gacha_logs, RETENTION_INTERVAL_SECONDS,
+                       lease_seconds=RETENTION_INTERVAL_SECONDS)
@@ -0,0 +1,106 @@
+from typing import Annotated
+import msgspec
+
+"""
+祈愿记录接口的数据结构。
+请求体和上传的记录用 msgspec Struct 一次完成解码和校验：数字字段接受数字字符串并统一转换为整数，
+未知字段被丢弃，校验失败时抛出 msgspec.ValidationError（ValueError 的子类）。
+Struct 实例比 dict 占用更少的内存，写入 MongoDB 前再转换为 dict。
+"""
+
+
+class GachaItem(msgspec.Struct, gc=False):
+    """单条祈愿记录，字段顺序即存储时的字段顺序"""
+    GachaType: int
+    QueryType: int
+    ItemId: int
+    Time: str
+    Id: int
+
+
+class UploadRequest(msgspec.Struct):
+    Uid: str = ''
+    Items: list[GachaItem] = []
+
+
+class RetrieveRequest(msgspec.Struct):
+    Uid: str = ''
+    EndIds: dict[str, int] = {}
+
+
+class SyncRequest(msgspec.Struct):
+    Uid: str = ''
+    SyncToken: str | None = None
+
+
+# 批量接口一次最多处理的 UID 数
+MAX_BATCH_UIDS = 20
+
+
+class EndIdsBatchRequest(msgspec.Struct):
+    Uids: Annotated[list[str], msgspec.Meta(max_length=MAX_BATCH_UIDS)] = []
+
+
+class RetrieveBatchRequest(msgspec.Struct):
+    Requests: Annotated[list[RetrieveRequest], msgspec.Meta(max_length=MAX_BATCH_UIDS)] = []
+
+
+def decode_item(item) -> GachaItem:
+    """校验并转换单条记录（dict 或 GachaItem）"""
+    return msgspec.convert(item, GachaItem, strict=False)
+
+
+def decode_items(items) -> list[GachaItem]:
+    """校验并转换一批记录"""
+    return msgspec.convert(items, list[GachaItem], strict=False)
+
+
+def decode_request(body: bytes, request_type: type):
+    """把 JSON 请求体解码为指定的 Struct，空请求体视为空对象"""
+    return msgspec.json.decode(body or b'{}', type=request_type, strict=False)
+
+
+def to_documents(items: list[GachaItem]) -> list[dict]:
+    """转换为写入 MongoDB 的 dict"""
+    return msgspec.to_builtins(items)
+
+
+if __name__ == "__main__":
+    import json
+    import time
+    import tracemalloc
+
+    payload = json.dumps({
+        "Uid": "100000001",
+        "Items": [
+            {"GachaType": 301 if i % 3 else 400, "QueryType": 301, "ItemId": 10000002 + i % 50,
+             "Time": "2024-01-01T12:00:00+08:00", "Id": str(1700000000000000000 + i) if i % 10 == 0
+                else 1700000000000000000 + i}
+            for i in range(100_000)
+        ]
+    }).encode()
+
+    def json_dicts():
+        """原有方式：json 解析为 dict 后逐条转换 Id"""
+        data = json.loads(payload)
+        items = data.get('Items', [])
+        for item in items:
+            for key in ("GachaType", "QueryType", "ItemId", "Id"):
+                item[key] = int(item[key])
+        return items
+
+    def msgspec_structs():
+        return decode_request(payload, UploadRequest).Items
+
+    print(f"{len(payload) / 1e6:.1f} MB payload, 100000 items")
+    for name, func in (("json + dict", json_dicts), ("msgspec Struct", msgspec_structs)):
+        start = time.perf_counter()
+        for _ in range(5):
+            func()
+        elapsed = (time.perf_counter() - start) / 5
+        tracemalloc.start()
+        items = func()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del items
+        print(f"{name}: decode {elapsed * 1000:.0f} ms, {size / 100_000:.0f} bytes per item")
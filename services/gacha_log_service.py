@@ -1,4 +1,13 @@
+import datetime
+import time
+import uuid
+from pymongo import ReplaceOne, UpdateOne, DeleteMany, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from app.extensions import client, logger
+from app.config_loader import config_loader
+from app.schema import ensure_indexes
+from services.gacha_log_codec import encode_blocks, decode_block, decode_block_ids
+from services.gacha_log_schema import decode_item, decode_items, to_documents
 
 """
 注意！记录中有两种类型，GachaType和QueryType(uigf_gacha_type)，GachaType多了一个400类型，其实就是QueryType的301类型，客户端传的end_ids是按QueryType来的，如果按照GachaType来筛选会多出400类型的记录
@@ -11,17 +20,290 @@ from app.extensions import client, logger
 | `301`             | `301` or `400` |
 | `302`             | `302`          |
 | `500`             | `500`          |
+
+存储模式（配置项 GACHA_LOG.STORAGE_MODE）：
+- document：每个 (user_id, Uid) 一个 GachaLog 文档，所有记录存放在 data 数组中
+- item：每条记录一个 GachaLogItem 文档，按 (user_id, Uid, GachaType, Id) 建立唯一复合索引
+- columnar：每个 (user_id, Uid) 一个 GachaLogColumnar 文档，记录以压缩列式块（见 gacha_log_codec）保存在 blocks 数组中，
+  上传时只追加新块，后追加的块覆盖之前块中相同 Id 的记录，块数过多时合并；
+  追加和合并都依赖之前读取的块，写入时比较文档的 Version，不一致时重新读取
+
+document 模式的追加和 item 模式的 upsert 都是单次原子更新，并发上传不会丢失记录；
+GachaLog 按 (user_id, Uid) 建立唯一索引，同一 UID 的并发首次上传不会产生多个文档
+（旧数据中已有的重复文档需要先用 BootstrapIndexesTool --merge-gacha-log-duplicates 合并）。
+
+冷归档：长期不活跃的记录可以移到 GachaLogArchive（每个 (user_id, Uid) 一个文档，与存储模式无关，
+记录以 gacha_log_codec 压缩块保存），汇总文档保留并标记 Archived，EndIds/Entries 不受影响。
+归档先以 archiving 状态写入，删除当前存储中的记录后才改为 archived；
+检索、同步、上传和分析前会先把 archived 的归档合并回当前存储模式（已有的同 Id 记录优先），然后删除归档。
+读取记录和恢复归档时在汇总文档中记录 LastAccessAt（每个 UID 每天最多写入一次），与 LastUploadAt 一起判断是否长期不活跃。
+未启用冷归档（GACHA_LOG.ARCHIVE_ENABLED）时不记录 LastAccessAt；只有归档集合中还有关闭前留下的归档时才检查恢复，
+是否有归档每个进程定期检查一次，检索、上传等接口不增加额外的数据库请求。
+
+增量同步：每个 (user_id, Uid) 在 GachaLogSyncState 中有一个同步纪元（Epoch）和单调递增的序号（Sequence），
+每次上传把序号加一并写入本次上传的记录（document/columnar 模式为记录内的 _Seq 字段，item 模式为 GachaLogItem 的 _Seq 字段，
+返回给客户端前去掉）。客户端持有的同步令牌为 "纪元.序号"，只返回序号更大的记录；删除记录后纪元重新生成，旧令牌失效。
+
+各模式下都会在上传时维护 GachaLogSummary 汇总文档（每个 (user_id, Uid) 一个），记录各 GachaType 的最大 Id、
+条数、总条数和最后上传时间，EndIds 和 Entries 只读取汇总文档。旧数据没有汇总文档时按需从记录重建。
+汇总文档的 Sequence 为已计入的同步序号，上传提交序号后只在汇总正好停在前一个序号时增量更新，否则从记录重建。
 """
 
+STORAGE_MODE_DOCUMENT = "document"
+STORAGE_MODE_ITEM = "item"
+STORAGE_MODE_COLUMNAR = "columnar"
+
+# 各存储模式保存记录的集合
+STORAGE_COLLECTIONS = {
+    STORAGE_MODE_DOCUMENT: "GachaLog",
+    STORAGE_MODE_ITEM: "GachaLogItem",
+    STORAGE_MODE_COLUMNAR: "GachaLogColumnar",
+}
+
+# columnar 模式下每个块的记录数，以及触发合并的块数
+COLUMNAR_BLOCK_SIZE = 4096
+COLUMNAR_MAX_BLOCKS = 64
+
+# 检索时游标每批从 MongoDB 取回的记录数，决定流式响应时的内存占用上限
+RETRIEVE_BATCH_SIZE = 1000
+
+# 归档过程的最长时间，超过后视为归档中断
+ARCHIVING_TIMEOUT_SECONDS = 600
+
+# LastAccessAt 的更新间隔，同一 UID 在该时间内的重复访问不再写入
+ACCESS_STAMP_SECONDS = 24 * 3600
+
+# 未启用冷归档时，每个进程检查 GachaLogArchive 中是否还有未恢复归档的间隔（秒）
+ARCHIVE_PRESENCE_CHECK_SECONDS = 300
+
+# 分批上传时每批的记录条数，与 columnar 模式的块大小相同，每批正好编码为一个块
+UPLOAD_BATCH_SIZE = COLUMNAR_BLOCK_SIZE
+
+# 最近一次检查归档集合的时间（time.monotonic()）和是否有归档
+_archive_presence = (None, True)
+
+
+def _storage_mode() -> str:
+    return config_loader.GACHA_LOG_STORAGE_MODE
+
+
+def _ensure_indexes():
+    """确保祈愿记录相关集合的索引存在（定义见 app.schema），每个进程只检查一次"""
+    ensure_indexes(["GachaLog", "GachaLogItem", "GachaLogSyncState", "GachaLogColumnar", "GachaLogSummary",
+                    "GachaLogArchive"])
+
+
+def _storage_collection():
+    """当前存储模式下保存记录的集合"""
+    return client.ht_server[STORAGE_COLLECTIONS.get(_storage_mode(), "GachaLog")]
+
+
+def _to_key(value):
+    """将 GachaType/Id 统一为整数，便于索引范围查询"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _default_end_ids() -> dict:
+    return {
+        "100": 0,  # NoviceWish
+        "200": 0,  # StandardWish
+        "301": 0,  # AvatarEventWish
+        "302": 0,  # WeaponEventWish
+        "500": 0   # ChronicledWish
+    }
+
+
+def _committed_sequence(user_id, uid) -> int | None:
+    """已提交的同步序号，没有同步状态（上传从未经过本服务）时返回 None"""
+    state = client.ht_server.GachaLogSyncState.find_one({"user_id": user_id, "Uid": uid}, {"_id": 0, "Sequence": 1})
+    return state['Sequence'] if state else None
+
+
+def _rebuild_summary(user_id, uid) -> dict | None:
+    """
+    从已存储的记录重建汇总文档，用于汇总功能上线前的旧数据和增量更新冲突后的修复。
+    只统计已提交序号范围内的记录（没有 _Seq 的旧记录视为 0），重建期间正在上传的记录由该上传之后增量更新，不会重复计数。
+    GachaType 统一为字符串，整数和字符串形式的同一类型合并统计。
+    """
+    sequence = _committed_sequence(user_id, uid)
+    # 不大于已提交序号，缺少 _Seq 字段的记录同样满足
+    committed = {"$not": {"$gt": sequence}}
+    mode = _storage_mode()
+    if mode == STORAGE_MODE_ITEM:
+        match = {"user_id": user_id, "Uid": uid}
+        if sequence is not None:
+            match["_Seq"] = committed
+        pipeline = [
+            {"$match": match},
+            {"$group": {"_id": {"$toString": "$GachaType"}, "MaxId": {"$max": "$Id"}, "Count": {"$sum": 1}}}
+        ]
+        groups = list(client.ht_server.GachaLogItem.aggregate(pipeline))
+    elif mode == STORAGE_MODE_COLUMNAR:
+        # 压缩块只能在本地解码后统计
+        grouped = {}
+        for item in _iter_columnar_items(_columnar_blocks(user_id, uid)):
+            if sequence is not None and item.get('_Seq', 0) > sequence:
+                continue
+            gacha_type = str(item.get('GachaType'))
+            group = grouped.setdefault(gacha_type, {"_id": gacha_type, "MaxId": 0, "Count": 0})
+            group['MaxId'] = max(group['MaxId'], item.get('Id', 0))
+            group['Count'] += 1
+        groups = list(grouped.values())
+    else:
+        pipeline = [
+            {"$match": {"user_id": user_id, "Uid": uid}},
+            {"$unwind": "$data"},
+        ]
+        if sequence is not None:
+            pipeline.append({"$match": {"data._Seq": committed}})
+        pipeline.append(
+            {"$group": {"_id": {"$toString": "$data.GachaType"}, "MaxId": {"$max": "$data.Id"}, "Count": {"$sum": 1}}}
+        )
+        groups = list(client.ht_server.GachaLog.aggregate(pipeline))
+
+    if not groups:
+        return None
+
+    summary = {
+        "user_id": user_id,
+        "Uid": uid,
+        "MaxIds": {g['_id']: g['MaxId'] for g in groups},
+        "Counts": {g['_id']: g['Count'] for g in groups},
+        "ItemCount": sum(g['Count'] for g in groups),
+        "Sequence": sequence or 0,
+        "LastUploadAt": None
+    }
+    try:
+        # 重建期间其他上传已经把汇总推进到更新的序号时保留其结果
+        client.ht_server.GachaLogSummary.replace_one(
+            {"user_id": user_id, "Uid": uid, "Sequence": {"$not": {"$gt": summary['Sequence']}}},
+            summary,
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass
+    logger.info(f"Gacha log summary rebuilt for user_id: {user_id}, uid: {uid}")
+    return summary
+
+
+def _rebuild_user_summaries(user_id):
+    """为用户所有缺少汇总文档的 UID 重建汇总，保证用户要么没有汇总文档，要么每个 UID 都有"""
+    uids = _storage_collection().distinct("Uid", {"user_id": user_id})
+    summarized = set(client.ht_server.GachaLogSummary.distinct("Uid", {"user_id": user_id}))
+    for uid in uids:
+        if uid not in summarized:
+            _rebuild_summary(user_id, uid)
+
+
+def ensure_gacha_log_summaries() -> int:
+    """
+    为所有缺少汇总文档的历史记录重建汇总，返回重建的 UID 数。
+    这是汇总功能上线后的一次性迁移（BackfillGachaLogSummaryTool、迁移工具），不在服务的周期任务中运行；
+    UID 列表由聚合游标逐批返回，不受单个结果文档 16MB 的限制。
+    """
+    _ensure_indexes()
+    pipeline = [
+        {"$group": {"_id": {"user_id": "$user_id", "Uid": "$Uid"}}},
+        {"$lookup": {
+            "from": "GachaLogSummary",
+            "let": {"user_id": "$_id.user_id", "uid": "$_id.Uid"},
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [{"$eq": ["$user_id", "$$user_id"]}, {"$eq": ["$Uid", "$$uid"]}]}}},
+                {"$project": {"_id": 1}}
+            ],
+            "as": "summary"
+        }},
+        {"$match": {"summary": {"$size": 0}}}
+    ]
+    rebuilt = 0
+    for group in _storage_collection().aggregate(pipeline, allowDiskUse=True, batchSize=RETRIEVE_BATCH_SIZE):
+        if _rebuild_summary(group['_id']['user_id'], group['_id']['Uid']):
+            rebuilt += 1
+    return rebuilt
+
+
+def _summary_changes(items, new_items) -> tuple[dict, dict]:
+    """本次上传对汇总文档的 ($inc, $max) 更新，GachaType 统一为字符串"""
+    increments = {"ItemCount": len(new_items)}
+    for item in new_items:
+        key = f"Counts.{item.get('GachaType')}"
+        increments[key] = increments.get(key, 0) + 1
+
+    max_ids = {}
+    for item in items:
+        key = f"MaxIds.{item.get('GachaType')}"
+        max_ids[key] = max(max_ids.get(key, 0), item.get('Id', 0))
+    return increments, max_ids
+
+
+def _merge_summary_changes(changes: tuple[dict, dict], other: tuple[dict, dict]) -> tuple[dict, dict]:
+    increments, max_ids = changes
+    for key, value in other[0].items():
+        increments[key] = increments.get(key, 0) + value
+    for key, value in other[1].items():
+        max_ids[key] = max(max_ids.get(key, 0), value)
+    return increments, max_ids
+
+
+def _update_summary(user_id, uid, changes: tuple[dict, dict], sequence: int) -> dict | None:
+    """
+    在已提交序号 sequence 之后增量更新汇总文档：新增条数累加到 Counts/ItemCount，上传记录的最大 Id 合并到 MaxIds。
+    汇总文档的 Sequence 与同步序号一样比较并交换，只有汇总已包含 sequence 之前的所有上传时才增量更新；
+    汇总文档不存在（首次上传或旧数据）或并发上传的更新顺序不一致时从记录重建，重建结果已包含本次上传。
+    """
+    increments, max_ids = changes
+    now = datetime.datetime.utcnow()
+    summary = client.ht_server.GachaLogSummary.find_one_and_update(
+        {"user_id": user_id, "Uid": uid, "Sequence": sequence - 1},
+        {"$inc": increments, "$max": max_ids, "$set": {"LastUploadAt": now, "Sequence": sequence}},
+        projection={"_id": 0, "ItemCount": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if summary is not None:
+        return summary
+
+    if client.ht_server.GachaLogSummary.find_one({"user_id": user_id}, {"_id": 1}):
+        _rebuild_summary(user_id, uid)
+    else:
+        _rebuild_user_summaries(user_id)
+    client.ht_server.GachaLogSummary.update_one(
+        {"user_id": user_id, "Uid": uid},
+        {"$set": {"LastUploadAt": now}}
+    )
+    return client.ht_server.GachaLogSummary.find_one(
+        {"user_id": user_id, "Uid": uid},
+        {"_id": 0, "ItemCount": 1}
+    )
+
+
+def get_gacha_log_summary(user_id, uid) -> dict | None:
+    """获取指定 UID 的汇总文档，旧数据没有汇总文档时从记录重建，没有记录时返回 None"""
+    _ensure_indexes()
+    summary = client.ht_server.GachaLogSummary.find_one({"user_id": user_id, "Uid": uid}, {"_id": 0})
+    if not summary:
+        summary = _rebuild_summary(user_id, uid)
+    return summary
+
+
 def get_gacha_log_entries(user_id):
     """获取用户的祈愿记录条目列表"""
-    gacha_logs = list(client.ht_server.GachaLog.find({"user_id": user_id}))
+    _ensure_indexes()
+    projection = {"_id": 0, "Uid": 1, "ItemCount": 1}
+    summaries = list(client.ht_server.GachaLogSummary.find({"user_id": user_id}, projection))
+    if not summaries:
+        # 旧数据还没有汇总文档
+        _rebuild_user_summaries(user_id)
+        summaries = list(client.ht_server.GachaLogSummary.find({"user_id": user_id}, projection))
+
     entries = []
-    for log in gacha_logs:
+    for summary in summaries:
         entry = {
-            "Uid": log['Uid'],
+            "Uid": summary['Uid'],
             "Excluded": False,
-            "ItemCount": len(log['data'])
+            "ItemCount": summary['ItemCount']
         }
         entries.append(entry)
     return entries
@@ -29,90 +311,780 @@ def get_gacha_log_entries(user_id):
 
 def get_gacha_log_end_ids(user_id, uid):
     """获取指定 UID 用户的祈愿记录最新 ID"""
-    gacha_log = client.ht_server.GachaLog.find_one({"user_id": user_id, "Uid": uid})
-    if not gacha_log:
-        return {
-            "100": 0,  # NoviceWish
-            "200": 0,  # StandardWish
-            "301": 0,  # AvatarEventWish
-            "302": 0,  # WeaponEventWish
-            "500": 0   # ChronicledWish
-        }
-    
-    # 计算各个祈愿类型的最新ID
-    end_ids = {
-        "100": 0,
-        "200": 0,
-        "301": 0,
-        "302": 0,
-        "500": 0
-    }
-    for item in gacha_log['data']:
-        gacha_type = str(item.get('GachaType', ''))
-        item_id = item.get('Id', 0)
-        if gacha_type in end_ids:
-            end_ids[gacha_type] = max(end_ids[gacha_type], item_id)
-    
+    return _end_ids_from_summary(get_gacha_log_summary(user_id, uid))
+
+
+def get_gacha_log_end_ids_batch(user_id, uids: list) -> dict:
+    """一次查询多个 UID 的祈愿记录最新 ID，返回 {Uid: end_ids}"""
+    _ensure_indexes()
+    query = {"user_id": user_id, "Uid": {"$in": uids}}
+    projection = {"_id": 0, "Uid": 1, "MaxIds": 1}
+    summaries = list(client.ht_server.GachaLogSummary.find(query, projection))
+    # 用户要么所有 UID 都有汇总文档，要么都没有（旧数据）
+    if len(summaries) < len(uids) and not client.ht_server.GachaLogSummary.find_one({"user_id": user_id}, {"_id": 1}):
+        _rebuild_user_summaries(user_id)
+        summaries = list(client.ht_server.GachaLogSummary.find(query, projection))
+
+    by_uid = {summary['Uid']: summary for summary in summaries}
+    return {uid: _end_ids_from_summary(by_uid.get(uid)) for uid in uids}
+
+
+def _end_ids_from_summary(summary: dict | None) -> dict:
+    end_ids = _default_end_ids()
+    if not summary:
+        return end_ids
+
+    # 各个祈愿类型的最新ID
+    max_ids = summary.get('MaxIds', {})
+    for gacha_type in end_ids:
+        end_ids[gacha_type] = max_ids.get(gacha_type, 0)
+
     # 400类型对应301类型
     end_ids["400"] = end_ids["301"]
-    
+
     return end_ids
 
 
 def upload_gacha_log(user_id, uid, items):
-    """上传祈愿记录"""
-    # 查找是否已有该用户和UID的祈愿记录
-    existing_log = client.ht_server.GachaLog.find_one({"user_id": user_id, "Uid": uid})
-    
-    if existing_log:
-        # 已有数据，合并新旧数据（按Id去重）
-        old_items = existing_log.get('data', [])
-        # 用Id做索引，先加旧的，再加新的（新数据覆盖旧数据）
-        item_dict = {item.get('Id'): item for item in old_items}
-        for item in items:
-            item_dict[item.get('Id')] = item
-        merged_items = list(item_dict.values())
-        # 更新数据库
-        client.ht_server.GachaLog.update_one(
-            {"_id": existing_log['_id']},
-            {"$set": {"data": merged_items}}
-        )
-        return f"success, merged {len(items)} new items, total {len(merged_items)} items"
-    else:
-        # 没有数据，直接插入
-        gacha_log_entry = {
-            "user_id": user_id,
-            "Uid": uid,
-            "data": items
+    """
+    上传祈愿记录
+
+    :raises ValueError: 记录校验失败
+    """
+    _ensure_indexes()
+    if not items:
+        return "success, uploaded 0 items"
+    _restore_archived(user_id, uid)
+
+    # 校验并统一字段类型后，同一批次内按Id去重，后出现的覆盖先出现的
+    items = to_documents(list({item.Id: item for item in decode_items(items)}.values()))
+
+    state = _sync_state(user_id, uid)
+    sequence = state['Sequence'] + 1
+    new_items = _write_items(user_id, uid, items, sequence)
+
+    # 提交序号：期间其他上传已提交了相同的序号时，用新的序号重新写入本次的记录，
+    # 保证持有较新令牌的客户端之后仍能收到这些记录
+    while not _commit_sequence(user_id, uid, sequence):
+        sequence = _sync_state(user_id, uid)['Sequence'] + 1
+        _write_items(user_id, uid, items, sequence, restamp=True)
+
+    summary = _update_summary(user_id, uid, _summary_changes(items, new_items), sequence)
+    return _upload_message(len(items), len(new_items), summary)
+
+
+def upload_gacha_log_stream(user_id, uid, items, batch_size=UPLOAD_BATCH_SIZE):
+    """
+    分批上传祈愿记录，items 可以是逐条产出记录的迭代器（例如边解析请求体边产出），
+    每凑满 batch_size 条写入一次，内存中最多只保留一批记录。
+    """
+    _ensure_indexes()
+    _restore_archived(user_id, uid)
+    sequence = _sync_state(user_id, uid)['Sequence'] + 1
+    uploaded = 0
+    new_count = 0
+    # 各批次的汇总更新累积到提交序号之后一次写入
+    changes = ({}, {})
+    try:
+        for batch in _batched(items, batch_size):
+            batch = to_documents(list({item.Id: item for item in batch}.values()))
+            new_items = _write_items(user_id, uid, batch, sequence)
+            changes = _merge_summary_changes(changes, _summary_changes(batch, new_items))
+            uploaded += len(batch)
+            new_count += len(new_items)
+    finally:
+        # 已写入的批次无法重新标记序号，期间有其他上传提交了相同的序号时更换纪元，让客户端重新全量同步；
+        # 更换纪元也会推进序号，汇总文档随之在下面重建
+        if uploaded:
+            if not _commit_sequence(user_id, uid, sequence):
+                _reset_sync_epoch(user_id, uid)
+            summary = _update_summary(user_id, uid, changes, sequence)
+
+    if not uploaded:
+        return "success, uploaded 0 items"
+    return _upload_message(uploaded, new_count, summary)
+
+
+def _batched(items, batch_size):
+    """逐条校验并按批次产出 GachaItem，批次内以 Struct 保存以减少内存占用"""
+    batch = []
+    for item in items:
+        batch.append(decode_item(item))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _upload_message(uploaded, new_count, summary) -> str:
+    total = summary['ItemCount'] if summary else new_count
+    if total > new_count:
+        return f"success, merged {uploaded} new items, total {total} items"
+    return f"success, uploaded {uploaded} items"
+
+
+def _sync_state(user_id, uid) -> dict:
+    """读取同步状态，不存在时以新的纪元创建"""
+    return client.ht_server.GachaLogSyncState.find_one_and_update(
+        {"user_id": user_id, "Uid": uid},
+        {"$setOnInsert": {"Epoch": uuid.uuid4().hex, "Sequence": 0}},
+        projection={"_id": 0, "Epoch": 1, "Sequence": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _commit_sequence(user_id, uid, sequence) -> bool:
+    """比较并交换：只有当前序号仍为 sequence - 1 时才推进到 sequence"""
+    result = client.ht_server.GachaLogSyncState.update_one(
+        {"user_id": user_id, "Uid": uid, "Sequence": sequence - 1},
+        {"$set": {"Sequence": sequence}}
+    )
+    return result.modified_count > 0
+
+
+def _reset_sync_epoch(user_id, uid):
+    """更换同步纪元，所有已发出的同步令牌失效"""
+    client.ht_server.GachaLogSyncState.update_one(
+        {"user_id": user_id, "Uid": uid},
+        {"$set": {"Epoch": uuid.uuid4().hex}, "$inc": {"Sequence": 1}}
+    )
+
+
+def _write_items(user_id, uid, items, sequence, restamp=False) -> list:
+    """按当前存储模式写入记录并标记序号，返回之前不存在的记录。restamp 为 True 时表示用新序号重写刚写入的记录"""
+    mode = _storage_mode()
+    if mode == STORAGE_MODE_ITEM:
+        return _upload_item(user_id, uid, items, sequence)
+    if mode == STORAGE_MODE_COLUMNAR:
+        return _upload_columnar(user_id, uid, items, sequence, restamp)
+    return _upload_document(user_id, uid, items, sequence)
+
+
+def _append_pipeline(items: list) -> list:
+    """
+    构造追加写入的更新管道：只把本次上传的记录发送给 MongoDB，
+    由服务端按 Id 去掉被覆盖的旧记录后再追加新记录（新数据覆盖旧数据）。
+    增量同步时新记录的 Id 一般都不在已有数据中，此时直接追加，不逐条过滤。
+    """
+    new_ids = [item.get('Id') for item in items]
+    return [{
+        "$set": {
+            "Version": {"$add": [{"$ifNull": ["$Version", 0]}, 1]},
+            "data": {
+                "$let": {
+                    "vars": {"existing": {"$ifNull": ["$data", []]}},
+                    "in": {
+                        "$concatArrays": [
+                            {
+                                "$cond": [
+                                    {"$eq": [{"$size": {"$setIntersection": ["$$existing.Id", new_ids]}}, 0]},
+                                    "$$existing",
+                                    {
+                                        "$filter": {
+                                            "input": "$$existing",
+                                            "cond": {"$not": [{"$in": ["$$this.Id", new_ids]}]}
+                                        }
+                                    }
+                                ]
+                            },
+                            {"$literal": items}
+                        ]
+                    }
+                }
+            }
         }
-        client.ht_server.GachaLog.insert_one(gacha_log_entry)
-        return f"success, uploaded {len(items)} items"
+    }]
 
 
-def retrieve_gacha_log(user_id, uid, end_ids):
-    """从云端检索用户的祈愿记录数据"""
-    gacha_log = client.ht_server.GachaLog.find_one({"user_id": user_id, "Uid": uid})
+def _upload_document(user_id, uid, items, sequence) -> list:
+    """document 模式下追加写入，传输量只与上传条数有关，与历史记录总量无关，返回之前不存在的记录"""
+    new_ids = [item.get('Id') for item in items]
+    stamped = [{**item, "_Seq": sequence} for item in items]
+
+    # 只返回更新前已存在的 Id（本次上传中被覆盖的部分），不返回 data 本身
+    def append():
+        return client.ht_server.GachaLog.find_one_and_update(
+            {"user_id": user_id, "Uid": uid},
+            _append_pipeline(stamped),
+            projection={
+                "_id": 0,
+                "replaced": {"$setIntersection": [{"$ifNull": ["$data.Id", []]}, new_ids]}
+            },
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+
+    try:
+        before = append()
+    except DuplicateKeyError:
+        # 同一 UID 的并发首次上传由唯一索引拒绝其中一个插入，此时文档已存在，重新追加
+        before = append()
+
+    if before is None:
+        return items
+    replaced = set(before['replaced'])
+    return [item for item in items if item.get('Id') not in replaced]
+
+
+def _upload_item(user_id, uid, items, sequence) -> list:
+    """item 模式下按 (user_id, Uid, GachaType, Id) 批量 upsert，新数据覆盖旧数据，返回之前不存在的记录"""
+    operations = [_item_operation(user_id, uid, item, sequence) for item in items]
+
+    result = client.ht_server.GachaLogItem.bulk_write(operations, ordered=False)
+    logger.debug(f"Gacha log bulk write: upserted {result.upserted_count}, modified {result.modified_count}")
+    return [items[index] for index in result.upserted_ids]
+
+
+def _item_record(user_id, uid, item, sequence) -> tuple[dict, dict]:
+    """item 模式下记录的 (唯一键, 文档)"""
+    key = {
+        "user_id": user_id,
+        "Uid": uid,
+        "GachaType": _to_key(item.get('GachaType')),
+        "Id": _to_key(item.get('Id'))
+    }
+    return key, {**key, "_Seq": sequence, "item": item}
+
+
+def _item_operation(user_id, uid, item, sequence) -> ReplaceOne:
+    key, record = _item_record(user_id, uid, item, sequence)
+    return ReplaceOne(key, record, upsert=True)
+
+
+def _strip_sequence(item: dict) -> dict:
+    """去掉记录中的内部序号字段"""
+    item.pop('_Seq', None)
+    return item
+
+
+def _columnar_blocks(user_id, uid) -> list:
+    gacha_log = client.ht_server.GachaLogColumnar.find_one(
+        {"user_id": user_id, "Uid": uid},
+        {"_id": 0, "blocks": 1}
+    )
+    return gacha_log.get('blocks', []) if gacha_log else []
+
+
+def _columnar_state(user_id, uid) -> tuple[list, int]:
+    """读取 columnar 文档的块列表和版本号"""
+    gacha_log = client.ht_server.GachaLogColumnar.find_one(
+        {"user_id": user_id, "Uid": uid},
+        {"_id": 0, "blocks": 1, "Version": 1}
+    )
     if not gacha_log:
-        return []
-    
-    # 筛选出比end_ids更旧的记录
-    filtered_items = []
-    
-    # 需要将end_ids的key从QueryType转换为GachaType，给400赋值为301的值即可
+        return [], 0
+    return gacha_log.get('blocks', []), gacha_log.get('Version', 0)
+
+
+def _version_filter(version: int) -> dict:
+    # 旧文档没有 Version 字段，视为 0
+    return {"Version": version} if version else {"Version": {"$in": [0, None]}}
+
+
+def _iter_columnar_items(blocks: list):
+    """逐块解码记录，后追加的块覆盖之前块中相同 Id 的记录，内存中只保留 Id 表和一个解码后的块"""
+    latest = None
+    if len(blocks) > 1:
+        latest = {}
+        for index, blob in enumerate(blocks):
+            for item_id in decode_block_ids(blob):
+                latest[item_id] = index
+    for index, blob in enumerate(blocks):
+        for item in decode_block(blob):
+            if latest is None or latest[item.get('Id')] == index:
+                yield item
+
+
+def _upload_columnar(user_id, uid, items, sequence, restamp=False) -> list:
+    """
+    columnar 模式下只把新增或内容有变化的记录编码为新块追加，返回之前不存在的记录。
+    是否需要写入取决于读取到的已有块，写入时比较 Version，期间有其他写入时重新读取并判断。
+    """
+    uploaded = [{**item, "_Seq": sequence} for item in items]
+    while True:
+        blocks, version = _columnar_state(user_id, uid)
+        existing_ids = set()
+        for blob in blocks:
+            existing_ids.update(decode_block_ids(blob))
+
+        pending = uploaded
+        overlap = existing_ids.intersection(item.get('Id') for item in items)
+        # 重写序号时内容必然与刚写入的块相同，不能跳过
+        if overlap and not restamp:
+            existing = {
+                item.get('Id'): _strip_sequence(item)
+                for item in _iter_columnar_items(blocks)
+                if item.get('Id') in overlap
+            }
+            pending = [
+                stamped for item, stamped in zip(items, uploaded)
+                if existing.get(item.get('Id')) != item
+            ]
+        if not pending:
+            return []
+
+        new_blocks = encode_blocks(pending, COLUMNAR_BLOCK_SIZE)
+        try:
+            client.ht_server.GachaLogColumnar.update_one(
+                {"user_id": user_id, "Uid": uid, **_version_filter(version)},
+                {"$push": {"blocks": {"$each": new_blocks}}, "$inc": {"Version": 1}},
+                upsert=True
+            )
+            break
+        except DuplicateKeyError:
+            # 版本不匹配时 upsert 会尝试插入新文档并与唯一索引冲突
+            logger.debug(f"Gacha log columnar write conflict for uid: {uid}, retrying")
+
+    if len(blocks) + len(new_blocks) > COLUMNAR_MAX_BLOCKS:
+        _compact_columnar(user_id, uid)
+
+    return [_strip_sequence(item) for item in pending if item.get('Id') not in existing_ids]
+
+
+def _compact_columnar(user_id, uid):
+    """合并追加产生的小块并去掉被覆盖的记录"""
+    blocks, version = _columnar_state(user_id, uid)
+    if not blocks:
+        return
+    compacted = encode_blocks(list(_iter_columnar_items(blocks)), COLUMNAR_BLOCK_SIZE)
+    # 合并期间有新的写入时放弃本次合并，之后的上传会再次触发
+    result = client.ht_server.GachaLogColumnar.update_one(
+        {"user_id": user_id, "Uid": uid, **_version_filter(version)},
+        {"$set": {"blocks": compacted}, "$inc": {"Version": 1}}
+    )
+    if result.modified_count:
+        logger.debug(f"Gacha log blocks compacted for uid: {uid}, {len(blocks)} -> {len(compacted)}")
+
+
+def migration_operations(gacha_log: dict, mode: str) -> tuple[list, int]:
+    """
+    把 document 模式的 GachaLog 文档转换为目标存储模式的写入操作，供迁移工具使用，返回 (操作列表, 记录条数)。
+    以源文档为准整体替换目标集合中该 UID 的记录（包括删除源文档中已不存在的记录），重复执行结果相同。
+    只依赖传入的文档，可以在迁移工具的子进程中运行。
+    """
+    user_id = gacha_log['user_id']
+    uid = gacha_log['Uid']
+    items = list({item.get('Id'): item for item in gacha_log.get('data', [])}.values())
+    if mode == STORAGE_MODE_ITEM:
+        operations = []
+        for item in items:
+            item = dict(item)
+            sequence = item.pop('_Seq', 0)
+            operations.append(_item_operation(user_id, uid, item, sequence))
+        operations.append(DeleteMany({
+            "user_id": user_id, "Uid": uid, "Id": {"$nin": [_to_key(item.get('Id')) for item in items]}
+        }))
+        return operations, len(items)
+
+    if mode == STORAGE_MODE_COLUMNAR:
+        key = {"user_id": user_id, "Uid": uid}
+        blocks = encode_blocks(items, COLUMNAR_BLOCK_SIZE) if items else []
+        return [ReplaceOne(key, {**key, "blocks": blocks, "Version": 1}, upsert=True)], len(items)
+
+    raise ValueError(f"unsupported migration target: {mode}")
+
+
+def merge_migrated_gacha_log(gacha_log: dict, mode: str) -> int:
+    """
+    切换存储模式后补迁移：只写入目标集合中还没有的记录，目标集合中已有的同 Id 记录（切换后上传）优先，
+    返回写入的记录条数。columnar 模式按 Version 比较后追加一个块，追加后合并块。
+    """
+    user_id = gacha_log['user_id']
+    uid = gacha_log['Uid']
+    items = list({item.get('Id'): item for item in gacha_log.get('data', [])}.values())
+    if mode == STORAGE_MODE_ITEM:
+        operations = []
+        for item in items:
+            item = dict(item)
+            sequence = item.pop('_Seq', 0)
+            key, record = _item_record(user_id, uid, item, sequence)
+            operations.append(UpdateOne(key, {"$setOnInsert": record}, upsert=True))
+        if not operations:
+            return 0
+        return client.ht_server.GachaLogItem.bulk_write(operations, ordered=False).upserted_count
+
+    if mode != STORAGE_MODE_COLUMNAR:
+        raise ValueError(f"unsupported migration target: {mode}")
+    while True:
+        blocks, version = _columnar_state(user_id, uid)
+        existing_ids = set()
+        for blob in blocks:
+            existing_ids.update(decode_block_ids(blob))
+        missing = [item for item in items if item.get('Id') not in existing_ids]
+        if not missing:
+            return 0
+        # 补迁移的记录比目标集合中已有的块更早，放在最前面，之后追加的块中相同 Id 的记录优先
+        try:
+            client.ht_server.GachaLogColumnar.update_one(
+                {"user_id": user_id, "Uid": uid, **_version_filter(version)},
+                {"$push": {"blocks": {"$each": encode_blocks(missing, COLUMNAR_BLOCK_SIZE), "$position": 0}},
+                 "$inc": {"Version": 1}},
+                upsert=True
+            )
+            break
+        except DuplicateKeyError:
+            logger.debug(f"Gacha log columnar merge conflict for uid: {uid}, retrying")
+    _compact_columnar(user_id, uid)
+    return len(missing)
+
+
+def _expand_end_ids(end_ids) -> dict:
+    """将 end_ids 的 key 从 QueryType 转换为 GachaType，给400赋值为301的值"""
+    end_ids = dict(end_ids)
     if "301" in end_ids:
         end_ids["400"] = end_ids["301"]
-    
-    for item in gacha_log['data']:
+    return end_ids
+
+
+def _end_ids_filter(end_ids) -> dict:
+    """
+    把 end_ids 转换为记录级别的查询条件：end_id 为 0 或未提供的类型返回全部，
+    其余类型只返回比 end_id 更旧的记录。GachaType 可能以整数或字符串存储，两种都匹配。
+    """
+    # 需要将end_ids的key从QueryType转换为GachaType，给400赋值为301的值即可
+    end_ids = _expand_end_ids(end_ids)
+
+    bounded_types = []
+    conditions = []
+    for gacha_type, end_id in end_ids.items():
+        if end_id:
+            type_values = list({_to_key(gacha_type), str(gacha_type)})
+            bounded_types.extend(type_values)
+            conditions.append({"GachaType": {"$in": type_values}, "Id": {"$lt": end_id}})
+    conditions.append({"GachaType": {"$nin": bounded_types}})
+    return {"$or": conditions}
+
+
+def retrieve_gacha_log(user_id, uid, end_ids):
+    """从云端检索用户的祈愿记录数据"""
+    return list(iter_gacha_log(user_id, uid, end_ids))
+
+
+def iter_gacha_log(user_id, uid, end_ids, record_access: bool = True):
+    """
+    逐条产出符合 end_ids 条件的记录，数据直接来自 MongoDB 游标，不在内存中保存完整列表
+
+    :param record_access: 是否记为用户访问（更新 LastAccessAt），后台统计任务读取时为 False
+    """
+    return _iter_matching(user_id, {uid: _end_ids_condition(end_ids)}, record_access=record_access)
+
+
+def iter_gacha_log_batch(user_id, end_ids_by_uid: dict):
+    """
+    一次查询多个 UID 的记录，end_ids_by_uid 为 {Uid: end_ids}。
+    产出的记录带有 Uid 字段，用于区分所属 UID。
+    """
+    conditions = {uid: _end_ids_condition(end_ids) for uid, end_ids in end_ids_by_uid.items()}
+    return _iter_matching(user_id, conditions, tag_uid=True)
+
+
+def _end_ids_condition(end_ids) -> tuple:
+    """end_ids 对应的 (MongoDB 查询条件, 本地筛选函数)"""
+    expanded_end_ids = _expand_end_ids(end_ids)
+
+    def matches(item):
         gacha_type = str(item.get('GachaType', ''))
         item_id = item.get('Id', 0)
         # end_ids有可能是0，那么返回全部
-        if (gacha_type in end_ids and item_id < end_ids[gacha_type]) or end_ids.get(gacha_type, 0) == 0:
-            filtered_items.append(item)
-    
-    return filtered_items
+        return (gacha_type in expanded_end_ids and item_id < expanded_end_ids[gacha_type]) \
+            or expanded_end_ids.get(gacha_type, 0) == 0
+
+    return _end_ids_filter(end_ids), matches
+
+
+def _iter_matching(user_id, conditions: dict, tag_uid: bool = False, record_access: bool = True):
+    """
+    逐条产出满足条件的记录。conditions 为 {Uid: (match, predicate)}，match 为 MongoDB 查询条件，
+    predicate 为 columnar 模式下本地筛选用的等价条件；多个 UID 在同一次查询中完成。
+    document/item 模式在数据库中筛选，只有符合条件的记录会被传输。
+    tag_uid 为 True 时在记录中加上 Uid 字段；record_access 为 True 时更新这些 UID 的 LastAccessAt。
+    """
+    _ensure_indexes()
+    for uid in conditions:
+        _restore_archived(user_id, uid)
+    if record_access:
+        _record_access(user_id, list(conditions))
+    mode = _storage_mode()
+    if mode == STORAGE_MODE_ITEM:
+        return _iter_item(user_id, conditions, tag_uid)
+    if mode == STORAGE_MODE_COLUMNAR:
+        return _iter_columnar(user_id, conditions, tag_uid)
+    return _iter_document(user_id, conditions, tag_uid)
+
+
+def _iter_document(user_id, conditions: dict, tag_uid: bool):
+    """document 模式下在数据库中展开 data 数组并筛选"""
+    if len(conditions) == 1 and not tag_uid:
+        (uid, (match, _)), = conditions.items()
+        pipeline = [
+            {"$match": {"user_id": user_id, "Uid": uid}},
+            {"$unwind": "$data"},
+            {"$replaceRoot": {"newRoot": "$data"}},
+            {"$match": match},
+            {"$unset": "_Seq"}
+        ]
+    else:
+        pipeline = [
+            {"$match": {"user_id": user_id, "Uid": {"$in": list(conditions)}}},
+            {"$unwind": "$data"},
+            {"$replaceRoot": {"newRoot": {"$mergeObjects": ["$data", {"Uid": "$Uid"}]}}},
+            {"$match": {"$or": [{**match, "Uid": uid} for uid, (match, _) in conditions.items()]}},
+            {"$unset": ["_Seq"] if tag_uid else ["_Seq", "Uid"]}
+        ]
+    return client.ht_server.GachaLog.aggregate(pipeline, batchSize=RETRIEVE_BATCH_SIZE)
+
+
+def _iter_item(user_id, conditions: dict, tag_uid: bool):
+    """item 模式下直接使用索引上的 GachaType/Id/_Seq 字段查询"""
+    cursor = client.ht_server.GachaLogItem.find(
+        {"user_id": user_id, "$or": [{**match, "Uid": uid} for uid, (match, _) in conditions.items()]},
+        {"_id": 0, "Uid": 1, "item": 1},
+        batch_size=RETRIEVE_BATCH_SIZE
+    )
+    for record in cursor:
+        if tag_uid:
+            yield {**record['item'], "Uid": record['Uid']}
+        else:
+            yield record['item']
+
+
+def _iter_columnar(user_id, conditions: dict, tag_uid: bool):
+    """columnar 模式下逐块解码后在本地筛选"""
+    cursor = client.ht_server.GachaLogColumnar.find(
+        {"user_id": user_id, "Uid": {"$in": list(conditions)}},
+        {"_id": 0, "Uid": 1, "blocks": 1}
+    )
+    for gacha_log in cursor:
+        uid = gacha_log['Uid']
+        _, predicate = conditions[uid]
+        for item in _iter_columnar_items(gacha_log.get('blocks', [])):
+            if predicate(item):
+                item = _strip_sequence(item)
+                if tag_uid:
+                    item['Uid'] = uid
+                yield item
+
+
+def sync_gacha_log(user_id, uid, sync_token: str | None):
+    """
+    按同步令牌增量同步记录。
+
+    :param sync_token: 客户端上次同步得到的令牌，首次同步时为空
+    :return: (新的同步令牌, 是否为全量同步, 记录迭代器)
+    """
+    state = _sync_state(user_id, uid)
+    current = state['Sequence']
+    since = None
+    if sync_token:
+        epoch, _, sequence = sync_token.partition('.')
+        if epoch == state['Epoch'] and sequence.isdigit() and int(sequence) <= current:
+            since = int(sequence)
+
+    new_token = f"{state['Epoch']}.{current}"
+    if since is None:
+        # 首次同步、纪元变化（记录被删除后重新上传）或令牌无效时全量同步
+        return new_token, True, iter_gacha_log(user_id, uid, {})
+
+    # 只返回已提交的序号范围内的记录，正在上传中的记录留到下次同步
+    match = {"_Seq": {"$gt": since, "$lte": current}}
+    items = _iter_matching(user_id, {uid: (match, lambda item: since < item.get('_Seq', 0) <= current)})
+    return new_token, False, items
 
 
 def delete_gacha_log(user_id, uid):
     """删除指定用户的祈愿记录"""
-    result = client.ht_server.GachaLog.delete_one({"user_id": user_id, "Uid": uid})
-    return result.deleted_count > 0
\ No newline at end of file
+    _ensure_indexes()
+    client.ht_server.GachaLogSummary.delete_one({"user_id": user_id, "Uid": uid})
+    client.ht_server.GachaLogSyncState.delete_one({"user_id": user_id, "Uid": uid})
+    archived = client.ht_server.GachaLogArchive.delete_one({"user_id": user_id, "Uid": uid})
+    # 迁移存储模式期间其他模式的集合中也可能有该 UID 的记录，一并删除，避免补迁移时恢复已删除的记录
+    deleted = 0
+    for collection in STORAGE_COLLECTIONS.values():
+        deleted += client.ht_server[collection].delete_many({"user_id": user_id, "Uid": uid}).deleted_count
+    return deleted > 0 or archived.deleted_count > 0
+
+
+def merge_duplicate_gacha_logs() -> int:
+    """
+    合并同一 (user_id, Uid) 的多个 GachaLog 文档（唯一索引建立前并发首次上传产生），返回合并的 UID 数。
+    按 _id 顺序合并记录，后写入的文档中相同 Id 的记录优先，合并到最早的文档后删除其余文档。
+    需要在停止上传时运行。
+    """
+    db = client.ht_server
+    pipeline = [
+        {"$group": {"_id": {"user_id": "$user_id", "Uid": "$Uid"}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    merged = 0
+    for group in db.GachaLog.aggregate(pipeline, allowDiskUse=True):
+        user_id, uid = group['_id']['user_id'], group['_id']['Uid']
+        documents = list(db.GachaLog.find({"_id": {"$in": group['ids']}}).sort("_id", 1))
+        items = {}
+        for document in documents:
+            for item in document.get('data', []):
+                items[item.get('Id')] = item
+        first = documents[0]
+        db.GachaLog.update_one({"_id": first['_id']}, {
+            "$set": {"data": list(items.values())},
+            "$inc": {"Version": 1}
+        })
+        db.GachaLog.delete_many({"_id": {"$in": [document['_id'] for document in documents[1:]]}})
+        if _storage_mode() == STORAGE_MODE_DOCUMENT:
+            _rebuild_summary(user_id, uid)
+        logger.info(f"Merged {len(documents)} GachaLog documents of uid {uid}")
+        merged += 1
+    return merged
+
+
+def archive_gacha_log(user_id, uid) -> int | None:
+    """
+    把指定 UID 的记录移到冷归档，返回归档的记录条数；已归档、没有记录或归档期间有新的写入时返回 None。
+    document/columnar 模式按文档的 Version 比较并删除，期间有写入时放弃本次归档；
+    item 模式只删除已归档的序号范围内的记录，期间新写入的记录保留在 GachaLogItem 中。
+    """
+    _ensure_indexes()
+    selector = {"user_id": user_id, "Uid": uid}
+    if client.ht_server.GachaLogArchive.find_one(selector, {"_id": 1}):
+        return None
+
+    mode = _storage_mode()
+    version = 0
+    max_sequence = 0
+    if mode == STORAGE_MODE_ITEM:
+        items = []
+        for record in client.ht_server.GachaLogItem.find(selector, {"_id": 0, "_Seq": 1, "item": 1}):
+            sequence = record.get('_Seq', 0)
+            max_sequence = max(max_sequence, sequence)
+            items.append({**record['item'], "_Seq": sequence})
+    elif mode == STORAGE_MODE_COLUMNAR:
+        blocks, version = _columnar_state(user_id, uid)
+        items = list(_iter_columnar_items(blocks))
+    else:
+        gacha_log = client.ht_server.GachaLog.find_one(selector, {"_id": 0, "data": 1, "Version": 1}) or {}
+        version = gacha_log.get('Version', 0)
+        items = list({item.get('Id'): item for item in gacha_log.get('data', [])}.values())
+    if not items:
+        return None
+
+    try:
+        archive_id = client.ht_server.GachaLogArchive.insert_one({
+            **selector,
+            "blocks": encode_blocks(items, COLUMNAR_BLOCK_SIZE),
+            "ItemCount": len(items),
+            "State": "archiving",
+            "ArchivedAt": datetime.datetime.utcnow()
+        }).inserted_id
+    except DuplicateKeyError:
+        return None
+
+    if mode == STORAGE_MODE_ITEM:
+        client.ht_server.GachaLogItem.delete_many({
+            **selector,
+            "$or": [{"_Seq": {"$lte": max_sequence}}, {"_Seq": {"$exists": False}}]
+        })
+    else:
+        result = _storage_collection().delete_one({**selector, **_version_filter(version)})
+        if not result.deleted_count:
+            # 读取之后有新的写入，放弃本次归档
+            client.ht_server.GachaLogArchive.delete_one({"_id": archive_id})
+            logger.debug(f"Gacha log archive aborted for uid: {uid}, concurrent write")
+            return None
+
+    # 当前存储中的记录删除后归档才生效，之前的访问不会合并归档
+    client.ht_server.GachaLogArchive.update_one({"_id": archive_id}, {"$set": {"State": "archived"}})
+    client.ht_server.GachaLogSummary.update_one(selector, {"$set": {"Archived": True}})
+    logger.info(f"Gacha log archived for user_id: {user_id}, uid: {uid}, items: {len(items)}")
+    return len(items)
+
+
+def _archives_possible() -> bool:
+    """是否可能有需要恢复的归档：启用冷归档时总是可能，未启用时只有关闭前留下的归档"""
+    global _archive_presence
+    if config_loader.GACHA_LOG_ARCHIVE_ENABLED:
+        return True
+    checked_at, present = _archive_presence
+    if checked_at is None or time.monotonic() - checked_at >= ARCHIVE_PRESENCE_CHECK_SECONDS:
+        present = client.ht_server.GachaLogArchive.estimated_document_count() > 0
+        _archive_presence = (time.monotonic(), present)
+    return present
+
+
+def _restore_archived(user_id, uid):
+    """如果记录已归档，把归档合并回当前存储模式并删除归档。当前存储中已有的同 Id 记录不会被归档覆盖"""
+    if not _archives_possible():
+        return
+    selector = {"user_id": user_id, "Uid": uid}
+    # 长时间停留在 archiving 状态说明归档过程异常中断，当前存储中的记录可能已被删除，同样需要合并
+    stale_before = datetime.datetime.utcnow() - datetime.timedelta(seconds=ARCHIVING_TIMEOUT_SECONDS)
+    archive = client.ht_server.GachaLogArchive.find_one(
+        {**selector, "$or": [{"State": "archived"}, {"ArchivedAt": {"$lt": stale_before}}]},
+        {"blocks": 1}
+    )
+    if archive is None:
+        return
+
+    blocks = archive.get('blocks', [])
+    mode = _storage_mode()
+    if mode == STORAGE_MODE_ITEM:
+        operations = []
+        for item in _iter_columnar_items(blocks):
+            sequence = item.pop('_Seq', 0)
+            key, record = _item_record(user_id, uid, item, sequence)
+            operations.append(UpdateOne(key, {"$setOnInsert": record}, upsert=True))
+        if operations:
+            client.ht_server.GachaLogItem.bulk_write(operations, ordered=False)
+    elif mode == STORAGE_MODE_COLUMNAR:
+        # 归档块放在最前面，之后追加的块中相同 Id 的记录优先
+        client.ht_server.GachaLogColumnar.update_one(
+            selector,
+            {"$push": {"blocks": {"$each": blocks, "$position": 0}}, "$inc": {"Version": 1}},
+            upsert=True
+        )
+    else:
+        archived_items = list(_iter_columnar_items(blocks))
+        client.ht_server.GachaLog.update_one(selector, [{
+            "$set": {
+                "Version": {"$add": [{"$ifNull": ["$Version", 0]}, 1]},
+                "data": {
+                    "$let": {
+                        "vars": {"existing": {"$ifNull": ["$data", []]}},
+                        "in": {
+                            "$concatArrays": [
+                                {
+                                    "$filter": {
+                                        "input": {"$literal": archived_items},
+                                        "cond": {"$not": [{"$in": ["$$this.Id", "$$existing.Id"]}]}
+                                    }
+                                },
+                                "$$existing"
+                            ]
+                        }
+                    }
+                }
+            }
+        }], upsert=True)
+
+    client.ht_server.GachaLogArchive.delete_one({"_id": archive['_id']})
+    # 恢复说明有访问，重新开始计算不活跃时间，避免下一次归档任务立即再次归档
+    client.ht_server.GachaLogSummary.update_one(
+        selector,
+        {"$unset": {"Archived": ""}, "$set": {"LastAccessAt": datetime.datetime.utcnow()}}
+    )
+    logger.info(f"Gacha log restored from archive for user_id: {user_id}, uid: {uid}")
+
+
+def _record_access(user_id, uids: list):
+    """记录 UID 的最后访问时间，距上次记录不足 ACCESS_STAMP_SECONDS 时不写入，只在启用冷归档时记录"""
+    if not config_loader.GACHA_LOG_ARCHIVE_ENABLED:
+        return
+    now = datetime.datetime.utcnow()
+    client.ht_server.GachaLogSummary.update_many(
+        {
+            "user_id": user_id,
+            "Uid": {"$in": uids},
+            "LastAccessAt": {"$not": {"$gte": now - datetime.timedelta(seconds=ACCESS_STAMP_SECONDS)}}
+        },
+        {"$set": {"LastAccessAt": now}}
+    )
@@ -0,0 +1,274 @@
+import datetime
+import functools
+import hashlib
+import time
+from app.extensions import client, logger
+from app.config_loader import config_loader
+from app.schema import ensure_indexes
+from app.utils.periodic_job import start_periodic_job
+from services.gacha_log_service import iter_gacha_log
+
+"""
+全服祈愿统计分布。
+
+统计由后台周期任务完成，接口只读取快照，不会在请求中扫描用户数据：
+1. 对比 GachaLogSummary.LastUploadAt 和五星角色表的版本，只重新统计上传过新记录或五星角色表变化后未重新统计的 UID，
+   结果保存在 GachaDistributionContribution（每个 UID 一个）；
+   已归档的 UID 不重新统计（读取记录会把归档恢复），保留归档前的统计结果
+2. 在 MongoDB 中聚合所有 UID 的统计结果，写入 GachaDistributionSnapshot（每个分布类型一个，带 Version）
+3. 各进程在内存中缓存快照，定期检查是否有新版本
+没有汇总文档的旧数据不参与统计，需要先运行一次 BackfillGachaLogSummaryTool。
+"""
+
+# 分布类型 -> 对应的 GachaType（400 与 301 同属角色活动祈愿）
+DISTRIBUTION_TYPES = {
+    "AvatarEvent": (301, 400),
+    "WeaponEvent": (302,),
+    "Chronicled": (500,),
+}
+
+# 客户端也可能以枚举值请求
+_DISTRIBUTION_TYPE_VALUES = {str(index): name for index, name in enumerate(DISTRIBUTION_TYPES)}
+
+# 常驻及限定五星角色（截至 10000116 伊涅芙），新角色上线后可以通过配置项 GACHA_LOG.FIVE_STAR_AVATAR_IDS 补充
+DEFAULT_FIVE_STAR_AVATAR_IDS = frozenset({
+    10000002, 10000003, 10000016, 10000022, 10000026, 10000029, 10000030, 10000033, 10000035,
+    10000037, 10000038, 10000041, 10000042, 10000046, 10000047, 10000049, 10000051, 10000052,
+    10000054, 10000057, 10000058, 10000060, 10000062, 10000063, 10000066, 10000069, 10000070,
+    10000071, 10000073, 10000075, 10000078, 10000079, 10000082, 10000084, 10000086, 10000087,
+    10000089, 10000091, 10000093, 10000094, 10000095, 10000096, 10000098, 10000099, 10000101,
+    10000102, 10000103, 10000104, 10000106, 10000107, 10000109, 10000111, 10000112, 10000114,
+    10000116,
+})
+
+# 进程内快照缓存的有效期，过期后重新读取快照文档
+SNAPSHOT_RELOAD_SECONDS = 60
+
+# 刷新时游标每批取回的汇总文档数，以及每次删除的统计结果数
+STATISTICS_BATCH_SIZE = 100
+
+_snapshots = {}
+# 已经提示过不在五星角色表中的角色ID
+_warned_avatar_ids = set()
+
+
+def five_star_avatar_ids() -> frozenset:
+    """内置的五星角色表加上配置项中补充的角色"""
+    configured = config_loader.GACHA_LOG_FIVE_STAR_AVATAR_IDS
+    if configured:
+        return DEFAULT_FIVE_STAR_AVATAR_IDS | frozenset(int(avatar_id) for avatar_id in configured)
+    return DEFAULT_FIVE_STAR_AVATAR_IDS
+
+
+@functools.lru_cache(maxsize=8)
+def _newest_avatar_id(avatar_ids: frozenset) -> int:
+    return max(avatar_ids, default=0)
+
+
+def warn_unknown_avatar_id(item_id: int, avatar_ids: frozenset):
+    """
+    角色ID（1000xxxx）比五星角色表中最新的角色还新时，无法判断星级，按非五星计算。
+    记录警告提示补充 GACHA_LOG.FIVE_STAR_AVATAR_IDS，每个ID只提示一次
+    """
+    if not 10000000 <= item_id < 10010000 or item_id in _warned_avatar_ids or item_id in avatar_ids \
+            or item_id <= _newest_avatar_id(avatar_ids):
+        return
+    _warned_avatar_ids.add(item_id)
+    logger.warning(f"Avatar {item_id} is newer than the 5-star avatar table and is counted as non-5-star, "
+                   f"add it to GACHA_LOG.FIVE_STAR_AVATAR_IDS if it is a 5-star character")
+
+
+def is_five_star(item_id, avatar_ids: frozenset) -> bool:
+    """判断物品是否为五星。武器ID为5位数，百位是星级；角色ID无法直接判断，查表"""
+    try:
+        item_id = int(item_id)
+    except (TypeError, ValueError):
+        return False
+    if 10000 <= item_id < 100000:
+        return (item_id // 100) % 10 == 5
+    if item_id in avatar_ids:
+        return True
+    warn_unknown_avatar_id(item_id, avatar_ids)
+    return False
+
+
+def normalize_distribution_type(distribution_type: str) -> str | None:
+    """把请求中的分布类型统一为 DISTRIBUTION_TYPES 中的名称，无法识别时返回 None"""
+    if distribution_type in _DISTRIBUTION_TYPE_VALUES:
+        return _DISTRIBUTION_TYPE_VALUES[distribution_type]
+    for name in DISTRIBUTION_TYPES:
+        if name.lower() == distribution_type.lower():
+            return name
+    return None
+
+
+def _item_order(item):
+    try:
+        return int(item.get('Id', 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def compute_pity_distribution(items, avatar_ids: frozenset) -> dict:
+    """
+    统计单个 UID 各分布类型的出金间隔。
+    返回 {分布类型: {"Pulls": 出金所用的总抽数, "Pity": {"间隔抽数": 次数}}}，最后一次出金之后未出金的抽数不计入。
+    """
+    type_names = {}
+    for name, gacha_types in DISTRIBUTION_TYPES.items():
+        for gacha_type in gacha_types:
+            type_names[str(gacha_type)] = name
+
+    grouped = {}
+    for item in items:
+        name = type_names.get(str(item.get('GachaType', '')))
+        if name:
+            grouped.setdefault(name, []).append(item)
+
+    result = {}
+    for name, type_items in grouped.items():
+        type_items.sort(key=_item_order)
+        pity_counts = {}
+        pulls = 0
+        pity = 0
+        for item in type_items:
+            pity += 1
+            if is_five_star(item.get('ItemId'), avatar_ids):
+                pity_counts[str(pity)] = pity_counts.get(str(pity), 0) + 1
+                pulls += pity
+                pity = 0
+        result[name] = {"Pulls": pulls, "Pity": pity_counts}
+    return result
+
+
+def _uid_lookup(collection: str, alias: str, projection: dict) -> dict:
+    """按 (user_id, Uid) 关联另一个集合的 $lookup 阶段，两个集合都有 (user_id, Uid) 唯一索引"""
+    return {"$lookup": {
+        "from": collection,
+        "let": {"user_id": "$user_id", "uid": "$Uid"},
+        "pipeline": [
+            {"$match": {"$expr": {"$and": [{"$eq": ["$user_id", "$$user_id"]}, {"$eq": ["$Uid", "$$uid"]}]}}},
+            {"$project": projection}
+        ],
+        "as": alias
+    }}
+
+
+def avatar_table_version(avatar_ids: frozenset) -> str:
+    """五星角色表的版本，统计结果记录计算时使用的版本，角色表变化后重新统计"""
+    return hashlib.sha1(",".join(str(avatar_id) for avatar_id in sorted(avatar_ids)).encode()).hexdigest()
+
+
+def _stale_summaries(db, table_version: str):
+    """逐批返回统计结果缺失、已过期或使用旧的五星角色表计算的未归档 UID 的汇总文档"""
+    pipeline = [
+        {"$match": {"Archived": {"$ne": True}}},
+        {"$project": {"_id": 0, "user_id": 1, "Uid": 1, "LastUploadAt": 1}},
+        _uid_lookup("GachaDistributionContribution", "contribution",
+                    {"_id": 0, "SourceUploadAt": 1, "AvatarTable": 1}),
+        {"$match": {"$expr": {"$or": [
+            {"$eq": [{"$size": "$contribution"}, 0]},
+            {"$ne": [{"$arrayElemAt": ["$contribution.SourceUploadAt", 0]}, "$LastUploadAt"]},
+            {"$ne": [{"$arrayElemAt": ["$contribution.AvatarTable", 0]}, table_version]}
+        ]}}},
+        {"$project": {"contribution": 0}}
+    ]
+    return db.GachaLogSummary.aggregate(pipeline, batchSize=STATISTICS_BATCH_SIZE)
+
+
+def _delete_orphan_contributions(db) -> int:
+    """删除记录已被删除的 UID 的统计结果"""
+    pipeline = [
+        {"$project": {"user_id": 1, "Uid": 1}},
+        _uid_lookup("GachaLogSummary", "summary", {"_id": 1}),
+        {"$match": {"summary": {"$size": 0}}},
+        {"$project": {"_id": 1}}
+    ]
+    orphan_ids = [c['_id'] for c in db.GachaDistributionContribution.aggregate(pipeline)]
+    for index in range(0, len(orphan_ids), STATISTICS_BATCH_SIZE):
+        db.GachaDistributionContribution.delete_many({"_id": {"$in": orphan_ids[index:index + STATISTICS_BATCH_SIZE]}})
+    return len(orphan_ids)
+
+
+def _aggregate_totals(db) -> dict:
+    """在 MongoDB 中按分布类型汇总所有 UID 的统计结果，只返回各分布类型的合计"""
+    totals = {name: {"Pulls": 0, "Pity": {}} for name in DISTRIBUTION_TYPES}
+    distributions = [
+        {"$project": {"_id": 0, "distribution": {"$objectToArray": "$Distributions"}}},
+        {"$unwind": "$distribution"},
+    ]
+    pulls = distributions + [
+        {"$group": {"_id": "$distribution.k", "Pulls": {"$sum": "$distribution.v.Pulls"}}}
+    ]
+    for group in db.GachaDistributionContribution.aggregate(pulls, allowDiskUse=True):
+        if group['_id'] in totals:
+            totals[group['_id']]['Pulls'] = group['Pulls']
+
+    pity = distributions + [
+        {"$project": {"name": "$distribution.k", "pity": {"$objectToArray": "$distribution.v.Pity"}}},
+        {"$unwind": "$pity"},
+        {"$group": {"_id": {"name": "$name", "pity": "$pity.k"}, "Count": {"$sum": "$pity.v"}}}
+    ]
+    for group in db.GachaDistributionContribution.aggregate(pity, allowDiskUse=True):
+        total = totals.get(group['_id']['name'])
+        if total is not None:
+            total['Pity'][group['_id']['pity']] = group['Count']
+    return totals
+
+
+def refresh_distribution_snapshots():
+    """增量更新各 UID 的统计结果并生成新的全服快照"""
+    db = client.ht_server
+    ensure_indexes(["GachaDistributionContribution"])
+    avatar_ids = five_star_avatar_ids()
+    table_version = avatar_table_version(avatar_ids)
+
+    updated = 0
+    for summary in _stale_summaries(db, table_version):
+        key = (summary['user_id'], summary['Uid'])
+        last_upload_at = summary.get('LastUploadAt')
+        distributions = compute_pity_distribution(iter_gacha_log(*key, {}, record_access=False), avatar_ids)
+        db.GachaDistributionContribution.replace_one(
+            {"user_id": key[0], "Uid": key[1]},
+            {"user_id": key[0], "Uid": key[1], "SourceUploadAt": last_upload_at, "AvatarTable": table_version,
+             "Distributions": distributions},
+            upsert=True
+        )
+        updated += 1
+
+    deleted = _delete_orphan_contributions(db)
+    totals = _aggregate_totals(db)
+
+    version = int(time.time() * 1000)
+    generated_at = datetime.datetime.utcnow()
+    for name, total in totals.items():
+        db.GachaDistributionSnapshot.replace_one({"_id": name}, {
+            "_id": name,
+            "Version": version,
+            "GeneratedAt": generated_at,
+            "TotalValidPulls": total['Pulls'],
+            "Distribution": [
+                {"Count": int(pity), "Value": count}
+                for pity, count in sorted(total['Pity'].items(), key=lambda p: int(p[0]))
+            ]
+        }, upsert=True)
+
+    logger.info(f"Gacha distribution snapshots refreshed, version {version}, {updated} uid(s) recomputed, "
+                f"{deleted} removed")
+
+
+def get_distribution_snapshot(distribution_type: str) -> dict | None:
+    """从进程内缓存读取快照，缓存过期后重新读取一次快照文档"""
+    cached = _snapshots.get(distribution_type)
+    if cached and time.monotonic() - cached[0] < SNAPSHOT_RELOAD_SECONDS:
+        return cached[1]
+    snapshot = client.ht_server.GachaDistributionSnapshot.find_one({"_id": distribution_type}, {"_id": 0})
+    _snapshots[distribution_type] = (time.monotonic(), snapshot)
+    return snapshot
+
+
+def start_statistics_job():
+    """启动统计快照的后台刷新任务"""
+    interval_seconds = config_loader.GACHA_LOG_STATISTICS_INTERVAL_MINUTES * 60
+    start_periodic_job("gacha_distribution", refresh_distribution_snapshots, interval_seconds,
+                       lease_seconds=max(interval_seconds, 3600))
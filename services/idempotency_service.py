@@ -0,0 +1,94 @@
+import datetime
+import hashlib
+from pymongo.errors import DuplicateKeyError
+from app.extensions import client, logger
+from app.schema import ensure_indexes
+
+"""
+Idempotency-Key 支持：同一用户在有效期内使用相同 Key 重复提交同一接口时，直接返回第一次的结果。
+记录保存在 idempotency_keys 集合中，state 为 pending（处理中）或 done（已完成，response 为第一次的响应），
+过期时间由 TTL 索引控制。处理中的记录有单独的较短有效期，进程异常退出后重试可以重新处理。
+完成时同时保存请求体的 SHA-256 摘要（request_hash），重复提交的请求体与第一次不同时不返回第一次的结果。
+"""
+
+# Key 的最大长度
+MAX_KEY_LENGTH = 255
+
+# 处理中记录的有效期，超过后视为处理已中断
+PENDING_SECONDS = 300
+
+
+def begin_request(user_id, scope: str, key: str) -> dict | None:
+    """
+    开始处理带 Idempotency-Key 的请求。
+
+    :return: 成功占用 Key 时返回 None，调用方需要在处理结束后调用 complete_request 或 abandon_request；
+             Key 已被使用时返回已有记录 {"state": "pending" | "done", "response": ..., "request_hash": ...}
+    """
+    ensure_indexes(["idempotency_keys"])
+    collection = client.ht_server.idempotency_keys
+    selector = {"user_id": user_id, "scope": scope, "key": key}
+    now = datetime.datetime.utcnow()
+    pending = {"state": "pending", "response": None, "expire_at": now + datetime.timedelta(seconds=PENDING_SECONDS)}
+
+    try:
+        collection.insert_one({**selector, **pending})
+        return None
+    except DuplicateKeyError:
+        pass
+
+    # TTL 索引的清理有延迟，已过期但尚未删除的记录可以直接接管
+    existing = collection.find_one_and_update(
+        {**selector, "expire_at": {"$lte": now}},
+        {"$set": pending},
+        projection={"_id": 0, "state": 1}
+    )
+    if existing is not None:
+        return None
+
+    existing = collection.find_one(selector, {"_id": 0, "state": 1, "response": 1, "request_hash": 1})
+    if existing is None:
+        # 记录恰好在两次查询之间被清理
+        return begin_request(user_id, scope, key)
+    logger.info(f"Idempotency key replayed for user_id: {user_id}, scope: {scope}, state: {existing['state']}")
+    return existing
+
+
+def hash_chunks(chunks, digest):
+    """逐块产出请求体，同时把内容写入 digest（hashlib 对象），请求体读取完毕后摘要即可用"""
+    for chunk in chunks:
+        digest.update(chunk)
+        yield chunk
+
+
+def request_hash(chunks) -> str:
+    """读取整个请求体并返回其 SHA-256 摘要，不保留请求体内容"""
+    digest = hashlib.sha256()
+    for _ in hash_chunks(chunks, digest):
+        pass
+    return digest.hexdigest()
+
+
+def matches_request(existing: dict, body_hash: str) -> bool:
+    """重复提交的请求体是否与第一次相同，保存摘要之前完成的旧记录视为相同"""
+    return existing.get('request_hash') in (None, body_hash)
+
+
+def complete_request(user_id, scope: str, key: str, response: dict, window_minutes: int, body_hash: str):
+    """保存处理结果和请求体摘要，有效期内请求体相同的重试直接返回该结果"""
+    client.ht_server.idempotency_keys.update_one(
+        {"user_id": user_id, "scope": scope, "key": key},
+        {"$set": {
+            "state": "done",
+            "response": response,
+            "request_hash": body_hash,
+            "expire_at": datetime.datetime.utcnow() + datetime.timedelta(minutes=window_minutes)
+        }}
+    )
+
+
+def abandon_request(user_id, scope: str, key: str):
+    """处理失败时释放 Key，允许客户端重试"""
+    client.ht_server.idempotency_keys.delete_one(
+        {"user_id": user_id, "scope": scope, "key": key, "state": "pending"}
+    )
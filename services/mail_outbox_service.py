@@ -0,0 +1,196 @@
+import datetime
+import os
+import random
+import socket
+import smtplib
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from pymongo import ASCENDING, ReturnDocument
+from app.extensions import client, logger
+from app.config_loader import config_loader
+from app.schema import ensure_indexes
+from app.utils.smtp_pool import SMTPConnectionPool, CircuitBreaker
+
+"""
+邮件发件箱。
+接口只把邮件写入 mail_outbox 集合后立即返回，由每个进程中的后台发送线程领取并发送。
+发送线程通过连接池复用已登录的 SMTP 连接；发送失败时按指数退避重试，连续失败达到阈值时熔断，
+邮件服务商恢复后自动继续发送。
+邮件在 expire_at 之后不再发送（验证码已经过期），记录由 TTL 索引清理。
+领取时设置 lease_until，发送线程所在进程崩溃后，租约到期的邮件由其他进程重新领取。
+"""
+
+# 最大发送次数
+MAX_ATTEMPTS = 5
+
+# 重试间隔的基数和上限（秒），第 n 次失败后等待 BACKOFF_BASE_SECONDS * 2^(n-1)
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 300
+
+# 发送租约时长（秒），应大于一次发送的最长耗时
+SEND_LEASE_SECONDS = 120
+
+# 没有待发送邮件时的轮询间隔（秒）
+POLL_SECONDS = 5
+
+# 连续失败多少次后熔断，以及熔断时长（秒）
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 60
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+_started = False
+_started_lock = threading.Lock()
+# 本进程写入新邮件时唤醒发送线程
+_wakeup = threading.Event()
+_breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+
+
+def enqueue_mail(to_email: str, subject: str, html_body: str, text_body: str, app_name: str | None = None,
+                 expire_minutes: int = 60):
+    """
+    写入发件箱，邮件由后台线程发送
+
+    :param expire_minutes: 超过该时间仍未发送成功的邮件不再发送
+    """
+    ensure_indexes(["mail_outbox"])
+    now = datetime.datetime.utcnow()
+    result = client.ht_server.mail_outbox.insert_one({
+        "to": to_email,
+        "subject": subject,
+        "html_body": html_body,
+        "text_body": text_body,
+        "app_name": app_name,
+        "state": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now,
+        "expire_at": now + datetime.timedelta(minutes=expire_minutes)
+    })
+    _wakeup.set()
+    return result.inserted_id
+
+
+def build_message(from_addr: str, mail: dict) -> str:
+    """同时包含纯文本和 HTML 内容，不支持 HTML 的客户端显示纯文本"""
+    message = MIMEMultipart("alternative")
+    message["From"] = f"{mail['app_name']} <{from_addr}>" if mail.get('app_name') else from_addr
+    message["To"] = mail['to']
+    message["Subject"] = mail['subject']
+    message.attach(MIMEText(mail['text_body'], "plain"))
+    message.attach(MIMEText(mail['html_body'], "html"))
+    return message.as_string()
+
+
+def _claim() -> dict | None:
+    """领取一封到达发送时间的邮件，租约过期的 sending 状态邮件也可以重新领取"""
+    now = datetime.datetime.utcnow()
+    return client.ht_server.mail_outbox.find_one_and_update(
+        {
+            "$or": [
+                {"state": "pending", "next_attempt_at": {"$lte": now}},
+                # 发送线程所在进程崩溃后租约到期，已用完发送次数的邮件不再领取
+                {"state": "sending", "lease_until": {"$lt": now}, "attempts": {"$lt": MAX_ATTEMPTS}}
+            ],
+            "expire_at": {"$gt": now}
+        },
+        {
+            "$set": {"state": "sending", "owner": _OWNER,
+                     "lease_until": now + datetime.timedelta(seconds=SEND_LEASE_SECONDS)},
+            "$inc": {"attempts": 1}
+        },
+        sort=[("next_attempt_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _finish(mail: dict, update: dict):
+    client.ht_server.mail_outbox.update_one(
+        {"_id": mail['_id'], "owner": _OWNER, "state": "sending"},
+        {"$set": update, "$unset": {"lease_until": ""}}
+    )
+
+
+def _retry_or_fail(mail: dict, error: Exception):
+    if mail['attempts'] >= MAX_ATTEMPTS:
+        logger.error(f"Giving up mail {mail['_id']} to {mail['to']} after {mail['attempts']} attempts: {error}")
+        _finish(mail, {"state": "failed", "last_error": str(error)})
+        return
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (mail['attempts'] - 1), BACKOFF_MAX_SECONDS)
+    delay *= random.uniform(0.8, 1.2)
+    logger.warning(f"Failed to send mail {mail['_id']} to {mail['to']}, retrying in {delay:.0f}s: {error}")
+    _finish(mail, {
+        "state": "pending",
+        "last_error": str(error),
+        "next_attempt_at": datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)
+    })
+
+
+def process_outbox_once(pool: SMTPConnectionPool, from_addr: str) -> bool:
+    """领取并发送一封邮件，没有待发送的邮件时返回 False"""
+    mail = _claim()
+    if mail is None:
+        return False
+    try:
+        pool.send(from_addr, [mail['to']], build_message(from_addr, mail))
+    except smtplib.SMTPRecipientsRefused as e:
+        # 收件人地址被拒绝，重试也不会成功，不计入熔断
+        logger.error(f"Mail {mail['_id']} rejected for {mail['to']}: {e}")
+        _finish(mail, {"state": "failed", "last_error": str(e)})
+    except (smtplib.SMTPException, OSError) as e:
+        _breaker.record_failure()
+        _retry_or_fail(mail, e)
+    except Exception as e:
+        # 构造邮件等其他错误与邮件服务商无关，不计入熔断，但同样按重试次数处理，不能让邮件停留在 sending 状态
+        logger.error(f"Unexpected error while sending mail {mail['_id']}: {e}")
+        _retry_or_fail(mail, e)
+    else:
+        _breaker.record_success()
+        _finish(mail, {"state": "sent", "sent_at": datetime.datetime.utcnow()})
+        logger.info(f"Mail {mail['_id']} sent to {mail['to']}")
+    return True
+
+
+def create_smtp_pool() -> SMTPConnectionPool:
+    return SMTPConnectionPool(
+        config_loader.EMAIL_SMTP_HOST,
+        config_loader.EMAIL_SMTP_PORT,
+        config_loader.EMAIL_GMAIL_USER,
+        config_loader.EMAIL_APP_PASSWORD,
+        starttls=config_loader.EMAIL_SMTP_STARTTLS,
+        max_idle=config_loader.EMAIL_SENDER_THREADS
+    )
+
+
+def _sender_loop(pool: SMTPConnectionPool, from_addr: str):
+    while True:
+        try:
+            wait = _breaker.wait_seconds()
+            if wait:
+                time.sleep(wait)
+                continue
+            if not process_outbox_once(pool, from_addr):
+                if _wakeup.wait(POLL_SECONDS + random.uniform(0, 1)):
+                    _wakeup.clear()
+        except Exception as e:
+            logger.error(f"Mail sender failed: {e}")
+            time.sleep(POLL_SECONDS)
+
+
+def start_mail_senders():
+    """启动本进程的邮件发送线程，只启动一次"""
+    global _started
+    with _started_lock:
+        if _started:
+            return
+        _started = True
+
+    ensure_indexes(["mail_outbox"])
+    pool = create_smtp_pool()
+    from_addr = config_loader.EMAIL_GMAIL_USER
+    threads = config_loader.EMAIL_SENDER_THREADS
+    for index in range(threads):
+        threading.Thread(target=_sender_loop, args=(pool, from_addr), name=f"mail-sender-{index}",
+                         daemon=True).start()
+    logger.info(f"Started {threads} mail sender thread(s) for {config_loader.EMAIL_SMTP_HOST}")
@@ -0,0 +1,202 @@
+import datetime
+import time
+from typing import Iterator
+import msgspec
+from app.utils.json_stream import iter_json_object
+from services.gacha_log_schema import GachaItem, decode_item
+from services.gacha_log_service import iter_gacha_log, upload_gacha_log_stream
+
+"""
+UIGF 格式的导入与导出。
+
+导出为 UIGF v4.0，记录直接从 MongoDB 游标逐块转换输出，不在内存中保存完整记录；
+导入支持 UIGF v4（hk4e 数组，可包含多个 UID）和 v3（单个 UID 的 list），
+记录边解析边转换并校验，以 GachaItem 保存，全部通过校验后才交给分批上传逻辑写入，格式错误时不会写入任何记录。
+只有 name/item_type 而 item_id 为空的记录（部分旧工具导出的 v3 文件）无法确定物品，不支持导入。
+
+字段对应关系：uigf_gacha_type = QueryType，gacha_type = GachaType，item_id = ItemId，id = Id；
+UIGF 的 time 为 timezone 时区下的 "yyyy-MM-dd HH:mm:ss"，服务端保存的 Time 带时区偏移。
+"""
+
+UIGF_VERSION = "v4.0"
+EXPORT_APP = "Snap.Server"
+EXPORT_APP_VERSION = "1.0.0"
+
+# 每次输出的记录条数
+EXPORT_CHUNK_ITEMS = 500
+
+# 无法从记录判断时区时使用的默认时区（UTC+8）
+DEFAULT_TIMEZONE = 8
+
+_encoder = msgspec.json.Encoder()
+
+
+def _offset_suffix(timezone_hours: int) -> str:
+    """时区小时数转换为 "+08:00" 形式的偏移"""
+    sign = "-" if timezone_hours < 0 else "+"
+    return f"{sign}{abs(timezone_hours):02d}:00"
+
+
+def _timezone_of(item: dict) -> int:
+    """从记录的 Time 中读取时区，无法判断时返回默认时区"""
+    try:
+        offset = datetime.datetime.fromisoformat(item.get('Time', '')).utcoffset()
+    except (TypeError, ValueError):
+        return DEFAULT_TIMEZONE
+    if offset is None:
+        return DEFAULT_TIMEZONE
+    return int(offset.total_seconds() // 3600)
+
+
+def to_uigf_item(item: dict, timezone_hours: int, offset_suffix: str) -> dict:
+    """转换为 UIGF 记录，时间转换到 timezone_hours 时区"""
+    gacha_type = item.get('GachaType')
+    query_type = item.get('QueryType') or (301 if str(gacha_type) == "400" else gacha_type)
+    item_time = item.get('Time', '')
+    if len(item_time) == 25 and item_time.endswith(offset_suffix):
+        item_time = item_time[:10] + " " + item_time[11:19]
+    else:
+        try:
+            target = datetime.timezone(datetime.timedelta(hours=timezone_hours))
+            item_time = datetime.datetime.fromisoformat(item_time).astimezone(target).strftime("%Y-%m-%d %H:%M:%S")
+        except (TypeError, ValueError):
+            pass
+    return {
+        "uigf_gacha_type": str(query_type),
+        "gacha_type": str(gacha_type),
+        "item_id": str(item.get('ItemId')),
+        "count": "1",
+        "time": item_time,
+        "id": str(item.get('Id'))
+    }
+
+
+def from_uigf_item(item: dict, offset_suffix: str) -> dict:
+    """
+    把 UIGF 记录转换为上传记录格式
+
+    :raises ValueError: 缺少必要字段
+    """
+    if not isinstance(item, dict):
+        raise ValueError("UIGF item must be an object")
+    if item.get('item_id') in (None, ""):
+        raise ValueError(f"UIGF item {item.get('id')} has no item_id, items identified only by name are not supported")
+    try:
+        return {
+            "GachaType": item['gacha_type'],
+            "QueryType": item['uigf_gacha_type'],
+            "ItemId": item['item_id'],
+            "Time": item['time'].replace(" ", "T") + offset_suffix,
+            "Id": item['id']
+        }
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"invalid UIGF item: {item}") from e
+
+
+def iter_uigf_export(user_id, uids: list) -> Iterator[bytes]:
+    """逐块产出 UIGF v4.0 格式的导出数据"""
+    info = {
+        "export_timestamp": int(time.time()),
+        "export_app": EXPORT_APP,
+        "export_app_version": EXPORT_APP_VERSION,
+        "version": UIGF_VERSION
+    }
+    yield b'{"info":' + _encoder.encode(info) + b',"hk4e":['
+    for index, uid in enumerate(uids):
+        items = iter_gacha_log(user_id, uid, {})
+        first = next(items, None)
+        # 以第一条记录的时区作为该 UID 的时区
+        timezone_hours = _timezone_of(first) if first else DEFAULT_TIMEZONE
+        offset_suffix = _offset_suffix(timezone_hours)
+        account = {"uid": str(uid), "timezone": timezone_hours}
+        yield (b"," if index else b"") + _encoder.encode(account)[:-1] + b',"list":['
+
+        chunk = [to_uigf_item(first, timezone_hours, offset_suffix)] if first else []
+        written = False
+        for item in items:
+            chunk.append(to_uigf_item(item, timezone_hours, offset_suffix))
+            if len(chunk) >= EXPORT_CHUNK_ITEMS:
+                yield (b"," if written else b"") + _encoder.encode(chunk)[1:-1]
+                written = True
+                chunk = []
+        if chunk:
+            yield (b"," if written else b"") + _encoder.encode(chunk)[1:-1]
+        yield b"]}"
+    yield b"]}"
+
+
+def _timezone(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"invalid UIGF timezone: {value}") from e
+
+
+def _read_account(uid, timezone_hours, items) -> tuple[str, list[GachaItem]]:
+    """转换并校验一个 UID 的全部记录"""
+    if not isinstance(items, Iterator):
+        raise ValueError("UIGF list must be an array")
+    offset_suffix = _offset_suffix(timezone_hours)
+    decoded = []
+    for item in items:
+        uigf_item = from_uigf_item(item, offset_suffix)
+        try:
+            decoded.append(decode_item(uigf_item))
+        except msgspec.ValidationError as e:
+            raise ValueError(f"invalid UIGF item {item.get('id')}: {e}") from e
+    return uid, decoded
+
+
+def import_uigf(user_id, chunks) -> list:
+    """
+    导入 UIGF 数据，返回每个 UID 的上传结果 [{"Uid": ..., "Message": ...}]
+
+    :param chunks: 请求体数据块
+    :raises ValueError: 数据格式错误或不支持的 UIGF 版本，此时不会写入任何记录
+    """
+    accounts = []
+    info = {}
+    for key, value in iter_json_object(chunks, {"hk4e": {"list": None}, "list": None}):
+        if key == 'info':
+            info = value if isinstance(value, dict) else {}
+            version = str(info.get('version') or info.get('uigf_version') or '')
+            if version and not version.startswith(("v3", "v4")):
+                raise ValueError(f"unsupported UIGF version: {version}")
+        elif key == 'hk4e':
+            # UIGF v4，每个元素为一个 UID；数组和对象以迭代器产出，其他类型的值直接产出
+            if not isinstance(value, Iterator):
+                raise ValueError("UIGF hk4e must be an array")
+            for account in value:
+                if not isinstance(account, Iterator):
+                    raise ValueError("UIGF hk4e account must be an object")
+                uid = None
+                timezone_hours = DEFAULT_TIMEZONE
+                pending = None
+                for field, field_value in account:
+                    if field == 'uid':
+                        uid = str(field_value)
+                    elif field == 'timezone':
+                        timezone_hours = _timezone(field_value)
+                    elif field == 'list' and uid is not None:
+                        accounts.append(_read_account(uid, timezone_hours, field_value))
+                    elif field == 'list':
+                        # uid 在 list 之后时只能先缓存记录
+                        if not isinstance(field_value, Iterator):
+                            raise ValueError("UIGF list must be an array")
+                        pending = list(field_value)
+                if pending is not None:
+                    if uid is None:
+                        raise ValueError("UIGF account without uid")
+                    accounts.append(_read_account(uid, timezone_hours, iter(pending)))
+        elif key == 'list':
+            # UIGF v3，UID 和时区在 info 中，需要在 list 之前出现
+            uid = info.get('uid')
+            if not uid:
+                raise ValueError("UIGF v3 info with uid must precede list")
+            timezone_hours = _timezone(info.get('region_time_zone', DEFAULT_TIMEZONE))
+            accounts.append(_read_account(str(uid), timezone_hours, value))
+
+    return [
+        {"Uid": uid, "Message": upload_gacha_log_stream(user_id, uid, items)}
+        for uid, items in accounts
+    ]
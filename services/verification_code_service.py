@@ -1,70 +1,128 @@
 import datetime
+import threading
 from app.extensions import client, logger
+from app.config_loader import config_loader
+from app.schema import ensure_indexes
 
+"""
+验证码存储。
+每个邮箱只保留最新的一个验证码，重新获取验证码时替换旧的验证码；
+验证时在一次操作中完成比对和删除，同一个验证码猜错 MAX_ATTEMPTS 次后失效。
+后端由配置项 VERIFICATION_CODE.BACKEND 选择：
+- mongo：保存在 verification_codes 集合中（_id 为邮箱），过期记录由 TTL 索引清理
+- memory：保存在进程内存中，只适用于单进程运行的测试和基准测试
+"""
 
-def init_verification_code_collection():
-    """初始化验证码集合并创建 TTL 索引"""
-    db = client.ht_server
-    collection = db.verification_codes
-
-    indexes = collection.list_indexes()
-    ttl_index_exists = False
-    for index in indexes:
-        if index.get('expireAfterSeconds') is not None:
-            ttl_index_exists = True
-            break
-
-    # 如果不存在 TTL 索引，则创建
-    if not ttl_index_exists:
-        collection.create_index(
-            [("expire_at", 1)],
-            expireAfterSeconds=0,
-            name="expire_at_ttl"
+BACKEND_MONGO = "mongo"
+BACKEND_MEMORY = "memory"
+
+# memory 后端的记录数达到该值时清理过期记录
+MEMORY_SWEEP_SIZE = 1024
+
+
+class MongoVerificationCodeStore:
+    """MongoDB 验证码存储"""
+
+    def __init__(self, max_attempts: int):
+        self.max_attempts = max_attempts
+
+    def save(self, email: str, code: str, expire_at: datetime.datetime):
+        ensure_indexes(["verification_codes"])
+        client.ht_server.verification_codes.replace_one(
+            {"_id": email},
+            {"code": code, "attempts": 0, "created_at": datetime.datetime.utcnow(), "expire_at": expire_at},
+            upsert=True
         )
-        logger.info("Created TTL index on verification_codes collection")
 
+    def consume(self, email: str, code: str) -> bool:
+        collection = client.ht_server.verification_codes
+        # TTL 索引的清理有延迟，需要同时判断过期时间
+        consumed = collection.find_one_and_delete(
+            {"_id": email, "code": code, "attempts": {"$lt": self.max_attempts},
+             "expire_at": {"$gt": datetime.datetime.utcnow()}},
+            projection={"_id": 1}
+        )
+        if consumed is not None:
+            return True
+        collection.update_one({"_id": email}, {"$inc": {"attempts": 1}})
+        return False
 
-def save_verification_code(email: str, code: str, expire_minutes: int = 10):
-    """保存验证码到 MongoDB，自动过期时间由 TTL 索引控制"""
-    db = client.ht_server
-    collection = db.verification_codes
 
-    # 确保集合已初始化
-    init_verification_code_collection()
+class MemoryVerificationCodeStore:
+    """进程内验证码存储"""
 
-    # 计算过期时间
-    expire_at = datetime.datetime.utcnow() + datetime.timedelta(minutes=expire_minutes)
+    def __init__(self, max_attempts: int):
+        self.max_attempts = max_attempts
+        self._codes = {}
+        self._sweep_size = MEMORY_SWEEP_SIZE
+        self._lock = threading.Lock()
+
+    def save(self, email: str, code: str, expire_at: datetime.datetime):
+        with self._lock:
+            self._codes[email] = {"code": code, "attempts": 0, "expire_at": expire_at}
+            if len(self._codes) >= self._sweep_size:
+                # 记录数翻倍时清理一次过期记录，避免内存持续增长
+                now = datetime.datetime.utcnow()
+                for expired in [key for key, record in self._codes.items() if record['expire_at'] <= now]:
+                    del self._codes[expired]
+                self._sweep_size = max(MEMORY_SWEEP_SIZE, len(self._codes) * 2)
+
+    def consume(self, email: str, code: str) -> bool:
+        with self._lock:
+            record = self._codes.get(email)
+            if record is None:
+                return False
+            if record['expire_at'] <= datetime.datetime.utcnow() or record['attempts'] >= self.max_attempts:
+                del self._codes[email]
+                return False
+            if record['code'] != code:
+                record['attempts'] += 1
+                return False
+            del self._codes[email]
+            return True
 
-    # 插入验证码记录
-    result = collection.insert_one({
-        "email": email,
-        "code": code,
-        "created_at": datetime.datetime.utcnow(),
-        "expire_at": expire_at,
-        "used": False
-    })
 
+def _create_store():
+    backend = config_loader.VERIFICATION_CODE_BACKEND
+    max_attempts = config_loader.VERIFICATION_CODE_MAX_ATTEMPTS
+    if backend == BACKEND_MEMORY:
+        return MemoryVerificationCodeStore(max_attempts)
+    if backend != BACKEND_MONGO:
+        raise ValueError(f"Unknown verification code backend: {backend}")
+    return MongoVerificationCodeStore(max_attempts)
+
+
+_store = _create_store()
+
+
+def save_verification_code(email: str, code: str, expire_minutes: int = 10):
+    """保存验证码，同一邮箱之前的验证码失效"""
+    expire_at = datetime.datetime.utcnow() + datetime.timedelta(minutes=expire_minutes)
+    _store.save(email, code, expire_at)
     logger.debug(f"Saved verification code for email: {email}")
-    return result.inserted_id
 
 
 def verify_code(email: str, code: str) -> bool:
-    """验证验证码是否正确，验证成功后删除验证码记录"""
-    db = client.ht_server
-    collection = db.verification_codes
-
-    # 查找未使用的验证码
-    verification_record = collection.find_one({
-        "email": email,
-        "code": code,
-        "used": False
-    })
-
-    if verification_record:
-        # 验证成功，删除该验证码记录
-        collection.delete_one({"_id": verification_record["_id"]})
+    """验证验证码是否正确，验证成功后验证码失效"""
+    if _store.consume(email, code):
         logger.info(f"Verification code validated and deleted for email: {email}")
         return True
 
     logger.warning(f"Invalid or expired verification code for email: {email}")
-    return False
\ No newline at end of file
+    return False
+
+
+if __name__ == "__main__":
+    import time
+
+    store = MemoryVerificationCodeStore(max_attempts=3)
+    expire_at = datetime.datetime.utcnow() + datetime.timedelta(minutes=10)
+
+    count = 100_000
+    start = time.perf_counter()
+    for index in range(count):
+        email = f"user{index % 1000}@example.com"
+        store.save(email, "123456", expire_at)
+        store.consume(email, "123456")
+    elapsed = time.perf_counter() - start
+    print(f"memory backend: {count / elapsed:.0f} save+consume/s")
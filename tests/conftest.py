@@ -0,0 +1,18 @@
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config_loader import config_loader
+
+# 测试不读取 config.json，也不连接 MongoDB
+config_loader._config = {
+    "SECRET_KEY": "test-secret",
+    "ISTEST_MODE": True,
+    "LOGGING": {"LEVEL": "WARNING"},
+    "VERIFICATION_CODE": {"BACKEND": "memory"}
+}
+
+# 密码哈希进程池的工作进程由 forkserver 启动，在仓库根目录运行 pytest 时预先导入本模块，使工作进程使用同样的测试配置
+multiprocessing.set_forkserver_preload(["tests.conftest"])
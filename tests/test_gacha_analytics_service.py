@@ -0,0 +1,34 @@
+import logging
+from services.gacha_analytics_service import compute_gacha_analytics
+from services.gacha_statistics_service import five_star_avatar_ids, is_five_star
+
+
+def pulls(item_ids, gacha_type=301):
+    return [{"GachaType": gacha_type, "Id": 1700000000000000000 + index, "ItemId": item_id}
+            for index, item_id in enumerate(item_ids)]
+
+
+def test_recent_five_star_avatars_counted():
+    avatar_ids = five_star_avatar_ids()
+    # 闲云、阿蕾奇诺、玛薇卡、丝柯克
+    for item_id in (10000093, 10000096, 10000106, 10000114):
+        assert is_five_star(item_id, avatar_ids)
+    # 四星角色和四星、五星武器
+    assert not is_five_star(10000023, avatar_ids)
+    assert not is_five_star(11401, avatar_ids)
+    assert is_five_star(15502, avatar_ids)
+
+    items = pulls([10000023] * 9 + [10000106] + [10000023] * 3)
+    result = compute_gacha_analytics(items, avatar_ids)["301"]
+    assert result["FiveStarIntervals"] == [10]
+    assert result["CurrentPity"] == 3
+
+
+def test_avatar_newer_than_table_warned_once(caplog):
+    avatar_ids = five_star_avatar_ids()
+    unknown = max(avatar_ids) + 100
+    with caplog.at_level(logging.WARNING, logger="app"):
+        compute_gacha_analytics(pulls([unknown, unknown, 10000023]), avatar_ids)
+        assert not is_five_star(unknown, avatar_ids)
+    warnings = [record.message for record in caplog.records if record.levelno == logging.WARNING]
+    assert len(warnings) == 1 and str(unknown) in warnings[0]
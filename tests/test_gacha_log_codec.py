@@ -0,0 +1,30 @@
+from bson.int64 import Int64
+from services.gacha_log_codec import encode_block, encode_blocks, decode_block, decode_block_ids, _open_block, \
+    _sample_items
+
+
+def test_round_trip_keeps_values_types_and_key_order():
+    items = _sample_items(10000)
+    decoded = [item for blob in encode_blocks(items, 4096) for item in decode_block(blob)]
+    assert decoded == items
+    assert [type(v) for item in decoded for v in item.values()] == [type(v) for item in items for v in item.values()]
+    assert [list(item) for item in decoded] == [list(item) for item in items]
+
+
+def test_decode_block_ids():
+    items = _sample_items(100)
+    assert decode_block_ids(encode_block(items)) == [item["Id"] for item in items]
+
+
+def test_int64_fields_encode_like_int():
+    """从 MongoDB 读出的记录中整数字段为 Int64，编码结果应与 int 相同，解码为 int"""
+    items = _sample_items(4096)
+    int64_items = [
+        {key: Int64(value) if key in ("Id", "ItemId") else value for key, value in item.items()}
+        for item in items
+    ]
+    blob = encode_block(int64_items)
+    header, _ = _open_block(blob)
+    assert header["columns"]["Id"]["kind"] == "delta"
+    assert blob == encode_block(items)
+    assert decode_block(blob) == items
@@ -0,0 +1,49 @@
+import pytest
+from flask import Flask
+from routes import gacha_log
+
+
+@pytest.fixture
+def client(monkeypatch):
+    uploaded = []
+
+    def upload_stream(user_id, uid, items):
+        uploaded.append((uid, list(items)))
+        return "success"
+
+    monkeypatch.setattr(gacha_log, "verify_token", lambda token: "user" if token else None)
+    monkeypatch.setattr(gacha_log, "upload_gacha_log_stream", upload_stream)
+    monkeypatch.setattr(gacha_log, "upload_gacha_log", lambda user_id, uid, items: upload_stream(user_id, uid, items))
+    app = Flask(__name__)
+    app.register_blueprint(gacha_log.gacha_log_bp)
+    test_client = app.test_client()
+    test_client.uploaded = uploaded
+    return test_client
+
+
+def post_batch(client, body):
+    return client.post("/GachaLog/Upload/Batch", json=body, headers={"Authorization": "Bearer token"})
+
+
+def test_upload_batch(client):
+    item = {"GachaType": 301, "QueryType": 301, "ItemId": 10000023, "Time": "2024-01-01T12:00:00+08:00",
+            "Id": 1700000000000000000}
+    response = post_batch(client, {"Logs": [{"Uid": "1", "Items": [item]}, {"Items": [item], "Uid": "2"}]})
+    assert response.status_code == 200
+    assert [result["Uid"] for result in response.json["data"]] == ["1", "2"]
+    assert [uid for uid, _ in client.uploaded] == ["1", "2"]
+
+
+@pytest.mark.parametrize("body", [
+    {"Logs": [1]},
+    {"Logs": ["x"]},
+    {"Logs": [[{"Uid": "1"}]]},
+    {"Logs": {"Uid": "1"}},
+    {"Logs": 1},
+    {"Logs": [{"Uid": "1", "Items": 5}]},
+    {"Logs": [{"Items": {"Id": 1}, "Uid": "1"}]},
+])
+def test_upload_batch_rejects_malformed_logs(client, body):
+    response = post_batch(client, body)
+    assert response.status_code == 400
+    assert response.json["retcode"] == 1
@@ -0,0 +1,25 @@
+import json
+import pytest
+from services.gacha_log_schema import UploadRequest, decode_request, to_documents
+
+
+def test_decode_matches_json_with_int_conversion():
+    payload = json.dumps({
+        "Uid": "100000001",
+        "Items": [
+            {"GachaType": 301 if i % 3 else 400, "QueryType": 301, "ItemId": 10000002 + i % 50,
+             "Time": "2024-01-01T12:00:00+08:00", "Id": str(1700000000000000000 + i) if i % 10 == 0
+                else 1700000000000000000 + i}
+            for i in range(1000)
+        ]
+    }).encode()
+    expected = json.loads(payload)["Items"]
+    for item in expected:
+        for key in ("GachaType", "QueryType", "ItemId", "Id"):
+            item[key] = int(item[key])
+    assert to_documents(decode_request(payload, UploadRequest).Items) == expected
+
+
+def test_invalid_item_rejected():
+    with pytest.raises(ValueError):
+        decode_request(b'{"Items": [{"GachaType": "x"}]}', UploadRequest)
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+import pytest
+from app.config_loader import config_loader
+from services import gacha_log_service
+
+
+class RecordingCollection:
+    def __init__(self, calls, name, count=0):
+        self.calls = calls
+        self.name = name
+        self.count = count
+
+    def estimated_document_count(self):
+        self.calls.append((self.name, "estimated_document_count"))
+        return self.count
+
+    def find_one(self, *args, **kwargs):
+        self.calls.append((self.name, "find_one"))
+        return None
+
+    def update_many(self, *args, **kwargs):
+        self.calls.append((self.name, "update_many"))
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+    db = SimpleNamespace(GachaLogArchive=RecordingCollection(calls, "GachaLogArchive"),
+                         GachaLogSummary=RecordingCollection(calls, "GachaLogSummary"))
+    monkeypatch.setattr(gacha_log_service, "client", SimpleNamespace(ht_server=db))
+    monkeypatch.setattr(gacha_log_service, "_archive_presence", (None, True))
+    monkeypatch.setitem(config_loader._config, "GACHA_LOG", {"ARCHIVE_ENABLED": False})
+    return calls
+
+
+def test_archive_disabled_skips_restore_and_access_stamp(calls):
+    for _ in range(3):
+        gacha_log_service._restore_archived("user", "100000001")
+        gacha_log_service._record_access("user", ["100000001"])
+    # 只在第一次检查归档集合是否为空
+    assert calls == [("GachaLogArchive", "estimated_document_count")]
+
+
+def test_archive_disabled_restores_leftover_archives(calls):
+    gacha_log_service.client.ht_server.GachaLogArchive.count = 1
+    gacha_log_service._restore_archived("user", "100000001")
+    assert calls[-1] == ("GachaLogArchive", "find_one")
+
+
+def test_archive_enabled_checks_archive_and_stamps_access(calls):
+    config_loader._config["GACHA_LOG"]["ARCHIVE_ENABLED"] = True
+    gacha_log_service._restore_archived("user", "100000001")
+    gacha_log_service._record_access("user", ["100000001"])
+    assert calls == [("GachaLogArchive", "find_one"), ("GachaLogSummary", "update_many")]
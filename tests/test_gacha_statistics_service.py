@@ -0,0 +1,17 @@
+from services.gacha_statistics_service import compute_pity_distribution, five_star_avatar_ids, avatar_table_version
+
+
+def test_pity_distribution_counts_recent_five_star_avatars():
+    # 400 与 301 同属角色活动祈愿，按 Id 排序；克洛琳德、希诺宁为新版本的五星角色
+    items = [{"GachaType": 400 if index % 2 else 301, "Id": str(1700000000000000000 + index), "ItemId": item_id}
+             for index, item_id in enumerate([10000023] * 4 + [10000098] + [10000023] * 9 + [10000103, 10000023])]
+    items.append({"GachaType": 302, "Id": "1700000000000000100", "ItemId": 15502})
+    result = compute_pity_distribution(reversed(items), five_star_avatar_ids())
+    assert result["AvatarEvent"] == {"Pulls": 15, "Pity": {"5": 1, "10": 1}}
+    assert result["WeaponEvent"] == {"Pulls": 1, "Pity": {"1": 1}}
+
+
+def test_avatar_table_version_changes_with_table():
+    avatar_ids = five_star_avatar_ids()
+    assert avatar_table_version(avatar_ids) == avatar_table_version(frozenset(sorted(avatar_ids)))
+    assert avatar_table_version(avatar_ids) != avatar_table_version(avatar_ids | {10000999})
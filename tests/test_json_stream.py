@@ -0,0 +1,75 @@
+import gzip
+import io
+import json
+import pytest
+from app.utils.json_stream import iter_request_chunks, iter_json_object, READ_CHUNK_SIZE, MAX_VALUE_SIZE
+
+ITEMS = [
+    {"Uid": "100000001", "GachaType": 301, "ItemId": 10000002 + i % 7, "Time": "2024-01-01T12:00:00+08:00",
+     "Id": 1700000000000000000 + i, "Name": "测试中文"}
+    for i in range(2000)
+]
+
+
+def parse(payload, encoding, chunk_size):
+    parsed = {}
+    chunks = iter_request_chunks(io.BytesIO(payload), encoding, chunk_size)
+    for key, value in iter_json_object(chunks, stream_keys=("Items",)):
+        parsed[key] = list(value) if key == "Items" else value
+    return parsed
+
+
+def test_plain_and_gzip_bodies():
+    expected = {"Uid": "100000001", "Items": ITEMS, "Tail": [1, 2.5e3, None]}
+    body = json.dumps(expected).encode()
+    assert parse(body, None, READ_CHUNK_SIZE) == expected
+    assert parse(gzip.compress(body), "gzip", READ_CHUNK_SIZE) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64])
+def test_chunk_boundaries_split_numbers_strings_and_multibyte_characters(chunk_size):
+    small = {"Uid": "100000001", "Items": ITEMS[:300], "Tail": [1, 2.5e3, None]}
+    assert parse(json.dumps(small, ensure_ascii=False).encode(), None, chunk_size) == small
+
+
+def test_empty_object():
+    assert parse(b' { } ', None, 1) == {}
+
+
+def test_nested_stream_keys():
+    nested = json.dumps({"info": {"version": "v4.0"}, "hk4e": [
+        {"uid": "1", "list": [{"id": "1"}, {"id": "2"}], "timezone": 8}, {"uid": "2", "list": []}
+    ]}).encode()
+    accounts = []
+    for key, value in iter_json_object(iter_request_chunks(io.BytesIO(nested), None, 5), {"hk4e": {"list": None}}):
+        if key == "hk4e":
+            for account in value:
+                accounts.append({field: list(v) if field == "list" else v for field, v in account})
+    assert accounts == [{"uid": "1", "list": [{"id": "1"}, {"id": "2"}], "timezone": 8}, {"uid": "2", "list": []}]
+
+
+@pytest.mark.parametrize("invalid", [b'{"Items": [1, 2', b'[1]', b'{"Uid": 1} x', b'{"Items": [1,]}'])
+def test_invalid_json(invalid):
+    with pytest.raises(ValueError):
+        parse(invalid, None, 3)
+
+
+@pytest.mark.parametrize("oversized", [
+    b'{"Uid": "' + b'a' * (4 * MAX_VALUE_SIZE),
+    b'{"Items": [1, 2] ' + b'x' * (4 * MAX_VALUE_SIZE),
+    b'{"Extra": [' + b'1, ' * (2 * MAX_VALUE_SIZE) + b'1]}'
+])
+def test_oversized_value_fails_before_reading_whole_body(oversized):
+    """格式错误或不在流式字段中的超大值在缓冲区达到上限后报错，而不是读完整个请求体"""
+    chunks_read = 0
+
+    def counted():
+        nonlocal chunks_read
+        for chunk in iter_request_chunks(io.BytesIO(oversized), None):
+            chunks_read += 1
+            yield chunk
+
+    with pytest.raises(ValueError):
+        for _ in iter_json_object(counted(), stream_keys=("Items",)):
+            pass
+    assert chunks_read * READ_CHUNK_SIZE <= 2 * MAX_VALUE_SIZE
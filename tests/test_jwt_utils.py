@@ -0,0 +1,28 @@
+import pytest
+from flask import Flask
+from app.utils.jwt_utils import create_token, verify_token, revoke_token
+
+
+@pytest.fixture
+def app_context():
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "test-secret"
+    with app.app_context():
+        yield
+
+
+def test_verify_token(app_context):
+    token = create_token("user-1")
+    assert verify_token(token) == "user-1"
+    # 第二次命中缓存
+    assert verify_token(token) == "user-1"
+    assert verify_token(token + "x") is None
+    assert verify_token("") is None
+
+
+def test_revoked_token_rejected_even_when_cached(app_context):
+    token = create_token("user-2")
+    assert verify_token(token) == "user-2"
+    assert revoke_token(token)
+    assert verify_token(token) is None
+    assert not revoke_token("invalid")
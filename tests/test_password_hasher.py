@@ -0,0 +1,54 @@
+import threading
+import pytest
+from werkzeug.security import generate_password_hash
+from app.utils.password_hasher import PasswordHasher, PasswordHasherBusy
+
+METHOD = "pbkdf2:sha256:1000"
+
+
+def test_hash_and_verify_in_process_pool():
+    hasher = PasswordHasher(workers=1, max_pending=1, method=METHOD)
+    pwhash = hasher.hash("secret")
+    assert hasher.verify(pwhash, "secret")
+    assert not hasher.verify(pwhash, "wrong")
+
+
+def test_needs_rehash():
+    pwhash = generate_password_hash("password")
+    hasher = PasswordHasher(workers=0, method=METHOD)
+    assert hasher.needs_rehash(pwhash)
+    assert not hasher.needs_rehash(hasher.hash("secret"))
+    assert hasher.needs_rehash("invalid")
+    assert not PasswordHasher(workers=0).needs_rehash(pwhash)
+
+
+def test_busy_when_pending_limit_reached():
+    hasher = PasswordHasher(workers=0, max_pending=1, method=METHOD)
+    hasher._slots.acquire()
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash("secret")
+    hasher._slots.release()
+    assert hasher.verify(hasher.hash("secret"), "secret")
+
+
+def test_reserved_slot_used_by_same_thread():
+    hasher = PasswordHasher(workers=0, max_pending=1, method=METHOD)
+    with hasher.reserve():
+        # 名额已被占用，其他调用方失败，占用名额的线程仍可计算哈希
+        with pytest.raises(PasswordHasherBusy):
+            with hasher.reserve():
+                pass
+        rejected = []
+
+        def other_thread():
+            try:
+                hasher.hash("other")
+            except PasswordHasherBusy:
+                rejected.append(True)
+
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        thread.join()
+        assert rejected
+        assert hasher.verify(hasher.hash("secret"), "secret")
+    assert hasher.verify(hasher.hash("secret"), "secret")
@@ -0,0 +1,29 @@
+from app.utils.rate_limit import TokenBucketLimiter, RateLimiter, merge_rules
+
+
+def test_bucket_refills_over_time(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.utils.rate_limit.time.monotonic", lambda: now[0])
+    limiter = TokenBucketLimiter()
+    # 容量 3，每分钟补充 60 个（每秒 1 个）
+    assert [limiter.acquire("ip:1", 3, 60) for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("ip:1", 3, 60) > 0
+    assert limiter.acquire("ip:2", 3, 60) == 0
+    now[0] += 1.05
+    assert limiter.acquire("ip:1", 3, 60) == 0
+
+
+def test_least_recently_used_bucket_evicted():
+    limiter = TokenBucketLimiter(max_buckets=2)
+    for key in ("a", "b", "c"):
+        limiter.acquire(key, 1, 1)
+    assert limiter.acquire("a", 1, 1) == 0
+
+
+def test_rate_limiter_rules():
+    limiter = RateLimiter(merge_rules({"login": {"EMAIL": None}}))
+    assert limiter.check("login", "EMAIL", "user@example.com") == 0
+    assert limiter.check("unknown", "IP", "1.2.3.4") == 0
+    for _ in range(20):
+        assert limiter.check("login", "IP", "1.2.3.4") == 0
+    assert limiter.check("login", "IP", "1.2.3.4") > 0
@@ -0,0 +1,36 @@
+import base64
+import os
+import time
+import pytest
+from Crypto.Cipher import PKCS1_OAEP
+from Crypto.PublicKey import RSA
+from app.utils.rsa_engine import RSADecryptor
+
+
+def write_key(path, key):
+    with open(path, 'wb') as f:
+        f.write(key.export_key())
+
+
+def encrypt(key, text):
+    return base64.b64encode(PKCS1_OAEP.new(key.publickey()).encrypt(text.encode())).decode()
+
+
+def test_key_rotation_and_reload(tmp_path):
+    old_key, new_key, next_key = (RSA.generate(2048) for _ in range(3))
+    old_file = str(tmp_path / "private.pem")
+    new_file = str(tmp_path / "private.new.pem")
+    write_key(old_file, old_key)
+    write_key(new_file, new_key)
+
+    decryptor = RSADecryptor([new_file, old_file], reload_check_seconds=0)
+    # 轮换期间新旧公钥加密的数据都可以解密
+    assert decryptor.decrypt(encrypt(old_key, "old")) == "old"
+    assert decryptor.decrypt(encrypt(new_key, "new")) == "new"
+
+    # 私钥文件变化后自动重新加载
+    write_key(new_file, next_key)
+    os.utime(new_file, ns=(time.time_ns(), time.time_ns() + 1_000_000_000))
+    assert decryptor.decrypt(encrypt(next_key, "next")) == "next"
+    with pytest.raises(ValueError):
+        decryptor.decrypt(encrypt(new_key, "removed"))
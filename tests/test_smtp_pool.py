@@ -0,0 +1,99 @@
+import smtplib
+import socketserver
+import threading
+import time
+from email.mime.text import MIMEText
+import pytest
+from app.utils.smtp_pool import SMTPConnectionPool, CircuitBreaker
+
+MESSAGE = MIMEText("您的验证码是: 123456").as_string()
+
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    """本地 SMTP 替身，拒绝 rejected@ 开头的收件人"""
+
+    def reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self.reply("220 localhost stand-in ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 localhost")
+            elif command.startswith("RCPT") and "REJECTED@" in command:
+                self.reply("550 No such user")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while (data := self.rfile.readline()) not in (b".\r\n", b""):
+                    lines.append(data)
+                self.server.received.append(b"".join(lines))
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInSMTPHandler)
+        self.received = []
+
+
+@pytest.fixture
+def server():
+    server = StandInSMTPServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_connection_reused(server):
+    pool = SMTPConnectionPool(*server.server_address, starttls=False)
+    for _ in range(5):
+        pool.send("noreply@example.com", ["user@example.com"], MESSAGE)
+    assert pool.connections_opened == 1
+    assert len(server.received) == 5
+    pool.close()
+
+
+def test_rejected_recipient_not_resent_and_connection_kept(server):
+    """收件人被拒绝时不重发，连接放回连接池继续使用"""
+    pool = SMTPConnectionPool(*server.server_address, starttls=False)
+    pool.send("noreply@example.com", ["user@example.com"], MESSAGE)
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        pool.send("noreply@example.com", ["rejected@example.com"], MESSAGE)
+    pool.send("noreply@example.com", ["user@example.com"], MESSAGE)
+    assert pool.connections_opened == 1
+    assert len(server.received) == 2
+    pool.close()
+
+
+def test_circuit_breaker_opens_when_server_unavailable(server):
+    """邮件服务器不可用时熔断，到期后放行一次试探"""
+    host, port = server.server_address
+    server.shutdown()
+    server.server_close()
+    pool = SMTPConnectionPool(host, port, starttls=False)
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.1)
+    for _ in range(2):
+        with pytest.raises(OSError):
+            pool.send("noreply@example.com", ["user@example.com"], MESSAGE)
+        breaker.record_failure()
+    assert breaker.wait_seconds() > 0
+    time.sleep(0.1)
+    assert breaker.wait_seconds() == 0 and breaker.wait_seconds() > 0
+    breaker.record_success()
+    assert breaker.wait_seconds() == 0
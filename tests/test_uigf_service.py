@@ -0,0 +1,68 @@
+import json
+import pytest
+from services import uigf_service
+from services.uigf_service import import_uigf, to_uigf_item, from_uigf_item
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    uploaded = []
+
+    def upload(user_id, uid, items):
+        uploaded.append((uid, list(items)))
+        return "success"
+
+    monkeypatch.setattr(uigf_service, "upload_gacha_log_stream", upload)
+    return uploaded
+
+
+def uigf_item(index, item_id="10000023"):
+    return {"uigf_gacha_type": "301", "gacha_type": "400", "item_id": item_id, "count": "1",
+            "time": "2024-01-01 12:00:00", "id": str(1700000000000000000 + index)}
+
+
+def body(data):
+    return iter([json.dumps(data).encode()])
+
+
+def test_import_v4(uploads):
+    data = {"info": {"version": "v4.0"}, "hk4e": [
+        {"uid": "100000001", "timezone": 8, "list": [uigf_item(0), uigf_item(1)]},
+        {"list": [uigf_item(2)], "uid": "100000002"}
+    ]}
+    assert import_uigf("user", body(data)) == [{"Uid": "100000001", "Message": "success"},
+                                               {"Uid": "100000002", "Message": "success"}]
+    uid, items = uploads[0]
+    assert uid == "100000001" and [item.Id for item in items] == [1700000000000000000, 1700000000000000001]
+    assert items[0].GachaType == 400 and items[0].QueryType == 301 and items[0].Time == "2024-01-01T12:00:00+08:00"
+
+
+def test_import_v3(uploads):
+    data = {"info": {"uid": "100000001", "uigf_version": "v3.0", "region_time_zone": 8}, "list": [uigf_item(0)]}
+    assert import_uigf("user", body(data)) == [{"Uid": "100000001", "Message": "success"}]
+
+
+@pytest.mark.parametrize("data", [
+    # 只有 name/item_type 的记录
+    {"info": {"uid": "100000001", "uigf_version": "v3.0"}, "list": [uigf_item(0), uigf_item(1, item_id="")]},
+    {"hk4e": [{"uid": "100000001", "list": [uigf_item(0)]}, 1]},
+    {"hk4e": [{"uid": "100000001", "list": [uigf_item(0), "x"]}]},
+    {"hk4e": [{"uid": "100000001", "list": 5}]},
+    {"hk4e": [{"list": 5, "uid": "100000001"}]},
+    {"hk4e": [{"uid": "100000001", "timezone": None, "list": []}]},
+    {"hk4e": {"uid": "100000001"}},
+    {"hk4e": [{"uid": "100000001", "list": [{**uigf_item(0), "id": "x"}]}]},
+])
+def test_invalid_import_writes_nothing(uploads, data):
+    with pytest.raises(ValueError):
+        import_uigf("user", body(data))
+    assert uploads == []
+
+
+def test_export_item_round_trip():
+    item = {"GachaType": 400, "QueryType": 301, "ItemId": 10000023, "Time": "2024-01-01T12:00:00+08:00",
+            "Id": 1700000000000000000}
+    uigf = to_uigf_item(item, 8, "+08:00")
+    assert uigf["time"] == "2024-01-01 12:00:00"
+    assert from_uigf_item(uigf, "+08:00") == {key: str(value) if key != "Time" else value
+                                              for key, value in item.items()}
@@ -0,0 +1,30 @@
+import datetime
+from services.verification_code_service import MemoryVerificationCodeStore
+
+
+def expire_in(minutes):
+    return datetime.datetime.utcnow() + datetime.timedelta(minutes=minutes)
+
+
+def test_new_code_replaces_old_code():
+    store = MemoryVerificationCodeStore(max_attempts=3)
+    store.save("user@example.com", "111111", expire_in(10))
+    store.save("user@example.com", "222222", expire_in(10))
+    assert not store.consume("user@example.com", "111111")
+    assert store.consume("user@example.com", "222222")
+    # 验证码只能使用一次
+    assert not store.consume("user@example.com", "222222")
+
+
+def test_code_invalid_after_max_attempts():
+    store = MemoryVerificationCodeStore(max_attempts=3)
+    store.save("user@example.com", "333333", expire_in(10))
+    for guess in ("000000", "000001", "000002"):
+        assert not store.consume("user@example.com", guess)
+    assert not store.consume("user@example.com", "333333")
+
+
+def test_expired_code_invalid():
+    store = MemoryVerificationCodeStore(max_attempts=3)
+    store.save("user@example.com", "444444", expire_in(-1))
+    assert not store.consume("user@example.com", "444444")
@@ -0,0 +1,17 @@
+from app.init import create_app
+import sentry_sdk
+
+"""
+WSGI 应用，run.py 和 app.py 从这里导入，Gunicorn 可以加载 run:app 或 wsgi:app
+"""
+
+sentry_sdk.init(
+    dsn="https://d1cad1d2b442cf8431df3ee4bab925e0@o4507525750521856.ingest.us.sentry.io/4510623668830208",
+    # Add data like request headers and IP for users,
+    # see https://docs.sentry.io/platforms/python/data-management/data-collected/ for more info
+    send_default_pii=True,
+    traces_sample_rate=1.0,
+)
+
+# 创建应用实例
+app = create_app()